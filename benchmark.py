@@ -0,0 +1,269 @@
+# benchmark.py
+"""
+Сквозной бенчмарк конвейера сброса/прошивки на виртуальных коммутаторах (simulator.py).
+Прогоняет полный DLinkReset.run() для матрицы сценариев (модель, позиция рабочих
+учетных данных, число команд сброса, число одновременных портов) и записывает
+в JSON время по состояниям, долю пауз (sleep) и ожидания ввода-вывода, units/hour.
+
+Пример:
+    python benchmark.py --models DES-3200-28,DES-1228 --credential-positions 1,3 --ports 1,4
+    python benchmark.py --time-scale 0.05 --label v0.02 --output bench_v0.02.json
+
+Абсолютные значения зависят от --time-scale (длительность загрузки и TFTP в симуляторе),
+поэтому сравнивать между собой имеет смысл только прогоны с одинаковыми параметрами.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import product
+from pathlib import Path
+
+# Добавляем текущую директорию в путь поиска модулей
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dlink_reset import DLinkReset
+from handlers.connection import SerialConnection
+from simulator import VirtualSwitch
+from utils import stats_manager
+from utils.ordering import POLICIES
+
+
+class StateTimer:
+    """Накапливает время по состояниям: всего, в паузах и в ожидании данных порта."""
+    def __init__(self):
+        self.state = "START"
+        self.states = {}
+
+    def _entry(self, state):
+        return self.states.setdefault(state, {"visits": 0, "seconds": 0.0, "sleep_seconds": 0.0, "io_wait_seconds": 0.0})
+
+    def visit(self, state, seconds):
+        entry = self._entry(state)
+        entry["visits"] += 1
+        entry["seconds"] += seconds
+
+    def add(self, key, seconds):
+        self._entry(self.state)[key] += seconds
+
+
+class TimedSerialConnection(SerialConnection):
+    """SerialConnection, отмечающий время пауз и блокирующего чтения порта."""
+    def __init__(self, port, baudrate, logger, timer):
+        super().__init__(port, baudrate, logger)
+        self.timer = timer
+
+    def sleep(self, seconds):
+        started = time.monotonic()
+        super().sleep(seconds)
+        self.timer.add("sleep_seconds", time.monotonic() - started)
+
+    def _read_chunk(self, timeout):
+        started = time.monotonic()
+        data = super()._read_chunk(timeout)
+        self.timer.add("io_wait_seconds", time.monotonic() - started)
+        return data
+
+
+class BenchDLinkReset(DLinkReset):
+    """DLinkReset с замером времени каждого посещения состояния."""
+    def __init__(self, *args, **kwargs):
+        self.timer = StateTimer()
+        super().__init__(*args, **kwargs)
+
+    def _create_connection(self):
+        return TimedSerialConnection(self.port, self.device_cfg['baudrate'], self.logger, self.timer)
+
+    def _state_action(self, state):
+        action = super()._state_action(state)
+        if not action:
+            return None
+
+        def timed():
+            self.timer.state = state
+            started = time.monotonic()
+            try:
+                return action()
+            finally:
+                self.timer.visit(state, time.monotonic() - started)
+        return timed
+
+
+class Benchmark:
+    """Формирует матрицу сценариев и прогоняет каждый на виртуальных коммутаторах."""
+    def __init__(self, models, credential_positions, reset_counts, port_counts, vendor="D-Link",
+                 time_scale=0.05, baud_delay=False, verbose=False, ordering="count"):
+        self.models = models
+        self.credential_positions = credential_positions
+        self.reset_counts = reset_counts
+        self.port_counts = port_counts
+        self.vendor = vendor
+        self.time_scale = time_scale
+        self.baud_delay = baud_delay
+        self.verbose = verbose
+        self.ordering = ordering
+
+    def scenarios(self):
+        for model, position, reset_count, ports in product(self.models, self.credential_positions,
+                                                           self.reset_counts, self.port_counts):
+            yield {"model": model, "credential_position": position, "reset_commands": reset_count, "ports": ports}
+
+    def run(self):
+        results = []
+        for scenario in self.scenarios():
+            print(f"--- Сценарий: {scenario} ---")
+            result = self.run_scenario(scenario)
+            print(f"    {result['wall_seconds']} с, успешно {result['success']} из {scenario['ports']}, "
+                  f"units/hour: {result['units_per_hour']}")
+            results.append(result)
+        return results
+
+    def run_scenario(self, scenario):
+        # Отдельная статистика на сценарий: порядок перебора не зависит от предыдущих прогонов
+        with tempfile.TemporaryDirectory(prefix="dlink_bench_") as stats_dir:
+            stats = stats_manager.StatsManager(stats_dir, policy=self.ordering)
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=scenario["ports"], thread_name_prefix="bench") as executor:
+                units = list(executor.map(lambda i: self._run_unit(scenario, stats, i), range(scenario["ports"])))
+            wall = time.monotonic() - started
+
+        succeeded = sum(1 for unit in units if unit["overall_status"] == "Success")
+        return dict(scenario,
+                    wall_seconds=round(wall, 2),
+                    success=succeeded,
+                    units_per_hour=round(scenario["ports"] * 3600 / wall, 2) if wall > 0 else None,
+                    states=self._merge_states(units),
+                    units=units)
+
+    def _run_unit(self, scenario, stats, index):
+        """Один коммутатор: симулятор + полный прогон DLinkReset."""
+        model = scenario["model"]
+        switch = VirtualSwitch(model, vendor=self.vendor, time_scale=self.time_scale, baud_delay=self.baud_delay)
+        switch.recovery_login = switch_credentials(switch, "recovery", scenario["credential_position"])
+        switch.cli_login = switch_credentials(switch, "cli", scenario["credential_position"])
+        port = switch.start()
+        try:
+            worker = BenchDLinkReset(port=port, model=model, vendor=self.vendor, stats=stats,
+                                     log_tag=f"bench{index}_{model}")
+            if not self.verbose:
+                quiet(worker.logger)
+            limit_reset_commands(worker, scenario["reset_commands"])
+            started = time.monotonic()
+            worker.run()
+            elapsed = time.monotonic() - started
+        finally:
+            switch.stop()
+
+        timed = sum(s["seconds"] for s in worker.timer.states.values())
+        return {
+            "overall_status": worker.report_data["overall_status"],
+            "reset_method": worker.report_data["reset_method"],
+            "seconds": round(elapsed, 2),
+            "sleep_seconds": round(sum(s["sleep_seconds"] for s in worker.timer.states.values()), 2),
+            "io_wait_seconds": round(sum(s["io_wait_seconds"] for s in worker.timer.states.values()), 2),
+            "untimed_seconds": round(elapsed - timed, 2),
+            "reboots": switch.stats["reboots"],
+            "states": worker.timer.states,
+        }
+
+    @staticmethod
+    def _merge_states(units):
+        """Суммирует время по состояниям всех портов сценария."""
+        merged = {}
+        for unit in units:
+            for state, data in unit["states"].items():
+                entry = merged.setdefault(state, {"visits": 0, "seconds": 0.0, "sleep_seconds": 0.0, "io_wait_seconds": 0.0})
+                for key, value in data.items():
+                    entry[key] += value
+        return {state: {k: round(v, 2) for k, v in data.items()} for state, data in merged.items()}
+
+
+def switch_credentials(switch, kind, position):
+    """
+    Учетные данные, которые примет виртуальный коммутатор: position-я пара из credentials.json
+    (1 - первая). Пустая пара логин/пароль означает вход без запроса.
+    """
+    credentials = switch.credentials.get(kind, [])
+    if not credentials:
+        return None
+    cred = credentials[min(position, len(credentials)) - 1]
+    if not cred["login"] and not cred["password"]:
+        return None
+    return (cred["login"], cred["password"])
+
+
+def limit_reset_commands(worker, count):
+    """Оставляет в профиле первые count команд сброса (None - все)."""
+    if not count:
+        return
+    for key in (worker.device_cfg.get("recovery_commands", "recovery"), worker.device_cfg.get("cli_commands", "cli")):
+        if key in worker.reset_commands:
+            worker.reset_commands[key] = worker.reset_commands[key][:count]
+
+
+def quiet(log):
+    """Убирает вывод логгера экземпляра в консоль (файл лога остается)."""
+    for handler in list(log.handlers):
+        if type(handler) is logging.StreamHandler:
+            log.removeHandler(handler)
+
+
+def parse_list(text, cast=str):
+    return [cast(item.strip()) for item in text.split(",") if item.strip()]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера сброса/прошивки на виртуальных коммутаторах.")
+    parser.add_argument("--models", default="DES-3200-28", help="Модели через запятую")
+    parser.add_argument("--vendor", default="D-Link", help="Производитель (по умолчанию D-Link)")
+    parser.add_argument("--credential-positions", default="1", help="Позиции рабочих учетных данных через запятую (1 - первая)")
+    parser.add_argument("--reset-counts", default="0", help="Число команд сброса в профиле через запятую (0 - все)")
+    parser.add_argument("--ports", default="1", help="Число одновременных портов через запятую")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="Масштаб медленных операций симулятора")
+    parser.add_argument("--baud-delay", action="store_true", help="Вывод симулятора со скоростью порта")
+    parser.add_argument("--label", help="Метка прогона (версия, ветка) для сравнения результатов")
+    parser.add_argument("--output", help="Файл результатов JSON (по умолчанию reports/benchmark_<время>.json)")
+    parser.add_argument("--verbose", action="store_true", help="Выводить логи прогонов в консоль")
+    parser.add_argument("--ordering", choices=sorted(POLICIES), default="count",
+                        help="Политика порядка перебора (по умолчанию count: воспроизводимый порядок профиля)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    benchmark = Benchmark(
+        models=parse_list(args.models),
+        credential_positions=parse_list(args.credential_positions, int),
+        reset_counts=parse_list(args.reset_counts, int),
+        port_counts=parse_list(args.ports, int),
+        vendor=args.vendor,
+        time_scale=args.time_scale,
+        baud_delay=args.baud_delay,
+        verbose=args.verbose,
+        ordering=args.ordering,
+    )
+    started_at = datetime.now()
+    results = benchmark.run()
+
+    output = Path(args.output) if args.output else \
+        Path(__file__).resolve().parent / "reports" / f"benchmark_{started_at.strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "label": args.label,
+        "started": started_at.isoformat(timespec="seconds"),
+        "time_scale": args.time_scale,
+        "baud_delay": args.baud_delay,
+        "ordering": args.ordering,
+        "scenarios": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=4, ensure_ascii=False)
+    print(f"--- Результаты сохранены в {output} ---")
+
+if __name__ == "__main__":
+    main()
@@ -3,29 +3,85 @@
 Основной класс оркестровки процесса сброса и прошивки.
 Реализует логику переходов между состояниями согласно Плану V7.2.
 """
-import time
+import asyncio
 import os
 import sys
 import queue
+import uuid
+from datetime import datetime
 from pathlib import Path
 
 # Импорты обработчиков и утилит
 from handlers.connection import SerialConnection
-from handlers import recovery_handler, cli_handler, boot_menu_handler, firmware_handler
-from utils import logger, config_loader, stats_manager
+from handlers.async_connection import AsyncSerialConnection
+from handlers.replay_connection import ReplaySerialConnection
+from handlers import recovery_handler, cli_handler, boot_menu_handler, firmware_handler, interaction, flow
+from utils import logger, config_bundle, config_loader, stats_manager
+from utils.checkpoint_journal import CheckpointJournal, same_mac
+from utils.firmware_store import FirmwareStore
+from utils.metrics import RunMetrics
+from utils.ordering import DEFAULT_POLICY
+from utils.session_recorder import SessionRecorder
 
 
 class DLinkReset:
     """
     Основной класс для управления процессом сброса и прошивки.
     """
-    def __init__(self, port, model, vendor="D-Link", force_reflash=False, debug=False, log_queue=None):
+    # Действие каждого состояния: (атрибут обработчика, метод-сценарий handlers/flow.py).
+    # Один цикл _run() выполняется синхронно (run) и асинхронно (AsyncDLinkReset).
+    STATE_ACTIONS = {
+        "RESUME_PROBE": ("cli_handler", "probe_cli"),
+        "RECOVERY_ENTRY": ("recovery_handler", "attempt_recovery_entry"),
+        "RECOVERY_AUTH": ("recovery_handler", "authorize_in_recovery"),
+        "RECOVERY_RESET": ("recovery_handler", "execute_recovery_reset"),
+        "CLI_ENTRY": ("cli_handler", "attempt_cli_entry"),
+        "CLI_RESET": ("cli_handler", "execute_cli_reset"),
+        "BOOT_MENU_ENTRY": ("boot_menu_handler", "attempt_boot_menu_entry"),
+        "CLI_CHECKS": ("cli_handler", "perform_cli_checks"),
+        "PROM_UPDATE": ("firmware_handler", "update_prom"),
+        "FIRMWARE_UPDATE": ("firmware_handler", "update_firmware"),
+        "FINAL_CHECKS": ("cli_handler", "perform_final_checks"),
+    }
+    MAX_ITERATIONS = 30 # Предотвращает бесконечные циклы
+
+    def __init__(self, port, model=None, vendor="D-Link", force_reflash=False, debug=False, log_queue=None,
+                 stats=None, log_tag=None, record_session=None, replay_session=None, replay_speed=0,
+                 metrics_dir=None, firmware_store=None, autobaud=False, console_baudrate=None,
+                 ordering=None, resume=True):
+        """
+        model - модель устройства; None - определяется по выводу консоли (identify_model),
+        до этого используется базовый профиль производителя.
+        stats - общий StatsManager (пакетный режим); если не задан, создается свой.
+        log_tag - метка для отдельного логгера экземпляра (пакетный режим).
+        record_session - путь к файлу записи сессии порта (True - файл в папке logs).
+        replay_session - файл записанной сессии: вместо порта воспроизводится запись.
+        replay_speed - скорость воспроизведения (0 - мгновенно, 1 - реальное время).
+        metrics_dir - папка для метрик прогона (JSON и .prom); по умолчанию reports.
+        firmware_store - хранилище образов (путь или FirmwareStore): образ проверяется
+        до отправки команды загрузки. Не задано - проверка не выполняется.
+        autobaud - определять скорость консоли при подключении (устройство могли оставить
+        не на скорости профиля).
+        console_baudrate - скорость, на которую консоль переключается на время проверок в CLI
+        (None - не переключать). В конфигурацию устройства она не сохраняется.
+        ordering - политика порядка перебора для своего StatsManager (utils/ordering.py);
+        None - политика по умолчанию. С общим stats не используется.
+        resume - продолжить прерванный прогон по журналу порта (stats/journal), если
+        устройство в CLI и MAC совпадает с записанным; False - всегда начинать сначала.
+        """
         self.port = port
         self.model = model
         self.vendor = vendor
         self.force_reflash = force_reflash
         self.debug = debug
         self.log_queue = log_queue # Для GUI
+        self.record_session = record_session
+        self.replay_session = replay_session
+        self.replay_speed = replay_speed
+        self.autobaud = autobaud
+        self.console_baudrate = console_baudrate
+        self.resume = resume
+        self.firmware_store = FirmwareStore(firmware_store) if isinstance(firmware_store, (str, Path)) else firmware_store
 
         # --- Инициализация путей и папок ---
         self.base_dir = Path(__file__).resolve().parent
@@ -33,11 +89,12 @@ class DLinkReset:
         self.reports_dir = self.base_dir / "reports"
         self.config_dir = self.base_dir / "config"
         self.stats_dir = self.base_dir / "stats"
-        for d in [self.logs_dir, self.reports_dir, self.config_dir, self.stats_dir]:
+        self.metrics_dir = Path(metrics_dir) if metrics_dir else self.reports_dir
+        for d in [self.logs_dir, self.reports_dir, self.config_dir, self.stats_dir, self.metrics_dir]:
             d.mkdir(exist_ok=True)
 
         # --- Инициализация логгера ---
-        self.logger = logger.setup_logger(self.logs_dir, debug=self.debug)
+        self.logger = logger.setup_logger(self.logs_dir, debug=self.debug, tag=log_tag)
         
         # Добавляем обработчик для очереди, если она предоставлена (для GUI)
         if self.log_queue:
@@ -48,7 +105,8 @@ class DLinkReset:
             if not self.debug:
                 self.logger.setLevel(logger.logging.INFO)
 
-        self.logger.info(f"--- Запуск скрипта для {self.vendor} {self.model} на порту {self.port} ---")
+        model_label = self.model or "(модель определяется по выводу консоли)"
+        self.logger.info(f"--- Запуск скрипта для {self.vendor} {model_label} на порту {self.port} ---")
 
         # --- Загрузка конфигураций ---
         self._load_configs()
@@ -64,6 +122,7 @@ class DLinkReset:
             "reset_status": "Not Started",
             "reset_was_performed": False,
             "prom_reboot_initiated": False,
+            "prom_update_staged": False,
             "firmware_reboot_initiated": False,
             "overall_status": "Unknown",
             "model_detected": None,
@@ -73,6 +132,11 @@ class DLinkReset:
             "firmware_initial": None,
             "firmware_final": None,
             "firmware_slots_before_update": None,
+            "firmware_upgrade_plan": None,
+            "resumed_from": None,
+            "zmodem_transfers": [],
+            "baudrate_detected": None,
+            "console_baudrate": None,
             "tftp_ping_status": None,
             "tftp_ip_used": None,
             "active_ip": None,
@@ -82,181 +146,384 @@ class DLinkReset:
             "dir_output": None,
             "dir_parsed": None,
         }
-        self.stats_manager = stats_manager.StatsManager(self.stats_dir)
+        # Текущее состояние устройства по последним проверкам в CLI: prom, firmware, slots
+        self.device_state = {}
+        if stats is None:
+            stats = stats_manager.StatsManager(self.stats_dir, policy=ordering or DEFAULT_POLICY)
+        self.stats_manager = stats
+        # Метка прогона в журнале попыток: эпизоды перебора для ordering_eval.py
+        self.session_id = uuid.uuid4().hex
+        # Журнал переходов для продолжения после падения (воспроизведение записи не журналируется)
+        self.journal = None if self.replay_session else CheckpointJournal(self.stats_dir / "journal", self.port)
+        self.checkpoint = None
 
-        # --- Инициализация подключения ---
-        self.connection = SerialConnection(self.port, self.device_cfg['baudrate'], self.logger)
+        # --- Инициализация подключения и метрик ---
+        self.metrics = RunMetrics()
+        self.connection = self._create_connection()
+        self.connection.metrics = self.metrics
         self.interaction_start_time = None 
 
         # --- Инициализация обработчиков ---
-        self.cli_handler = cli_handler.CLIHandler(self)
-        self.recovery_handler = recovery_handler.RecoveryHandler(self)
-        self.boot_menu_handler = boot_menu_handler.BootMenuHandler(self)
-        self.firmware_handler = firmware_handler.FirmwareHandler(self)
+        self._create_handlers()
 
     def _load_configs(self):
         """Загружает все необходимые конфигурации."""
         try:
-            configs = config_loader.load_all_configs(self.config_dir, self.model, self.vendor)
-            
-            self.device_cfg = configs['device']
-            self.patterns = configs['patterns']
-            self.credentials = configs['credentials']
-            self.reset_commands = configs['reset_commands']
-            self.timeouts = configs['timeouts']
-            self.firmware_info = configs['firmware_info']
-            
-            config_loader.validate_configs(self.device_cfg, self.patterns)
+            # Общая для всех экземпляров проверенная конфигурация (собирается один раз на модель)
+            bundle = config_bundle.load_bundle(self.config_dir, self.model, self.vendor)
+            # Индекс профилей: определение модели по выводу консоли
+            self.profile_index = config_loader.load_profile_index(self.config_dir)
+
+            # Верхний уровень копируется: экземпляр может заменить набор целиком, не затрагивая другие
+            self.device_cfg, self.patterns, self.credentials = {}, {}, {}
+            self.reset_commands, self.timeouts, self.firmware_info = {}, {}, {}
+            self._apply_config_bundle(bundle)
             self.logger.info("✅ Конфигурация успешно загружена и проверена.")
         except Exception as e:
             self.logger.critical(f"❌(CRITICAL) Ошибка конфигурации: {e}")
             raise SystemExit(1)
 
+    def _apply_config_bundle(self, bundle):
+        """
+        Переносит наборы конфигурации в словари экземпляра. Словари обновляются на месте:
+        обработчики держат ссылки на них и после смены модели видят новый профиль.
+        """
+        self.config_bundle = bundle
+        for target, source in [(self.device_cfg, bundle.device), (self.patterns, bundle.patterns),
+                               (self.credentials, bundle.credentials), (self.reset_commands, bundle.reset_commands),
+                               (self.timeouts, bundle.timeouts), (self.firmware_info, bundle.firmware_info)]:
+            target.clear()
+            target.update(source)
+        self.pattern_matcher = bundle.pattern_matcher
+        self.show_parsers = bundle.show_parsers
+
+    def identify_model(self, output):
+        """
+        Определяет модель по выводу консоли (баннер загрузчика, приглашение CLI, 'show switch').
+        Если модель не была задана или задана неверно, профиль обнаруженной модели загружается
+        вместо текущего - дальнейшие этапы работают уже с ним. Возвращает модель или None.
+        """
+        detected = self.profile_index.detect(output)
+        if not detected:
+            return None
+        vendor, model = detected
+        self.report_data["model_detected"] = model
+        if (vendor, model) == (self.vendor, self.model):
+            return model
+        if self.model:
+            self.logger.warning(f"⚠️ ОБНАРУЖЕНО НЕСООТВЕТСТВИЕ! Задана модель {self.model}, "
+                                f"в выводе консоли - {model}. Используется профиль {model}.")
+        else:
+            self.logger.info(f"🔎 Обнаружена модель: {vendor} {model}")
+        try:
+            bundle = config_bundle.load_bundle(self.config_dir, model, vendor)
+        except Exception as e:
+            self.logger.error(f"❌ Не удалось загрузить профиль {vendor} {model}: {e}. Продолжаем с текущим.")
+            return model
+        self.vendor, self.model = vendor, model
+        self._apply_config_bundle(bundle)
+        return model
+
+    def parse_show(self, command, output):
+        """Разбор вывода команды по таблице профиля (utils/show_parser.py); нет таблицы - {}."""
+        parser = self.show_parsers.get(command)
+        return parser.parse(output) if parser else {}
+
+    def stats_context(self):
+        """
+        Контексты статистики перебора для этого устройства (stats_manager.context_levels):
+        модель - обнаруженная или заданная, ветка прошивки - когда версия уже известна.
+        """
+        return stats_manager.context_levels(self.vendor, self.report_data["model_detected"] or self.model,
+                                            self.device_cfg.get("family"), self.report_data["firmware_initial"])
+
+    def _create_connection(self):
+        """Создает подключение к порту (переопределяется в подклассах)."""
+        if self.replay_session:
+            return ReplaySerialConnection(self.replay_session, self.logger, speed=self.replay_speed)
+        return SerialConnection(self.port, self.device_cfg['baudrate'], self.logger,
+                                recorder=self._create_session_recorder())
+
+    def _create_session_recorder(self):
+        """Создает SessionRecorder, если запрошена запись сессии."""
+        if not self.record_session:
+            return None
+        path = self.record_session
+        if path is True:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            path = self.logs_dir / f"session_{logger.safe_name(self.port)}_{timestamp}.dlsession"
+        info = {"port": self.port, "model": self.model, "vendor": self.vendor,
+                "baudrate": self.device_cfg['baudrate']}
+        return SessionRecorder(path, info)
+
+    def _create_handlers(self):
+        """Создает обработчики этапов (переопределяется в подклассах)."""
+        self.interaction = interaction.Interaction(self)
+        self.cli_handler = cli_handler.CLIHandler(self)
+        self.recovery_handler = recovery_handler.RecoveryHandler(self)
+        self.boot_menu_handler = boot_menu_handler.BootMenuHandler(self)
+        self.firmware_handler = firmware_handler.FirmwareHandler(self)
+
+    def _state_action(self, state):
+        """Возвращает метод обработчика для состояния или None."""
+        action = self.STATE_ACTIONS.get(state)
+        if not action:
+            return None
+        handler_name, method_name = action
+        return getattr(getattr(self, handler_name), method_name)
+
     def run(self):
-        """Основной цикл выполнения, управляющий переходами между состояниями."""
+        """Выполняет цикл состояний с синхронным подключением."""
+        flow.run(self._run())
+
+    def _run(self):
+        """Основной цикл (сценарий handlers/flow.py), управляющий переходами между состояниями."""
         current_state = "START"
-        max_iterations = 30 # Предотвращает бесконечные циклы
         iteration = 0
 
         try:
-            while current_state != "FINISHED" and iteration < max_iterations:
+            while current_state != "FINISHED" and iteration < self.MAX_ITERATIONS:
                 iteration += 1
                 self.logger.info(f"--- Текущее состояние: {current_state} ---")
                 
-                if current_state == "START":
-                    self.connection.connect()
-                    self.cli_handler.init_cli_handler_config()
-                    current_state = "RECOVERY_ENTRY"
-
-                elif current_state == "RECOVERY_ENTRY":
-                    result = self.recovery_handler.attempt_recovery_entry()
-                    if result == "SUCCESS":
-                        current_state = "RECOVERY_RESET"
-                    elif result == "AUTH_NEEDED":
-                        current_state = "RECOVERY_AUTH"
-                    elif result == "CLI_FALLBACK":
-                        current_state = "CLI_ENTRY"
+                state_started = self.connection.monotonic()
+                try:
+                    if current_state == "START":
+                        yield self.connection.connect()
+                        if self.autobaud:
+                            yield from self.interaction.detect_baudrate()
+                        self.cli_handler.init_cli_handler_config()
+                        result = None
                     else:
-                        current_state = "CLI_ENTRY"
+                        action = self._state_action(current_state)
+                        result = (yield from action()) if action else None
+                finally:
+                    self.metrics.record_state(current_state, self.connection.monotonic() - state_started)
+                current_state = self._advance(current_state, result)
 
-                elif current_state == "RECOVERY_AUTH":
-                    if self.recovery_handler.authorize_in_recovery():
-                        self.report_data["reset_method"] = "Recovery (Password)"
-                        current_state = "RECOVERY_RESET"
-                    else:
-                        current_state = "CLI_ENTRY"
+        except Exception as e:
+            self.logger.exception(f"❌ Необработанная ошибка в состоянии {current_state}: {e}")
+            self.report_data["overall_status"] = "Fail"
+            current_state = "FINISHED"
+        finally:
+            self._finish_run()
+            try:
+                yield self.connection.disconnect()
+            except:
+                pass
+            self.logger.info("--- Скрипт завершен ---")
 
-                elif current_state == "RECOVERY_RESET":
-                    if self.recovery_handler.execute_recovery_reset():
-                        self.report_data["reset_status"] = "Success"
-                        self.report_data["reset_was_performed"] = True
-                        current_state = "CLI_ENTRY"
-                    else:
-                        current_state = "ERROR"
-
-                elif current_state == "CLI_ENTRY":
-                    cli_result = self.cli_handler.attempt_cli_entry()
-                    if cli_result == "SUCCESS_PRIVILEGED":
-                        if not self.report_data["reset_was_performed"]:
-                            current_state = "CLI_RESET"
-                        else:
-                            current_state = "CLI_CHECKS"
-                    elif cli_result == "BOOT_MENU_FALLBACK":
-                        current_state = "BOOT_MENU_ENTRY"
-                    else: # "FAILED"
-                        current_state = "BOOT_MENU_ENTRY"
-
-                elif current_state == "CLI_RESET":
-                    if self.cli_handler.execute_cli_reset():
-                        self.report_data["reset_method"] = "CLI"
-                        self.report_data["reset_status"] = "Success"
-                        self.report_data["reset_was_performed"] = True
-                        current_state = "CLI_ENTRY"
-                    else:
-                        current_state = "ERROR"
+    def _next_state(self, current_state, result):
+        """Определяет следующее состояние по результату текущего и обновляет отчет."""
+        if current_state == "START":
+            self.checkpoint = self.journal.pending() if self.journal and self.resume else None
+            if self.checkpoint:
+                self.logger.info(f"📒 Найден прерванный прогон (MAC {self.checkpoint['mac']}, "
+                                 f"прерван в {self.checkpoint['next']}): проверка CLI перед продолжением.")
+                return "RESUME_PROBE"
+            return "RECOVERY_ENTRY"
 
-                elif current_state == "BOOT_MENU_ENTRY":
-                    if self.boot_menu_handler.attempt_boot_menu_entry():
-                        current_state = "CLI_ENTRY"
-                    else:
-                        current_state = "ERROR"
+        elif current_state == "RESUME_PROBE":
+            return self._resume_state(result)
 
-                elif current_state == "CLI_CHECKS":
-                    if self.cli_handler.perform_cli_checks():
-                        current_state = "PROM_UPDATE"
-                    else:
-                        current_state = "ERROR"
-
-                elif current_state == "PROM_UPDATE":
-                    prom_result = self.firmware_handler.update_prom()
-                    if prom_result == "REBOOT_NEEDED":
-                        self.report_data["prom_reboot_initiated"] = True
-                        current_state = "CLI_ENTRY"
-                    elif prom_result == "SKIP" or prom_result == "SUCCESS":
-                        current_state = "FIRMWARE_UPDATE"
-                    else: # "ERROR"
-                        current_state = "ERROR"
-
-                elif current_state == "FIRMWARE_UPDATE":
-                    firmware_result = self.firmware_handler.update_firmware()
-                    if firmware_result == "REBOOT_NEEDED":
-                        self.report_data["firmware_reboot_initiated"] = True
-                        current_state = "CLI_ENTRY"
-                    elif firmware_result == "SKIP" or firmware_result == "SUCCESS":
-                        current_state = "FINAL_CHECKS"
-                    else: # "ERROR"
-                        current_state = "ERROR"
-
-                elif current_state == "FINAL_CHECKS":
-                    if self.cli_handler.perform_final_checks():
-                        self.report_data["overall_status"] = "Success"
-                        self.logger.info("🎉 Процесс успешно завершен!")
-                    else:
-                        self.report_data["overall_status"] = "Fail"
-                        self.logger.warning("⚠️ Процесс завершен с ошибками.")
-                    current_state = "FINISHED"
+        elif current_state == "RECOVERY_ENTRY":
+            if result == "SUCCESS":
+                return "RECOVERY_RESET"
+            elif result == "AUTH_NEEDED":
+                return "RECOVERY_AUTH"
+            elif result == "CLI_FALLBACK":
+                return "CLI_ENTRY"
+            else:
+                return "CLI_ENTRY"
 
-                elif current_state == "ERROR":
-                    self.report_data["overall_status"] = "Fail"
-                    self.logger.error("❌ Процесс прерван из-за ошибки.")
-                    current_state = "FINISHED"
+        elif current_state == "RECOVERY_AUTH":
+            if result:
+                self.report_data["reset_method"] = "Recovery (Password)"
+                return "RECOVERY_RESET"
+            else:
+                return "CLI_ENTRY"
 
-                elif current_state == "FINISHED":
-                    pass
+        elif current_state == "RECOVERY_RESET":
+            if result:
+                self.report_data["reset_status"] = "Success"
+                self.report_data["reset_was_performed"] = True
+                return "CLI_ENTRY"
+            else:
+                return "ERROR"
 
+        elif current_state == "CLI_ENTRY":
+            if result == "SUCCESS_PRIVILEGED":
+                if not self.report_data["reset_was_performed"]:
+                    return "CLI_RESET"
                 else:
-                    self.logger.critical(f"❌ Неизвестное состояние: {current_state}")
-                    current_state = "ERROR"
+                    return "CLI_CHECKS"
+            elif result == "BOOT_MENU_FALLBACK":
+                return "BOOT_MENU_ENTRY"
+            else: # "FAILED"
+                return "BOOT_MENU_ENTRY"
 
-        except Exception as e:
-            self.logger.exception(f"❌ Необработанная ошибка в состоянии {current_state}: {e}")
+        elif current_state == "CLI_RESET":
+            if result:
+                self.report_data["reset_method"] = "CLI"
+                self.report_data["reset_status"] = "Success"
+                self.report_data["reset_was_performed"] = True
+                return "CLI_ENTRY"
+            else:
+                return "ERROR"
+
+        elif current_state == "BOOT_MENU_ENTRY":
+            if result:
+                return "CLI_ENTRY"
+            else:
+                return "ERROR"
+
+        elif current_state == "CLI_CHECKS":
+            if result:
+                return "PROM_UPDATE"
+            else:
+                return "ERROR"
+
+        elif current_state == "PROM_UPDATE":
+            if result == "REBOOT_NEEDED":
+                self.report_data["prom_reboot_initiated"] = True
+                return "CLI_ENTRY"
+            elif result == "STAGED":
+                # PROM применится при перезагрузке после прошивки
+                self.report_data["prom_update_staged"] = True
+                return "FIRMWARE_UPDATE"
+            elif result == "SKIP" or result == "SUCCESS":
+                return "FIRMWARE_UPDATE"
+            else: # "ERROR"
+                return "ERROR"
+
+        elif current_state == "FIRMWARE_UPDATE":
+            if result in ("REBOOT_NEEDED", "PROM_REBOOT_NEEDED"):
+                if result == "REBOOT_NEEDED":
+                    self.report_data["firmware_reboot_initiated"] = True
+                if self.report_data["prom_update_staged"]:
+                    self.report_data["prom_update_staged"] = False
+                    self.report_data["prom_reboot_initiated"] = True
+                return "CLI_ENTRY"
+            elif result == "SKIP" or result == "SUCCESS":
+                return "FINAL_CHECKS"
+            else: # "ERROR"
+                return "ERROR"
+
+        elif current_state == "FINAL_CHECKS":
+            if result:
+                self.report_data["overall_status"] = "Success"
+                self.logger.info("🎉 Процесс успешно завершен!")
+            else:
+                self.report_data["overall_status"] = "Fail"
+                self.logger.warning("⚠️ Процесс завершен с ошибками.")
+            return "FINISHED"
+
+        elif current_state == "ERROR":
             self.report_data["overall_status"] = "Fail"
-            current_state = "FINISHED"
-        finally:
-            if self.interaction_start_time:
-                self.report_data["interaction_duration"] = time.monotonic() - self.interaction_start_time
+            self.logger.error("❌ Процесс прерван из-за ошибки.")
+            return "FINISHED"
 
-            if self.log_queue:
-                try:
-                    self.log_queue.put(("REPORT_DATA", self.report_data))
-                except Exception as e:
-                    self.logger.error(f"❌ Ошибка отправки отчета в очередь: {e}")
+        elif current_state == "FINISHED":
+            return "FINISHED"
+
+        else:
+            self.logger.critical(f"❌ Неизвестное состояние: {current_state}")
+            return "ERROR"
 
-            # self._generate_reports()
+    def _advance(self, current_state, result):
+        """Переход к следующему состоянию с записью в журнал контрольных точек."""
+        next_state = self._next_state(current_state, result)
+        # Пока прерванный прогон не подтвержден проверкой CLI, его запись в журнале не затирается
+        if self.journal and next_state != "RESUME_PROBE":
             try:
-                self.connection.disconnect()
-            except:
-                pass
-            self.logger.info("--- Скрипт завершен ---")
+                self.journal.record(self.session_id, current_state, next_state, self.report_data)
+            except OSError as e:
+                self.logger.warning(f"⚠️ Ошибка записи журнала контрольных точек: {e}")
+        return next_state
+
+    def _resume_state(self, mac):
+        """
+        Продолжение прерванного прогона: сброс уже выполнен, поэтому с тем же устройством
+        работа продолжается с проверок в CLI - они заново читают PROM, прошивку и слоты.
+        """
+        checkpoint = self.checkpoint
+        if not same_mac(mac, checkpoint["mac"]):
+            self.logger.info(f"ℹ️ Устройство не то, что в журнале (MAC {mac or 'не определен'}): прогон с начала.")
+            return "RECOVERY_ENTRY"
+        for key, value in checkpoint["facts"].items():
+            if value is not None and key != "overall_status":
+                self.report_data[key] = value
+        self.report_data["resumed_from"] = checkpoint["next"]
+        self.logger.success(f"▶️ Продолжение прерванного прогона (MAC {mac}, прерван в {checkpoint['next']}).")
+        return "CLI_CHECKS"
+
+    def _finish_run(self):
+        """Завершает прогон: длительность взаимодействия, метрики и отправка отчета в GUI."""
+        if self.interaction_start_time:
+            self.report_data["interaction_duration"] = self.connection.monotonic() - self.interaction_start_time
+
+        self._export_metrics()
+
+        if self.log_queue:
+            try:
+                self.log_queue.put(("REPORT_DATA", self.report_data))
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка отправки отчета в очередь: {e}")
+
+        # self._generate_reports()
+
+    def _export_metrics(self):
+        """Сохраняет метрики прогона в report_data, JSON и текстовый файл Prometheus."""
+        metrics = self.metrics
+        metrics.bytes_read = self.connection.bytes_read
+        metrics.bytes_written = self.connection.bytes_written
+        metrics.duration = sum(data["seconds"] for data in metrics.states.values())
+        self.report_data["metrics"] = metrics.to_dict()
+
+        port_name = logger.safe_name(self.port)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        labels = {"port": self.port, "model": self.model or "unknown"}
+        try:
+            metrics.save_json(self.metrics_dir / f"metrics_{port_name}_{timestamp}.json",
+                              extra={"port": self.port, "model": self.model, "vendor": self.vendor,
+                                     "overall_status": self.report_data["overall_status"]})
+            metrics.save_prometheus(self.metrics_dir / f"dlink_{port_name}.prom", labels,
+                                    success=self.report_data["overall_status"] == "Success")
+        except OSError as e:
+            self.logger.error(f"❌ Ошибка сохранения метрик: {e}")
 
     def _run_show_command(self, command):
         """Универсальный метод для выполнения команд 'show ...'."""
         self.logger.debug(f"🔍 Выполнение команды: {command}")
-        result = self.connection.send_command_and_wait(
+        yield self.connection.send_command_and_wait(
             command, 
-            expected_patterns=[self.patterns['USER_PROMPT']], 
+            expected_patterns=self._show_expected_patterns(),
             timeout=self.timeouts['command_default']
         )
         output = self.connection.get_last_output()
         self.logger.debug(f"🔍 Вывод '{command}': {output[:100]}...")
         return output
+
+    def _show_expected_patterns(self):
+        """Конец вывода 'show': промпт CLI в любом режиме ('#' или '>')."""
+        return [self.patterns['PRIVILEGED_PROMPT'], self.patterns['USER_PROMPT']]
+
+
+class AsyncDLinkReset(DLinkReset):
+    """
+    Вариант DLinkReset на asyncio: те же сценарии и граф состояний, но ввод-вывод не блокирует поток.
+    Несколько экземпляров выполняются в одном цикле событий (см. fleet.py --asyncio).
+    """
+    def _create_connection(self):
+        if self.replay_session:
+            return super()._create_connection()
+        return AsyncSerialConnection(self.port, self.device_cfg['baudrate'], self.logger,
+                                     recorder=self._create_session_recorder())
+
+    def run(self):
+        """Запускает асинхронный цикл в собственном цикле событий."""
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        """Основной цикл выполнения (корутина)."""
+        await flow.run_async(self._run())
@@ -0,0 +1,103 @@
+# firmware.py
+"""
+Управление хранилищем образов PROM и прошивок (utils/firmware_store.py).
+
+Пример:
+    python firmware.py import --source downloads          # образы из firmware_info.json
+    python firmware.py add DES3200_Run_4_51_B018.had --model DES-3200-28 --kind firmware --version 4.51.B018
+    python firmware.py verify
+    python firmware.py list
+По умолчанию хранилище - папка firmware рядом со скриптом (--store).
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# Добавляем текущую директорию в путь поиска модулей
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils import config_loader
+from utils.firmware_store import FirmwareStore, FirmwareStoreError
+
+BASE_DIR = Path(__file__).resolve().parent
+
+
+def cmd_import(store, args):
+    firmware_info = config_loader.load_json_config(BASE_DIR / "config" / "firmware_info.json")
+    added, missing = store.import_firmware_info(args.source, firmware_info)
+    for filename in added:
+        print(f"✅ {filename}")
+    for filename in missing:
+        print(f"⚠️ Нет файла: {filename}")
+    return 0 if not missing else 1
+
+
+def cmd_add(store, args):
+    sha256 = store.add(args.file, args.model, args.kind, args.version, args.filename)
+    print(f"✅ {args.model} {args.kind} {args.version}: {sha256}")
+    return 0
+
+
+def cmd_verify(store, args):
+    problems = store.verify_all()
+    for sha256, problem in problems.items():
+        print(f"❌ {sha256} ({', '.join(store.index['images'][sha256]['filenames'])}): {problem}")
+    if not problems:
+        print(f"✅ Все образы целы ({len(store.index['images'])}).")
+    # Образы из firmware_info.json, которых нет в хранилище
+    firmware_info = config_loader.load_json_config(BASE_DIR / "config" / "firmware_info.json")
+    missing = 0
+    for model, kind, version, filename in store.expected_images(firmware_info):
+        if store.lookup(model, kind, version) is None:
+            print(f"⚠️ {model} {kind} {version} ({filename}): нет в хранилище")
+            missing += 1
+    return 1 if problems or missing else 0
+
+
+def cmd_list(store, args):
+    for model, kinds in sorted(store.index["models"].items()):
+        for kind, versions in sorted(kinds.items()):
+            for version, sha256 in sorted(versions.items()):
+                image = store.index["images"].get(sha256, {})
+                print(f"{model:16} {kind:9} {version:14} {image.get('size', '?'):>10}  "
+                      f"{sha256[:16]}  {', '.join(image.get('filenames', []))}")
+    return 0
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Хранилище образов PROM и прошивок.")
+    parser.add_argument("--store", default=str(BASE_DIR / "firmware"), help="Папка хранилища (по умолчанию firmware)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Добавить образы из firmware_info.json")
+    import_parser.add_argument("--source", required=True, help="Папка, где лежат файлы образов")
+    import_parser.set_defaults(handler=cmd_import)
+
+    add_parser = commands.add_parser("add", help="Добавить один образ")
+    add_parser.add_argument("file", help="Файл образа")
+    add_parser.add_argument("--model", required=True, help="Модель (например, DES-3200-28)")
+    add_parser.add_argument("--kind", required=True, choices=["prom", "firmware"], help="Тип образа")
+    add_parser.add_argument("--version", required=True, help="Версия образа")
+    add_parser.add_argument("--filename", help="Имя для TFTP (по умолчанию имя файла)")
+    add_parser.set_defaults(handler=cmd_add)
+
+    verify_parser = commands.add_parser("verify", help="Проверить целостность всех образов")
+    verify_parser.set_defaults(handler=cmd_verify)
+
+    list_parser = commands.add_parser("list", help="Показать содержимое индекса")
+    list_parser.set_defaults(handler=cmd_list)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    store = FirmwareStore(args.store)
+    try:
+        sys.exit(args.handler(store, args))
+    except (FirmwareStoreError, OSError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
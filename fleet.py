@@ -0,0 +1,301 @@
+# fleet.py
+"""
+Пакетный режим: одновременная обработка нескольких коммутаторов.
+Каждый COM-порт обслуживается отдельным экземпляром DLinkReset в своем потоке
+(свой логгер, свое подключение, свой отчет). Статистика общая для всех портов.
+С ключом --asyncio все порты обслуживаются одним циклом событий (AsyncDLinkReset).
+С ключом --tftp-root на время работы запускается встроенный TFTP-сервер с образами
+из firmware_info.json (адрес этого компьютера должен быть в tftp_ip_candidates профиля).
+
+Пример:
+    python fleet.py --job COM3:DES-3200-28 --job COM4:DGS-1210-28
+    python fleet.py --job COM3 --job COM4    (модель определяется по выводу консоли)
+    python fleet.py --asyncio --jobs-file jobs.json
+    python fleet.py --jobs-file jobs.json
+    python fleet.py --jobs-file jobs.json --tftp-root firmware
+где firmware - папка с образами или хранилище образов (firmware.py): тогда образы
+проверяются по SHA-256 до отправки команды загрузки на коммутатор.
+где jobs.json - список вида [{"port": "COM3", "model": "DES-3200-28"}, {"port": "COM4"}, ...]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+# Добавляем текущую директорию в путь поиска модулей
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dlink_reset import DLinkReset, AsyncDLinkReset
+from utils import config_bundle, config_loader, logger, stats_manager
+from utils.logger import safe_name
+from utils.ordering import POLICIES, DEFAULT_POLICY
+from utils.firmware_store import FirmwareStore
+from utils.tftp_server import TftpServer, firmware_filenames
+
+
+class FleetRunner:
+    """
+    Запускает DLinkReset.run() параллельно для списка пар порт/модель.
+    """
+    def __init__(self, jobs, vendor="D-Link", force_reflash=False, debug=False, max_workers=None,
+                 use_asyncio=False, metrics_dir=None, tftp_root=None, tftp_host="0.0.0.0", tftp_port=69,
+                 firmware_store=None, autobaud=False, console_baudrate=None, ordering=DEFAULT_POLICY,
+                 resume=True):
+        self.jobs = [self._normalize_job(job, vendor) for job in jobs]
+        ports = [job["port"] for job in self.jobs]
+        duplicates = {p for p in ports if ports.count(p) > 1}
+        if duplicates:
+            raise ValueError(f"Порт указан несколько раз: {', '.join(sorted(duplicates))}")
+
+        self.force_reflash = force_reflash
+        self.debug = debug
+        self.max_workers = max_workers or len(self.jobs) or 1
+        self.use_asyncio = use_asyncio
+        self.metrics_dir = metrics_dir
+        self.autobaud = autobaud
+        self.console_baudrate = console_baudrate
+        self.resume = resume
+
+        self.base_dir = Path(__file__).resolve().parent
+        self.reports_dir = self.base_dir / "reports"
+        self.stats_dir = self.base_dir / "stats"
+        for d in [self.reports_dir, self.stats_dir]:
+            d.mkdir(exist_ok=True)
+
+        # Конфигурации всех моделей проверяются до открытия первого порта и затем общие для всех потоков
+        for job in self.jobs:
+            config_bundle.load_bundle(self.base_dir / "config", job["model"], job["vendor"])
+
+        # Общий менеджер статистики: у каждого потока свое соединение с базой, счетчики растут атомарно
+        self.stats = stats_manager.StatsManager(self.stats_dir, policy=ordering)
+        self.tftp_server = self._create_tftp_server(tftp_root, tftp_host, tftp_port) if tftp_root else None
+        # Одно хранилище на все порты: каждый образ проверяется один раз
+        if firmware_store:
+            self.firmware_store = FirmwareStore(firmware_store)
+        else:
+            self.firmware_store = self.tftp_server.store if self.tftp_server else None
+        self.results = {}
+        self._results_lock = threading.Lock()
+
+    def _create_tftp_server(self, root, host, port):
+        """Встроенный TFTP-сервер: раздает только файлы, указанные в firmware_info.json."""
+        firmware_info = config_loader.load_json_config(self.base_dir / "config" / "firmware_info.json")
+        logs_dir = self.base_dir / "logs"
+        logs_dir.mkdir(exist_ok=True)
+        return TftpServer(root, host=host, port=port, allowed=firmware_filenames(firmware_info),
+                          logger=logger.setup_logger(logs_dir, debug=self.debug, tag="tftp"))
+
+    @staticmethod
+    def _normalize_job(job, vendor):
+        """Приводит задание к словарю {'port', 'model', 'vendor'}; model=None - определить по консоли."""
+        if isinstance(job, dict):
+            port, model = job.get("port"), job.get("model")
+            job_vendor = job.get("vendor", vendor)
+        else:
+            port, model = job
+            job_vendor = vendor
+        if not port:
+            raise ValueError(f"Некорректное задание: {job}")
+        return {"port": port, "model": model or None, "vendor": job_vendor}
+
+    def run(self):
+        """Запускает все задания и возвращает словарь {порт: report_data}."""
+        started = time.monotonic()
+        if self.use_asyncio:
+            print(f"--- Пакетный режим (asyncio): {len(self.jobs)} порт(ов), одновременно: {self.max_workers} ---")
+            asyncio.run(self._run_async())
+        else:
+            print(f"--- Пакетный режим: {len(self.jobs)} порт(ов), потоков: {self.max_workers} ---")
+            if self.tftp_server:
+                self.tftp_server.start()
+            try:
+                with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fleet") as executor:
+                    for job in self.jobs:
+                        executor.submit(self._run_worker, job)
+            finally:
+                if self.tftp_server:
+                    self.tftp_server.stop()
+
+        elapsed = time.monotonic() - started
+        self._save_summary(elapsed)
+        return self.results
+
+    async def _run_async(self):
+        """Выполняет все задания в одном цикле событий, не более max_workers одновременно."""
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def limited(job):
+            async with semaphore:
+                await self._run_worker_async(job)
+
+        # TFTP-сервер работает в том же цикле событий, что и порты
+        if self.tftp_server:
+            await self.tftp_server.start_async()
+        try:
+            await asyncio.gather(*(limited(job) for job in self.jobs))
+        finally:
+            if self.tftp_server:
+                await self.tftp_server.stop_async()
+
+    def _create_worker(self, job, worker_class):
+        return worker_class(
+            port=job["port"],
+            model=job["model"],
+            vendor=job["vendor"],
+            force_reflash=self.force_reflash,
+            debug=self.debug,
+            stats=self.stats,
+            log_tag=job["port"],
+            metrics_dir=self.metrics_dir,
+            firmware_store=self.firmware_store,
+            autobaud=self.autobaud,
+            console_baudrate=self.console_baudrate,
+            resume=self.resume
+        )
+
+    def _initial_report(self, job):
+        return {"port": job["port"], "model_requested": job["model"], "vendor": job["vendor"],
+                "overall_status": "Fail"}
+
+    def _run_worker(self, job):
+        """Выполняет полный цикл для одного порта. Исключения не выходят за пределы потока."""
+        report_data = self._initial_report(job)
+        try:
+            worker = self._create_worker(job, DLinkReset)
+            report_data = worker.report_data
+            worker.run()
+        except SystemExit:
+            self._record_error(job["port"], report_data, None)
+        except Exception as e:
+            self._record_error(job["port"], report_data, e)
+        self._finish_worker(job["port"], report_data)
+
+    async def _run_worker_async(self, job):
+        """Асинхронный вариант _run_worker для режима --asyncio."""
+        report_data = self._initial_report(job)
+        try:
+            worker = self._create_worker(job, AsyncDLinkReset)
+            report_data = worker.report_data
+            await worker.run_async()
+        except SystemExit:
+            self._record_error(job["port"], report_data, None)
+        except Exception as e:
+            self._record_error(job["port"], report_data, e)
+        self._finish_worker(job["port"], report_data)
+
+    def _record_error(self, port, report_data, error):
+        """Отмечает прерванное задание. error=None - SystemExit (конфигурация или подключение)."""
+        report_data["overall_status"] = "Fail"
+        if error is None:
+            # Поднимается при ошибке конфигурации или подключения к порту, подробности в логе порта
+            report_data["error"] = "Прервано: ошибка конфигурации или подключения (см. лог порта)"
+            print(f"[{port}] ❌ {report_data['error']}")
+        else:
+            report_data["error"] = str(error) or error.__class__.__name__
+            print(f"[{port}] ❌ Ошибка выполнения: {report_data['error']}")
+
+    def _finish_worker(self, port, report_data):
+        with self._results_lock:
+            self.results[port] = report_data
+        self._save_report(port, report_data)
+
+    def _save_report(self, port, report_data):
+        """Сохраняет отчет отдельного порта."""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        file_path = self.reports_dir / f"report_{safe_name(port)}_{timestamp}.json"
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(report_data, f, indent=4, ensure_ascii=False, default=str)
+
+    def _save_summary(self, elapsed):
+        """Сохраняет сводный отчет и выводит итог."""
+        succeeded = [p for p, r in self.results.items() if r.get("overall_status") == "Success"]
+        summary = {
+            "total": len(self.jobs),
+            "success": len(succeeded),
+            "failed": len(self.jobs) - len(succeeded),
+            "elapsed_seconds": round(elapsed, 1),
+            "units_per_hour": round(len(succeeded) * 3600 / elapsed, 2) if elapsed > 0 else None,
+            "ports": {p: r.get("overall_status") for p, r in self.results.items()},
+        }
+        if self.tftp_server:
+            summary["tftp_transfers"] = self.tftp_server.completed
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        with open(self.reports_dir / f"fleet_summary_{timestamp}.json", 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4, ensure_ascii=False)
+        print(f"--- Пакетный режим завершен: успешно {summary['success']} из {summary['total']} "
+              f"за {summary['elapsed_seconds']} с ---")
+
+
+def parse_job(text):
+    """
+    Разбирает задание вида PORT:MODEL или PORT (модель определяется по консоли).
+    Порт с ':' без модели записывается с двоеточием в конце: 'socket://host:7001:'.
+    """
+    port, sep, model = text.rpartition(":")
+    if not sep:
+        port, model = text, None
+    if not port:
+        raise argparse.ArgumentTypeError(f"Ожидается формат PORT[:MODEL], получено '{text}'")
+    return {"port": port, "model": model or None}
+
+
+def parse_arguments():
+    """Парсит аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="Пакетный сброс и прошивка коммутаторов D-Link на нескольких портах.")
+    parser.add_argument("--job", action="append", type=parse_job, default=[], help="Задание PORT:MODEL или PORT - модель по выводу консоли (можно указать несколько раз)")
+    parser.add_argument("--jobs-file", help="JSON-файл со списком заданий [{\"port\": ..., \"model\": ...}]")
+    parser.add_argument("--vendor", default="D-Link", help="Производитель по умолчанию (по умолчанию D-Link)")
+    parser.add_argument("--max-workers", type=int, default=None, help="Максимум одновременно обслуживаемых портов")
+    parser.add_argument("--force-reflash", action="store_true", help="Принудительно перепрошить, даже если версия совпадает")
+    parser.add_argument("--debug", action="store_true", help="Включить подробное логирование")
+    parser.add_argument("--metrics-dir", help="Папка для метрик прогонов: JSON и .prom для node_exporter (по умолчанию reports)")
+    parser.add_argument("--asyncio", action="store_true", help="Обслуживать все порты одним циклом событий вместо потоков")
+    parser.add_argument("--tftp-root", help="Папка с образами: запустить встроенный TFTP-сервер на время работы")
+    parser.add_argument("--tftp-host", default="0.0.0.0", help="Адрес встроенного TFTP-сервера (по умолчанию все интерфейсы)")
+    parser.add_argument("--tftp-port", type=int, default=69, help="Порт встроенного TFTP-сервера (по умолчанию 69)")
+    parser.add_argument("--firmware-store", help="Хранилище образов для проверки до загрузки (по умолчанию --tftp-root, если это хранилище)")
+    parser.add_argument("--autobaud", action="store_true", help="Определять скорость консоли каждого порта при подключении")
+    parser.add_argument("--console-baudrate", type=int, help="Ускорить консоль до этой скорости на время проверок в CLI (например 115200)")
+    parser.add_argument("--ordering", choices=sorted(POLICIES), default=DEFAULT_POLICY,
+                        help="Порядок перебора учетных данных и команд: thompson (по умолчанию), ucb или count (по числу успехов)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Не продолжать прерванный прогон по журналу порта (stats/journal), начинать с начала")
+    return parser.parse_args()
+
+
+def main():
+    """Точка входа пакетного режима."""
+    args = parse_arguments()
+
+    jobs = list(args.job)
+    if args.jobs_file:
+        with open(args.jobs_file, 'r', encoding='utf-8') as f:
+            jobs.extend(json.load(f))
+    if not jobs:
+        print("Не задано ни одного задания (--job или --jobs-file).")
+        sys.exit(1)
+
+    try:
+        runner = FleetRunner(jobs, vendor=args.vendor, force_reflash=args.force_reflash,
+                             debug=args.debug, max_workers=args.max_workers,
+                             use_asyncio=args.asyncio, metrics_dir=args.metrics_dir,
+                             tftp_root=args.tftp_root, tftp_host=args.tftp_host, tftp_port=args.tftp_port,
+                             firmware_store=args.firmware_store,
+                             autobaud=args.autobaud, console_baudrate=args.console_baudrate,
+                             ordering=args.ordering, resume=not args.no_resume)
+        results = runner.run()
+    except Exception as e:
+        print(f"Критическая ошибка: {e}")
+        sys.exit(1)
+
+    if any(r.get("overall_status") != "Success" for r in results.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
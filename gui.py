@@ -36,6 +36,7 @@ class DLinkResetGUI:
         self.firmware_path = tk.StringVar() # Не используется напрямую, но можно для выбора папки конфигов
         self.tftp_ip = tk.StringVar(value="192.168.1.100")
         self.force_reflash = tk.BooleanVar()
+        self.resume = tk.BooleanVar(value=True)
         
         # --- Состояние выполнения ---
         self.dlink_reset_instance = None
@@ -105,6 +106,10 @@ class DLinkResetGUI:
         force_frame.pack(fill=tk.X, pady=2)
         ttk.Checkbutton(force_frame, text="Принудительная перепрошивка", variable=self.force_reflash).pack(side=tk.LEFT)
 
+        resume_frame = ttk.Frame(settings_frame)
+        resume_frame.pack(fill=tk.X, pady=2)
+        ttk.Checkbutton(resume_frame, text="Продолжить прерванный прогон", variable=self.resume).pack(side=tk.LEFT)
+
         # --- Секция Управление ---
         control_frame = ttk.LabelFrame(top_frame, text="Управление", padding="10")
         control_frame.pack(fill=tk.BOTH, side=tk.RIGHT, padx=(5, 0))
@@ -232,7 +237,8 @@ class DLinkResetGUI:
                 vendor=self.selected_vendor.get(),
                 force_reflash=self.force_reflash.get(),
                 debug=True, # Всегда включаем дебаг для GUI
-                log_queue=self.log_queue
+                log_queue=self.log_queue,
+                resume=self.resume.get()
             )
         except Exception as e:
             self.log_message(f"❌ Ошибка инициализации: {e}\n", "error")
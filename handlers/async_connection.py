@@ -0,0 +1,251 @@
+# handlers/async_connection.py
+"""
+Асинхронное последовательное соединение (asyncio).
+API повторяет SerialConnection, но методы ввода-вывода являются корутинами.
+Один цикл событий обслуживает множество портов без отдельного потока на порт.
+"""
+import asyncio
+import logging
+import serial
+
+from handlers.connection import (RX_BUFFER_SIZE, BAUD_PROBE_WAIT, BAUD_PROBE_QUIET, BAUD_PROBE_MIN_BYTES,
+                                 BAUD_PROBE_MIN_LEGIBILITY, DEFAULT_BAUDRATE_CANDIDATES, legibility, probe_order)
+from utils import pattern_matcher
+from utils.metrics import command_label
+from utils.ring_buffer import ByteRingBuffer
+
+# Интервал опроса порта, если цикл событий не умеет следить за дескриптором (Windows)
+POLL_INTERVAL = 0.02
+
+class AsyncSerialConnection:
+    def __init__(self, port, baudrate, logger, recorder=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.logger = logger
+        self.recorder = recorder
+        self.metrics = None         # RunMetrics прогона (задается DLinkReset)
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.conn = None
+        self.rx = ByteRingBuffer(RX_BUFFER_SIZE)
+        self._consumed = 0          # До этого смещения данные уже отданы потребителям
+        self._data_event = None
+        self._reader_fd = None
+        self._poll_task = None
+        self._last_span = (0, 0)
+        self._last_output = ""
+        self._wait_span = (0, 0)
+        self._last_match = None
+
+    async def connect(self):
+        """Устанавливает соединение и подписывает порт на цикл событий."""
+        loop = asyncio.get_running_loop()
+        try:
+            # timeout=0: чтение никогда не блокирует цикл событий
+            self.conn = serial.Serial(self.port, self.baudrate, timeout=0)
+            self.logger.debug(f"🔌 Попытка подключения к {self.port} ({self.baudrate} baud)...")
+            if self.recorder:
+                self.recorder.open()
+                self.logger.info(f"⏺️ Запись сессии в {self.recorder.path}")
+        except Exception as e:
+            self.logger.critical(f"❌(CRITICAL) Ошибка: Не удалось подключиться к порту {self.port}: {e}")
+            raise SystemExit(1)
+
+        self._data_event = asyncio.Event()
+        try:
+            fd = self.conn.fileno()
+            loop.add_reader(fd, self._on_readable)
+            self._reader_fd = fd
+        except (AttributeError, OSError, NotImplementedError):
+            # Нет дескриптора или цикл событий его не поддерживает - опрашиваем порт
+            self._poll_task = loop.create_task(self._poll_loop())
+
+        await asyncio.sleep(1) # Стабилизация
+        self.logger.info(f"✅ Подключение к {self.port} ({self.baudrate} baud) установлено.")
+
+    async def disconnect(self):
+        """Закрывает соединение."""
+        self._stop_reading()
+        if self.recorder:
+            self.recorder.close()
+        if self.conn and self.conn.is_open:
+            self.conn.close()
+            self.logger.info(f"🔌 Соединение с {self.port} закрыто.")
+
+    def _stop_reading(self):
+        if self._reader_fd is not None:
+            asyncio.get_running_loop().remove_reader(self._reader_fd)
+            self._reader_fd = None
+        if self._poll_task:
+            self._poll_task.cancel()
+            self._poll_task = None
+
+    def _on_readable(self):
+        """Вызывается циклом событий, когда в порту есть данные."""
+        try:
+            data = self.conn.read(self.conn.in_waiting or 1)
+        except serial.SerialException as e:
+            self.logger.error(f"❌ Ошибка чтения из порта {self.port}: {e}")
+            self._stop_reading()
+            return
+        self._store(data)
+
+    async def _poll_loop(self):
+        while self.conn and self.conn.is_open:
+            waiting = self.conn.in_waiting
+            if waiting:
+                self._store(self.conn.read(waiting))
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def _store(self, data):
+        if not data:
+            return
+        self.rx.write(data)
+        self.bytes_read += len(data)
+        if self.recorder:
+            self.recorder.record_rx(data)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"📥 Получены сырые данные: {repr(data)}")
+        self._data_event.set()
+
+    async def _wait_data(self, timeout):
+        """Ждет новых данных не дольше timeout секунд."""
+        self._data_event.clear()
+        try:
+            await asyncio.wait_for(self._data_event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def send_raw(self, data_bytes):
+        """Отправляет сырые байты."""
+        if self.conn:
+            self.conn.write(data_bytes)
+            self.bytes_written += len(data_bytes)
+            if self.recorder:
+                self.recorder.record_tx(data_bytes)
+        await asyncio.sleep(0)
+
+    def set_baudrate(self, baudrate):
+        """Меняет скорость порта без переподключения. Принятое на прежней скорости отбрасывается."""
+        if self.conn:
+            # Уже записанные байты должны уйти на прежней скорости
+            self.conn.flush()
+            self.conn.baudrate = baudrate
+            self.conn.reset_input_buffer()
+        self.baudrate = baudrate
+        self._consumed = self.rx.offset
+
+    async def detect_baudrate(self, candidates=None, probe=b'\r', wait=BAUD_PROBE_WAIT):
+        """Подбирает скорость консоли (см. SerialConnection.detect_baudrate)."""
+        original = self.baudrate
+        for rate in probe_order(original, candidates or DEFAULT_BAUDRATE_CANDIDATES):
+            if rate != self.baudrate:
+                self.set_baudrate(rate)
+            start = self._consumed = self.rx.offset
+            await self.send_raw(probe)
+            if await self.read_available(wait):
+                deadline = self.monotonic() + wait
+                while self.monotonic() < deadline and await self.read_available(BAUD_PROBE_QUIET):
+                    pass
+            answer = self.rx.view(start)
+            score = legibility(answer)
+            self.logger.debug(f"🔎 {rate} baud: {len(answer)} байт, читаемых {score:.0%}")
+            if len(answer) >= BAUD_PROBE_MIN_BYTES and score >= BAUD_PROBE_MIN_LEGIBILITY:
+                return rate
+        if self.baudrate != original:
+            self.set_baudrate(original)
+        return None
+
+    def monotonic(self):
+        """Часы цикла событий (по ним обработчики отсчитывают таймауты)."""
+        return asyncio.get_running_loop().time()
+
+    async def sleep(self, seconds):
+        """Пауза без блокировки цикла событий."""
+        await asyncio.sleep(seconds)
+
+    async def read_available(self, timeout=0):
+        """
+        Возвращает еще не прочитанные данные.
+        При timeout > 0 ждет появления данных не дольше timeout секунд.
+        """
+        start = await self._take(timeout)
+        return "" if start is None else self.rx.text(start)
+
+    async def read_bytes(self, timeout=0):
+        """Как read_available, но возвращает сырые байты (двоичные протоколы, ZModem)."""
+        start = await self._take(timeout)
+        return b"" if start is None else bytes(self.rx.view(start))
+
+    async def _take(self, timeout):
+        """Ждет непрочитанные данные и отмечает их прочитанными. Возвращает их начало или None."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.rx.offset == self._consumed:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            await self._wait_data(remaining)
+        start = max(self._consumed, self.rx.first_offset)
+        self._consumed = self.rx.offset
+        return start
+
+    async def wait_for_pattern(self, patterns, timeout=10):
+        """Ждет один из паттернов не дольше timeout секунд и возвращает PatternMatch или None."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        scanner = pattern_matcher.get_matcher(patterns).scanner()
+        start = self._consumed
+        self._wait_span = (start, start)
+        self._last_match = None
+        while True:
+            if self.rx.offset > self._consumed:
+                self._consumed = self.rx.offset
+                self._wait_span = (start, self._consumed)
+                base = max(start, self.rx.first_offset)
+                match = scanner.feed(self.rx.view(base), base)
+                if match:
+                    self._last_match = match
+                    self.logger.debug(f"🎯 Найден паттерн '{match.pattern}' в буфере (позиция {match.start - start}).")
+                    return match
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await self._wait_data(remaining)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            tail = self.rx.text(max(start, self.rx.offset - 200))
+            self.logger.debug(f"⏱️ Таймаут ожидания паттернов {patterns}. Буфер: {tail}...")
+        return None
+
+    async def read_until_pattern(self, patterns, timeout=10):
+        """Читает данные до одного из паттернов или таймаута и возвращает принятый текст."""
+        await self.wait_for_pattern(patterns, timeout)
+        return self.rx.text(*self._wait_span)
+
+    async def send_command_and_wait(self, command, expected_patterns, timeout=10, label=None):
+        """Отправляет команду и ждет один из ожидаемых паттернов (label - см. SerialConnection)."""
+        self.logger.debug(f"📤 Отправка команды: {command if label is None else label}")
+        started = self.monotonic()
+        await self.send_raw(f"{command}\r".encode())
+        match = await self.wait_for_pattern(expected_patterns, timeout)
+        if self.metrics:
+            self.metrics.record_command(label or command_label(command), self.monotonic() - started, match is not None)
+        self._last_span = self._wait_span
+        self._last_output = None
+        if match:
+            pattern = expected_patterns[match.name]
+            self.logger.debug(f"🎯 Команда '{command if label is None else label}' завершена с паттерном '{match.pattern}'.")
+            return pattern
+        self.logger.debug(f"⚠️ Команда '{command if label is None else label}' завершена, но ожидаемый паттерн не найден. Вывод: {self.get_last_output()[-100:]}...")
+        return None
+
+    def get_last_output(self):
+        """Возвращает вывод последней команды."""
+        if self._last_output is None:
+            self._last_output = self.rx.text(*self._last_span)
+        return self._last_output
+
+    def get_last_match(self):
+        """Возвращает PatternMatch последнего успешного ожидания (или None)."""
+        return self._last_match
@@ -1,8 +1,36 @@
 # handlers/boot_menu_handler.py
 """
 Обработчик для работы с Boot Configuration Menu.
+Восстановление без оператора: навигация по меню загрузчика, повышение скорости консоли
+и передача образов по ZModem (utils/zmodem.py).
 """
-import time
+from utils import zmodem
+from utils.firmware_store import FirmwareStore, FirmwareStoreError
+
+# Меню загрузчика по умолчанию. Профиль устройства переопределяет отдельные ключи в "boot_menu".
+DEFAULT_BOOT_MENU = {
+    "menu_prompt": "Please Select",             # приглашение меню
+    "zmodem_key": "Z",                          # пункт загрузки по ZModem
+    "image_prompt": "Image ID",                 # запрос, какой образ принимать
+    "image_ids": {"firmware": "1", "prom": "P"},
+    "images": ["firmware"],                     # что передавать: firmware и/или prom
+    "done_pattern": "Download complete",
+    "fail_pattern": ["Download failed", "Download aborted"],
+    "baudrate_key": "B",                        # null - загрузчик не меняет скорость
+    "baudrate_prompt": "Baud rate",
+    "baudrates": [115200, 57600, 38400],
+    "boot_key": "R",                            # перезагрузка после передачи
+}
+# Ожидание ответа меню (сек)
+MENU_WAIT = 10
+# Ожидание отказа загрузчика от новой скорости (сек)
+BAUD_REJECT_WAIT = 1
+# Ожидание ответа приемника, когда отправлять нечего (сек)
+ZMODEM_POLL = 0.5
+# Молчание приемника, после которого повторяется кадр (сек)
+ZMODEM_TIMEOUT = 5
+# Попыток передачи одного образа: следующая продолжает с позиции, которую назовет приемник
+ZMODEM_ATTEMPTS = 3
 
 class BootMenuHandler:
     def __init__(self, parent):
@@ -13,43 +41,194 @@ class BootMenuHandler:
         self.device_cfg = parent.device_cfg
         self.timeouts = parent.timeouts
 
+    @property
+    def menu(self):
+        """Меню загрузчика текущего профиля (профиль может смениться после определения модели)."""
+        return dict(DEFAULT_BOOT_MENU, **self.device_cfg.get("boot_menu", {}))
+
     def attempt_boot_menu_entry(self):
         self.logger.step("⚠️ Блок 4: Попытка входа в Boot Configuration Menu (Аварийный режим)")
         self.logger.info("⚠️ Пожалуйста, ПЕРЕЗАГРУЗИТЕ устройство для входа в Boot Menu.")
-        
+
         boot_menu_combo_hex = self.device_cfg.get("boot_menu_combination", "33")
         boot_menu_combo_bytes = bytes.fromhex(boot_menu_combo_hex)
-        
-        start_time = time.monotonic()
+
+        start_time = self.connection.monotonic()
         timeout = self.timeouts['boot_menu_wait']
-        
-        while time.monotonic() - start_time < timeout:
-            output = self.connection.read_available()
+
+        while self.connection.monotonic() - start_time < timeout:
+            remaining = timeout - (self.connection.monotonic() - start_time)
+            # Блокирующее ожидание индикатора загрузки (без опроса по таймеру)
+            output = yield self.connection.read_until_pattern(self.patterns['boot_indicators'], timeout=remaining)
             if output:
                 self.logger.debug(f"📥 Данные при ожидании Boot Menu: {output[:100]}...")
                 if any(ind in output for ind in self.patterns['boot_indicators']):
                     self.logger.debug("📥 Обнаружен индикатор загрузки. Отправляем комбинацию для Boot Menu.")
-                    self.connection.send_raw(boot_menu_combo_bytes)
-                    time.sleep(0.5) # Небольшая пауза
-                    
+                    yield self.connection.send_raw(boot_menu_combo_bytes)
+
                     # Ждем индикаторы Boot Menu
-                    menu_output = self.connection.read_until_pattern(
+                    menu_output = yield self.connection.read_until_pattern(
                         self.patterns['boot_menu_indicators'],
                         timeout=20
                     )
-                    
+
                     if any(ind in menu_output for ind in self.patterns['boot_menu_indicators']):
                         self.logger.success("✅ Успешно вошли в Boot Configuration Menu!")
-                        # TODO: Реализовать навигацию по меню и ZModem
-                        # Это сложная часть, требующая эмуляции терминала и работы с ZModem
-                        self.logger.info("ℹ️ Обнаружен Boot Menu. Требуется ручная настройка ZModem (пока не реализовано автоматически).")
-                        self.logger.info("Пожалуйста, вручную выберите 'Download Protocol: [ZModem]' и передайте файлы через ZModem.")
-                        input("Нажмите Enter после завершения ручной передачи и перезагрузки устройства...")
-                        return True
+                        return (yield from self._recover_in_boot_menu())
                     else:
                         self.logger.warning("⚠️ Комбинация отправлена, но Boot Menu не обнаружен.")
-                        
-            time.sleep(0.5)
-            
+
         self.logger.error("❌ Не удалось войти в Boot Configuration Menu!")
         return False
+
+    def _recover_in_boot_menu(self):
+        """Передает образы по ZModem и перезагружает устройство. Возвращает True при успехе."""
+        images = self._zmodem_images()
+        if not images:
+            return False
+        base_baudrate = self.connection.baudrate
+        if self.menu.get("baudrate_key"):
+            yield from self._raise_boot_baudrate()
+
+        for kind, filename, data in images:
+            if not (yield from self._send_image(kind, filename, data)):
+                self.logger.error(f"❌ Не удалось передать {filename} по ZModem.")
+                return False
+
+        self.logger.info("🔄 Образы переданы. Перезагрузка из Boot Menu...")
+        self.parent.metrics.count("reboots")
+        yield from self._menu_command(self.menu["boot_key"], [self.patterns['REBOOTING']])
+        # После перезагрузки загрузчик снова работает на сохраненной скорости
+        self.connection.set_baudrate(base_baudrate)
+        return True
+
+    def _menu_command(self, text, patterns, timeout=MENU_WAIT):
+        """Отправляет выбор в меню и ждет один из паттернов. Возвращает PatternMatch или None."""
+        yield self.connection.send_raw(f"{text}\r".encode())
+        return (yield self.connection.wait_for_pattern(patterns, timeout))
+
+    def _raise_boot_baudrate(self):
+        """Переключает загрузчик на наибольшую принятую скорость из boot_menu.baudrates."""
+        base = self.connection.baudrate
+        for rate in self._baudrate_choices(base):
+            if not (yield from self._menu_command(self.menu["baudrate_key"], [self.menu["baudrate_prompt"]])):
+                self.logger.warning("⚠️ Загрузчик не предложил смену скорости.")
+                return
+            if (yield from self._menu_command(str(rate), [self.patterns['ERROR_GENERIC']], timeout=BAUD_REJECT_WAIT)):
+                self.logger.debug(f"Загрузчик не принял скорость {rate} baud.")
+                yield self.connection.wait_for_pattern([self.menu["menu_prompt"]], MENU_WAIT)
+                continue
+            self.connection.set_baudrate(rate)
+            if self._boot_baudrate_switched(base, rate, (yield self.connection.detect_baudrate([base]))):
+                return
+
+    def _send_image(self, kind, filename, data):
+        for attempt in range(1, ZMODEM_ATTEMPTS + 1):
+            if not (yield from self._select_zmodem(kind)):
+                return False
+            try:
+                sender, elapsed = yield from self._zmodem_transfer(data, filename)
+            except zmodem.ZmodemError as e:
+                self.logger.warning(f"⚠️ ZModem, попытка {attempt}: {e}")
+                yield self.connection.send_raw(zmodem.CANCEL_SEQUENCE)
+                yield self.connection.wait_for_pattern([self.menu["menu_prompt"]], MENU_WAIT)
+                continue
+            match = yield self.connection.wait_for_pattern([self.menu["done_pattern"], self.menu["fail_pattern"]], MENU_WAIT)
+            if self._image_accepted(kind, filename, sender, elapsed, match):
+                return True
+        return False
+
+    def _select_zmodem(self, kind):
+        """Выбирает загрузку по ZModem и образ; приемник загрузчика после этого ждет передачу."""
+        if not (yield from self._menu_command(self.menu["zmodem_key"], [self.menu["image_prompt"]])):
+            self.logger.error("❌ Загрузчик не предложил загрузку по ZModem.")
+            return False
+        yield self.connection.send_raw(f"{self.menu['image_ids'][kind]}\r".encode())
+        return True
+
+    def _zmodem_transfer(self, data, filename):
+        """Передает файл. Возвращает (ZmodemSender, длительность); ошибки - ZmodemError."""
+        sender = zmodem.ZmodemSender(data, filename)
+        self.logger.info(f"📤 ZModem: {filename} ({len(data)} байт, {self.connection.baudrate} baud)...")
+        started = last_reply = self.connection.monotonic()
+        yield self.connection.send_raw(sender.start())
+        while not sender.done:
+            chunk = sender.next_chunk()
+            if chunk:
+                yield self.connection.send_raw(chunk)
+            incoming = yield self.connection.read_bytes(0 if chunk else ZMODEM_POLL)
+            if incoming:
+                sender.feed(incoming)
+                last_reply = self.connection.monotonic()
+            elif not chunk and self.connection.monotonic() - last_reply >= ZMODEM_TIMEOUT:
+                sender.on_timeout()
+                last_reply = self.connection.monotonic()
+        yield self.connection.send_raw(sender.next_chunk())
+        return sender, self.connection.monotonic() - started
+
+    def _baudrate_choices(self, base):
+        return sorted((rate for rate in self.menu["baudrates"] if rate > base), reverse=True)
+
+    def _boot_baudrate_switched(self, base, rate, detected):
+        """Итог проверки новой скорости. False - загрузчик остался на прежней, можно пробовать меньшую."""
+        if detected == rate:
+            self.logger.info(f"⚡ Скорость загрузчика: {base} -> {rate} baud.")
+            return True
+        if detected is None:
+            self.connection.set_baudrate(base)
+            self.logger.warning(f"⚠️ Нет ответа ни на {rate}, ни на {base} baud.")
+            return True
+        self.logger.debug(f"Загрузчик остался на {base} baud.")
+        return False
+
+    def _zmodem_images(self):
+        """Образы для передачи: (тип, имя файла, данные). Пустой список - передавать нечего."""
+        model_info = self.parent.firmware_info.get(self.parent.model, {})
+        filenames = {"prom": model_info.get("prom", {}).get("filename"),
+                     "firmware": model_info.get("firmware", {}).get("final_filename")}
+        images = []
+        for kind in self.menu["images"]:
+            filename = filenames.get(kind)
+            if not filename:
+                self.logger.error(f"❌ В firmware_info.json нет образа '{kind}' для {self.parent.model}.")
+                return []
+            data = self._load_image(filename)
+            if data is None:
+                return []
+            images.append((kind, filename, data))
+        return images
+
+    def _load_image(self, filename):
+        """Образ из хранилища (проверенный по SHA-256) или из папки firmware."""
+        store = self.parent.firmware_store
+        firmware_dir = self.parent.base_dir / "firmware"
+        if store is None and FirmwareStore.is_store(firmware_dir):
+            store = FirmwareStore(firmware_dir)
+        try:
+            if store is not None:
+                return store.open_image(filename)
+            with open(firmware_dir / filename, "rb") as f:
+                return f.read()
+        except (FirmwareStoreError, OSError) as e:
+            self.logger.error(f"❌ Образ {filename} недоступен для ZModem: {e}")
+            return None
+
+    def _image_accepted(self, kind, filename, sender, elapsed, match):
+        if not match or match.name != 0:
+            self.logger.warning(f"⚠️ Загрузчик не подтвердил прием {filename}.")
+            return False
+        rate = sender.transferred / elapsed / 1024 if elapsed else 0
+        resumed = f", продолжено с {sender.start_pos} байт" if sender.start_pos else ""
+        self.logger.success(f"✅ ZModem: {filename} передан за {elapsed:.1f} с ({rate:.1f} КБ/с, "
+                            f"{self.connection.baudrate} baud, повторов: {sender.repositions}{resumed}).")
+        self.parent.report_data["zmodem_transfers"].append({
+            "image": kind,
+            "filename": filename,
+            "bytes": sender.transferred,
+            "resumed_from": sender.start_pos,
+            "seconds": round(elapsed, 2),
+            "kbytes_per_second": round(rate, 1),
+            "baudrate": self.connection.baudrate,
+            "repositions": sender.repositions,
+        })
+        return True
@@ -2,9 +2,13 @@
 """
 Обработчик для работы с CLI.
 """
-import time
 import re
 
+from utils import pattern_matcher
+
+# Интервал повторной отправки Enter при ожидании промпта CLI (сек)
+CLI_ENTER_INTERVAL = 0.5
+
 class CLIHandler:
     def __init__(self, parent):
         self.parent = parent
@@ -17,6 +21,7 @@ class CLIHandler:
         self.credentials = parent.credentials
         self.reset_commands = parent.reset_commands
         self.firmware_info = parent.firmware_info
+        self.interaction = parent.interaction
 
     def init_cli_handler_config(self):
         """Инициализация конфигурации CLI хендлера."""
@@ -26,17 +31,19 @@ class CLIHandler:
     def attempt_cli_entry(self):
         self.logger.step("🖥️ Блок 5: Попытка входа в CLI")
         
-        start_time = time.monotonic()
+        start_time = self.connection.monotonic()
         timeout = self.timeouts['reboot_wait']
         
-        while time.monotonic() - start_time < timeout:
-            # Отправляем Enter для активации промпта
-            self.connection.send_raw(b'\r')
-            time.sleep(0.5)
-            
-            output = self.connection.read_available()
+        entry_patterns = self._entry_patterns()
+        
+        while self.connection.monotonic() - start_time < timeout:
+            # Отправляем Enter для активации промпта и ждем ответ не дольше интервала повтора
+            yield self.connection.send_raw(b'\r')
+            output = yield self.connection.read_until_pattern(entry_patterns, timeout=CLI_ENTER_INTERVAL)
             if output:
                 self.logger.debug(f"📥 Получены данные при попытке входа в CLI: {output[:100]}...")
+                # Баннер CLI и приглашение содержат модель
+                self.parent.identify_model(output)
                 
                 if self.patterns['PRIVILEGED_PROMPT'] in output:
                     self.logger.success("✅ Успешный вход в CLI ('#')!")
@@ -44,9 +51,11 @@ class CLIHandler:
                 elif self.patterns['USER_PROMPT'] in output:
                     self.logger.info("ℹ️ Обнаружен пользовательский промпт '>'. Попытка перейти в привилегированный режим...")
                     # Попробуем enable
-                    self.connection.send_raw(b'enable\r')
-                    time.sleep(1)
-                    enable_output = self.connection.read_available()
+                    yield self.connection.send_raw(b'enable\r')
+                    enable_output = yield self.connection.read_until_pattern(
+                        [self.patterns['PRIVILEGED_PROMPT'], self.patterns['PASSWORD_PROMPT'], self.patterns['USER_PROMPT']],
+                        timeout=self.timeouts['prompt_wait']
+                    )
                     if self.patterns['PRIVILEGED_PROMPT'] in enable_output:
                         self.logger.success("✅ Успешный вход в CLI ('#') после 'enable'!")
                         return "SUCCESS_PRIVILEGED"
@@ -58,14 +67,13 @@ class CLIHandler:
                         
                 if self.patterns['LOGIN_PROMPT'] in output or self.patterns['PASSWORD_PROMPT'] in output:
                     self.logger.info("ℹ️ Обнаружен запрос логина/пароля в CLI.")
-                    login_result = self._handle_login(output)
+                    login_result = yield from self._handle_login(output)
                     if login_result == "SUCCESS_PRIVILEGED":
                         return login_result
                     elif login_result == "SUCCESS_USER":
                         # Нужно выполнить enable
-                        self.connection.send_raw(b'enable\r')
-                        time.sleep(1)
-                        enable_prompt = self.connection.read_until_pattern(
+                        yield self.connection.send_raw(b'enable\r')
+                        enable_prompt = yield self.connection.read_until_pattern(
                             [self.patterns['PASSWORD_PROMPT'], self.patterns['PRIVILEGED_PROMPT']],
                             timeout=self.timeouts['prompt_wait']
                         )
@@ -84,19 +92,45 @@ class CLIHandler:
                         
                 if "Please set a new password" in output:
                     self.logger.info("ℹ️ Требуется установка нового пароля.")
-                    if self._handle_initial_password():
+                    if (yield from self._handle_initial_password()):
                         # После установки пароля снова пытаемся войти
-                        return self.attempt_cli_entry() # Рекурсивный вызов, но с ограничением итераций в run()
-                        
-            time.sleep(0.5)
+                        return (yield from self.attempt_cli_entry()) # Рекурсивный вызов, но с ограничением итераций в run()
             
         self.logger.error("❌ Не удалось войти в CLI!")
         return "FAILED"
 
+    def probe_cli(self):
+        """
+        Быстрая проверка перед продолжением прерванного прогона: устройство отвечает в CLI.
+        Возвращает MAC из 'show switch' или None (CLI не отвечает, вход не удался).
+        """
+        self.logger.step("📒 Проверка CLI перед продолжением прерванного прогона")
+        yield self.connection.send_raw(b'\r')
+        output = yield self.connection.read_until_pattern(self._entry_patterns(), timeout=self.timeouts['prompt_wait'])
+        if not output:
+            self.logger.info("ℹ️ CLI не отвечает.")
+            return None
+        if (yield from self.attempt_cli_entry()) != "SUCCESS_PRIVILEGED":
+            return None
+        return self._probe_mac((yield from self.parent._run_show_command("show switch")))
+
+    def _probe_mac(self, show_switch_output):
+        self.parent.identify_model(show_switch_output)
+        return self.parent.parse_show("show switch", show_switch_output).get("mac_address")
+
+    def _entry_patterns(self):
+        return [
+            self.patterns['PRIVILEGED_PROMPT'],
+            self.patterns['USER_PROMPT'],
+            self.patterns['LOGIN_PROMPT'],
+            self.patterns['PASSWORD_PROMPT'],
+            "Please set a new password",
+        ]
+
     def _handle_login(self, initial_output=""):
         """Обрабатывает логин в CLI."""
         credentials_list = self.credentials.get("cli", [])
-        sorted_credentials = self.stats_manager.sort_by_stats(credentials_list, "credentials")
+        sorted_credentials = self.stats_manager.sort_by_stats(credentials_list, "credentials", self.parent.stats_context())
         
         # Если уже есть вывод с запросом, используем его
         output_buffer = initial_output
@@ -109,47 +143,64 @@ class CLIHandler:
             self.logger.debug(f"Пробуем учетные данные CLI: {cred_id}")
             
             # Если логин требуется
-            if self.patterns['LOGIN_PROMPT'] in output_buffer or "UserName:" in output_buffer:
-                self.connection.send_command_and_wait(login, expected_patterns=[self.patterns['PASSWORD_PROMPT']], timeout=self.timeouts['login_attempt'])
+            if self._login_required(output_buffer):
+                yield self.connection.send_command_and_wait(login, expected_patterns=[self.patterns['PASSWORD_PROMPT']], timeout=self.timeouts['login_attempt'], label="login")
                 output_buffer = self.connection.get_last_output()
             
             # Отправляем пароль
-            self.connection.send_command_and_wait(password, expected_patterns=[self.patterns['USER_PROMPT'], self.patterns['PRIVILEGED_PROMPT'], self.patterns['LOGIN_FAILED_INDICATOR']], timeout=self.timeouts['login_attempt'])
-            final_output = self.connection.get_last_output()
-            
-            if self.patterns['PRIVILEGED_PROMPT'] in final_output and not any(err in final_output for err in self.patterns['LOGIN_FAILED_INDICATOR']):
-                self.logger.success(f"✅ Успешный вход в CLI с привилегиями '#' используя {cred_id}!")
-                self.stats_manager.update_stats("credentials", cred_id, success=True)
-                return "SUCCESS_PRIVILEGED"
-            elif self.patterns['USER_PROMPT'] in final_output and not any(err in final_output for err in self.patterns['LOGIN_FAILED_INDICATOR']):
-                self.logger.success(f"✅ Успешный вход в CLI с пользовательскими правами '>' используя {cred_id}!")
-                self.stats_manager.update_stats("credentials", cred_id, success=True)
-                return "SUCCESS_USER"
-            else:
-                self.logger.debug(f"Попытка входа с {cred_id} не удалась.")
-                self.stats_manager.update_stats("credentials", cred_id, success=False)
-                # Сброс буфера для следующей попытки
-                output_buffer = ""
+            yield self.connection.send_command_and_wait(password, expected_patterns=self._password_expected_patterns(), timeout=self.timeouts['login_attempt'], label="password")
+            login_result = self._check_cli_login(cred_id, self.connection.get_last_output())
+            if login_result:
+                return login_result
+            # Сброс буфера для следующей попытки
+            output_buffer = ""
                 
         self.logger.error("❌ Учетные данные для CLI не подошли.")
         return "FAILED"
+
+    def _login_required(self, output_buffer):
+        return self.patterns['LOGIN_PROMPT'] in output_buffer or "UserName:" in output_buffer
+
+    def _password_expected_patterns(self):
+        return [self.patterns['USER_PROMPT'], self.patterns['PRIVILEGED_PROMPT'], self.patterns['LOGIN_FAILED_INDICATOR']]
+
+    def _check_cli_login(self, cred_id, final_output):
+        """
+        Проверяет результат попытки входа и обновляет статистику.
+        Возвращает "SUCCESS_PRIVILEGED", "SUCCESS_USER" или None.
+        """
+        login_failed = any(err in final_output for err in self.patterns['LOGIN_FAILED_INDICATOR'])
+        if self.patterns['PRIVILEGED_PROMPT'] in final_output and not login_failed:
+            self.logger.success(f"✅ Успешный вход в CLI с привилегиями '#' используя {cred_id}!")
+            self.stats_manager.update_stats("credentials", cred_id, success=True,
+                                            session=self.parent.session_id, context=self.parent.stats_context())
+            return "SUCCESS_PRIVILEGED"
+        elif self.patterns['USER_PROMPT'] in final_output and not login_failed:
+            self.logger.success(f"✅ Успешный вход в CLI с пользовательскими правами '>' используя {cred_id}!")
+            self.stats_manager.update_stats("credentials", cred_id, success=True,
+                                            session=self.parent.session_id, context=self.parent.stats_context())
+            return "SUCCESS_USER"
+        self.logger.debug(f"Попытка входа с {cred_id} не удалась.")
+        self.stats_manager.update_stats("credentials", cred_id, success=False,
+                                        session=self.parent.session_id, context=self.parent.stats_context())
+        return None
         
     def _handle_initial_password(self):
         """Обрабатывает установку нового пароля при первом входе."""
         try:
             # Вводим новый пароль
-            self.connection.send_raw(b'admin\r') # Предполагаем стандартный пароль
-            time.sleep(1)
+            yield self.connection.send_raw(b'admin\r') # Предполагаем стандартный пароль
+            yield self.connection.sleep(1)
             # Подтверждаем пароль
-            self.connection.send_raw(b'admin\r')
-            time.sleep(1)
+            yield self.connection.send_raw(b'admin\r')
+            yield self.connection.sleep(1)
             # Сохраняем
-            self.connection.send_raw(b'save\r')
-            time.sleep(2)
+            yield self.connection.send_raw(b'save\r')
+            yield self.connection.sleep(2)
             # Несколько Enter для выхода из диалога
             for _ in range(3):
-                self.connection.send_raw(b'\r')
-                time.sleep(0.5)
+                yield self.connection.send_raw(b'\r')
+                yield self.connection.sleep(0.5)
             
             self.logger.success("✅ Новый пароль установлен и сохранен.")
             return True
@@ -161,8 +212,7 @@ class CLIHandler:
         self.logger.step("🗑️ Блок 5: Выполнение дополнительного сброса через CLI")
         self.parent.report_data["reset_was_performed"] = True
         
-        commands = self.reset_commands.get(self.device_cfg.get("cli_commands", "cli"), [])
-        sorted_commands = self.stats_manager.sort_by_stats(commands, "reset_commands")
+        sorted_commands = self._sorted_reset_commands()
         
         if not sorted_commands:
              self.logger.error("❌ Нет команд сброса CLI в конфигурации.")
@@ -171,38 +221,19 @@ class CLIHandler:
         success_count = 0
         for cmd_data in sorted_commands:
             cmd = cmd_data['command']
-            cmd_id = cmd_data['id']
             
-            result = self.connection.send_command_and_wait(
+            result = yield self.connection.send_command_and_wait(
                 cmd,
-                expected_patterns=[
-                    self.patterns['SUCCESS_GENERIC'],
-                    self.patterns['PRIVILEGED_PROMPT'],
-                    self.patterns['ERROR_GENERIC'],
-                    self.patterns['CONFIRM_YN']
-                ],
+                expected_patterns=self._reset_expected_patterns(),
                 timeout=self.timeouts['command_default']
             )
             
             if result == self.patterns['CONFIRM_YN']:
                 self.logger.debug("Обнаружено подтверждение (Y/N), отправляем Y...")
-                self.connection.send_raw(b'Y\r')
-                time.sleep(1)
-                # Ждем приглашение и отправляем Enter
-                self.connection.read_until_pattern([self.patterns['PRIVILEGED_PROMPT'], self.patterns['USER_PROMPT']], timeout=5)
-                self.connection.send_raw(b'\r')
+                yield from self.interaction.confirm(self._confirm_done_patterns(), timeout=self.timeouts['command_default'])
 
-            final_output = self.connection.get_last_output()
-            success_found = any(s in final_output for s in self.patterns['SUCCESS_GENERIC']) or self.patterns['PRIVILEGED_PROMPT'] in final_output
-            error_found = any(e in final_output for e in self.patterns['ERROR_GENERIC'])
-            
-            if success_found and not error_found:
-                self.logger.success(f"✅ Команда сброса '{cmd}' выполнена успешно!")
-                self.stats_manager.update_stats("reset_commands", cmd_id, success=True)
+            if self._check_reset_command(cmd_data, self.connection.get_last_output()):
                 success_count += 1
-            else:
-                self.logger.warning(f"⚠️ Команда сброса '{cmd}' не выполнена или выполнена с ошибкой.")
-                self.stats_manager.update_stats("reset_commands", cmd_id, success=False)
         
         self.stats_manager.save_stats("reset_commands")
         
@@ -211,45 +242,122 @@ class CLIHandler:
             return False
             
         # Сохраняем конфигурацию
-        self.connection.send_command_and_wait("save", expected_patterns=[self.patterns['SUCCESS_GENERIC'], self.patterns['PRIVILEGED_PROMPT']], timeout=self.timeouts['command_default'])
-        save_output = self.connection.get_last_output()
-        if any(s in save_output for s in self.patterns['SUCCESS_GENERIC']) or self.patterns['PRIVILEGED_PROMPT'] in save_output:
+        yield self.connection.send_command_and_wait("save", expected_patterns=self._save_expected_patterns(), timeout=self.timeouts['command_default'])
+        if self._save_succeeded(self.connection.get_last_output()):
             self.logger.success("✅ Конфигурация сброса сохранена.")
         else:
             self.logger.warning("⚠️ Возможная ошибка при сохранении конфигурации сброса.")
             
         # Перезагружаем
         self.logger.info("Перезагрузка устройства после сброса CLI...")
-        self.connection.send_raw(b'reboot\r')
-        time.sleep(2)
-        
-        reboot_confirm_output = self.connection.read_available()
-        if self.patterns['CONFIRM_YN'] in reboot_confirm_output:
-             self.connection.send_raw(b'Y\r')
-             time.sleep(1)
-             self.connection.send_raw(b'\r')
-             time.sleep(0.5)
-             self.connection.send_raw(b'\r')
-
-        self.connection.read_until_pattern([self.patterns['REBOOTING']], timeout=10)
+        yield from self.interaction.reboot()
         self.logger.success("✅ Дополнительный сброс через CLI выполнен, перезагрузка инициирована...")
         
         self.parent.report_data["reset_method"] = "CLI"
         self.parent.report_data["reset_status"] = "Success"
         return True
 
+    def _sorted_reset_commands(self):
+        commands = self.reset_commands.get(self.device_cfg.get("cli_commands", "cli"), [])
+        return self.stats_manager.sort_by_stats(commands, "reset_commands", self.parent.stats_context())
+
+    def _reset_expected_patterns(self):
+        return [
+            self.patterns['SUCCESS_GENERIC'],
+            self.patterns['PRIVILEGED_PROMPT'],
+            self.patterns['ERROR_GENERIC'],
+            self.patterns['CONFIRM_YN']
+        ]
+
+    def _confirm_done_patterns(self):
+        """Ответ на подтверждение команды сброса: результат или промпт."""
+        return [p for p in self._reset_expected_patterns() if p != self.patterns['CONFIRM_YN']] + [self.patterns['USER_PROMPT']]
+
+    def _check_reset_command(self, cmd_data, final_output):
+        """Проверяет результат команды сброса и обновляет статистику."""
+        cmd = cmd_data['command']
+        success_found = any(s in final_output for s in self.patterns['SUCCESS_GENERIC']) or self.patterns['PRIVILEGED_PROMPT'] in final_output
+        error_found = any(e in final_output for e in self.patterns['ERROR_GENERIC'])
+
+        if success_found and not error_found:
+            self.logger.success(f"✅ Команда сброса '{cmd}' выполнена успешно!")
+            self.stats_manager.update_stats("reset_commands", cmd_data['id'], success=True,
+                                            session=self.parent.session_id, context=self.parent.stats_context())
+            return True
+        self.logger.warning(f"⚠️ Команда сброса '{cmd}' не выполнена или выполнена с ошибкой.")
+        self.stats_manager.update_stats("reset_commands", cmd_data['id'], success=False,
+                                        session=self.parent.session_id, context=self.parent.stats_context())
+        return False
+
+    def _save_expected_patterns(self):
+        return [self.patterns['SUCCESS_GENERIC'], self.patterns['PRIVILEGED_PROMPT']]
+
+    def _save_succeeded(self, save_output):
+        return any(s in save_output for s in self.patterns['SUCCESS_GENERIC']) or self.patterns['PRIVILEGED_PROMPT'] in save_output
+
     def perform_cli_checks(self):
         self.logger.step("🔍 Блок 6: Проверки состояния устройства в CLI")
-        
-        # --- Проверка 'show switch' ---
-        show_switch_output = self.parent._run_show_command("show switch")
-        # Здесь должна быть функция парсинга, например, из utils
-        # Для демонстрации просто логируем
-        self.logger.info(f"ℹ️ 'show switch' вывод: {show_switch_output[:200]}...")
-        # TODO: Реализовать парсинг и запись в report_data
-        
-        # --- Проверка TFTP ---
-        tftp_status = self._check_tftp_connectivity()
+        # Проверки только читают состояние - их можно выполнять на ускоренной консоли
+        yield from self.interaction.raise_console_speed()
+        try:
+            # --- Проверка 'show switch' ---
+            show_switch_output = yield from self.parent._run_show_command("show switch")
+            # Device Type - самый надежный источник модели
+            self.parent.identify_model(show_switch_output)
+
+            # --- Версии PROM и прошивки, слоты ---
+            firmware_output = yield from self.parent._run_show_command("show firmware information")
+            self._record_device_info(show_switch_output, firmware_output)
+
+            # --- Проверка TFTP ---
+            tftp_status = yield from self._check_tftp_connectivity()
+            self._record_tftp_status(tftp_status)
+        finally:
+            yield from self.interaction.restore_console_speed()
+        return True # Пока всегда успех для демонстрации
+
+    def _record_device_info(self, show_switch_output, firmware_output):
+        """
+        Разбирает 'show switch' и 'show firmware information' в parent.device_state
+        (по нему планируются обновления). В отчет первые значения попадают как *_initial.
+        """
+        switch = self.parent.parse_show("show switch", show_switch_output)
+        slots = self._parse_slots(firmware_output)
+        boot_slot = next((slot for slot in slots if slot["boot"]), None)
+        state = self.parent.device_state
+        state["prom"] = switch.get("prom")
+        state["firmware"] = switch.get("firmware") or (boot_slot["version"] if boot_slot else None)
+        state["slots"] = slots
+
+        report = self.parent.report_data
+        report["model_detected"] = report["model_detected"] or switch.get("model")
+        report["mac_address"] = switch.get("mac_address") or report["mac_address"]
+        if report["prom_initial"] is None:
+            report["prom_initial"] = state["prom"]
+        if report["firmware_initial"] is None:
+            report["firmware_initial"] = state["firmware"]
+        if report["firmware_slots_before_update"] is None:
+            report["firmware_slots_before_update"] = slots
+        self.logger.info(f"ℹ️ Устройство: {report['model_detected']}, MAC {report['mac_address']}, "
+                         f"PROM {state['prom']}, прошивка {state['firmware']}, слотов: {len(slots)}")
+
+    def _parse_slots(self, firmware_output):
+        """Слоты прошивки: [{"id", "version" (None - пустой), "boot"}]."""
+        records = self.parent.parse_show("show firmware information", firmware_output).get("records", [])
+        return [{"id": record["id"], "version": record.get("version"), "boot": bool(record.get("boot"))}
+                for record in records]
+
+    def _record_final_info(self, show_switch_output, dir_output):
+        """Версии после обновлений (*_final) и список файлов (dir_parsed)."""
+        switch = self.parent.parse_show("show switch", show_switch_output)
+        report = self.parent.report_data
+        report["prom_final"] = switch.get("prom")
+        report["firmware_final"] = switch.get("firmware")
+        report["dir_output"] = dir_output
+        report["dir_parsed"] = self.parent.parse_show("dir", dir_output).get("records")
+        self.logger.info(f"ℹ️ Итог: PROM {report['prom_final']}, прошивка {report['firmware_final']}.")
+
+    def _record_tftp_status(self, tftp_status):
         self.parent.report_data["tftp_ping_status"] = tftp_status.get("status")
         self.parent.report_data["tftp_ip_used"] = tftp_status.get("ip")
         
@@ -259,41 +367,51 @@ class CLIHandler:
             # self._setup_default_ip_config()
             # После настройки снова проверяем
             # tftp_status = self._check_tftp_connectivity()
-            
-        return True # Пока всегда успех для демонстрации
 
     def _check_tftp_connectivity(self):
         """Проверяет доступность TFTP сервера."""
-        tftp_ips = self.device_cfg.get("tftp_ip_candidates", ["192.168.1.100"])
+        tftp_ips = self._tftp_candidates()
         
         for ip in tftp_ips:
             self.logger.debug(f"Пингуем TFTP сервер: {ip}")
-            self.connection.send_raw(b'\r') # Очистка
-            time.sleep(0.5)
+            yield self.connection.send_raw(b'\r') # Очистка
+            yield self.connection.read_until_pattern([self.patterns['PRIVILEGED_PROMPT']], timeout=CLI_ENTER_INTERVAL)
             ping_cmd = f"ping {ip}"
-            result = self.connection.send_command_and_wait(
+            result = yield self.connection.send_command_and_wait(
                 ping_cmd,
-                expected_patterns=[self.patterns['PING_SUCCESS'], self.patterns['PING_FAIL'], self.patterns['PRIVILEGED_PROMPT']],
+                expected_patterns=self._ping_expected_patterns(),
                 timeout=self.timeouts['ping_wait']
             )
             
             # Прерываем, если команда зависла
-            self.connection.send_raw(b'\x03') # Ctrl+C
-            time.sleep(1)
-            self.connection.send_raw(b'\r') # Очистка
+            yield self.connection.send_raw(b'\x03') # Ctrl+C
+            yield self.connection.read_until_pattern([self.patterns['PRIVILEGED_PROMPT']], timeout=1)
+            # Очистка: ждем промпт на Enter, чтобы он не попал в ответ следующей команды
+            yield self.connection.send_raw(b'\r')
+            yield self.connection.read_until_pattern([self.patterns['PRIVILEGED_PROMPT']], timeout=CLI_ENTER_INTERVAL)
             
             final_output = self.connection.get_last_output()
             
-            import re
-            if result and re.search(self.patterns['PING_SUCCESS'], final_output):
-                self.logger.success(f"✅ TFTP-сервер доступен по адресу: {ip}")
+            if self._ping_succeeded(ip, result, final_output):
                 return {"status": "Success", "ip": ip}
-            else:
-                self.logger.debug(f"Пинг {ip} не удался.")
                 
         self.logger.error("❌ TFTP-сервер недоступен!")
         return {"status": "Fail", "ip": None}
 
+    def _tftp_candidates(self):
+        return self.device_cfg.get("tftp_ip_candidates", ["192.168.1.100"])
+
+    def _ping_expected_patterns(self):
+        return [self.patterns['PING_SUCCESS'], self.patterns['PING_FAIL'], self.patterns['PRIVILEGED_PROMPT']]
+
+    def _ping_succeeded(self, ip, result, final_output):
+        ping_matcher = pattern_matcher.get_matcher([self.patterns['PING_SUCCESS']])
+        if result and ping_matcher.search(final_output):
+            self.logger.success(f"✅ TFTP-сервер доступен по адресу: {ip}")
+            return True
+        self.logger.debug(f"Пинг {ip} не удался.")
+        return False
+
     def perform_final_checks(self):
         self.logger.step("🏁 Блок 9: Финальные проверки и завершение")
         
@@ -305,8 +423,7 @@ class CLIHandler:
         #     return False
         
         # --- Проверка Активной Прошивки ---
-        # show_firmware_output = self.parent._run_show_command("show firmware information")
-        # TODO: Парсинг и проверка версии
+        # Версии читаются вместе с файловой системой (см. ниже)
         
         # --- Очистка Старого Слота ---
         # TODO: config firmware ... delete
@@ -314,22 +431,27 @@ class CLIHandler:
         # --- Проверка Сети ---
         # TODO: Определение IP, пинги, проверка портов, telnet логин
         
-        # --- Проверка Файловой Системы ---
-        dir_output = self.parent._run_show_command("dir")
-        self.parent.report_data["dir_output"] = dir_output
-        # TODO: Парсинг dir_output
+        # --- Проверка Версий и Файловой Системы ---
+        yield from self.interaction.raise_console_speed()
+        try:
+            show_switch_output = yield from self.parent._run_show_command("show switch")
+            dir_output = yield from self.parent._run_show_command("dir")
+            self._record_final_info(show_switch_output, dir_output)
+        finally:
+            # Пост-команды и 'save' выполняются на исходной скорости, чтобы она не сохранилась
+            yield from self.interaction.restore_console_speed()
         
         # --- Пост-Настройка ---
         post_commands = self.device_cfg.get("post_config_commands", [])
         for cmd in post_commands:
             self.logger.info(f"🔧 Выполнение пост-команды: {cmd}")
-            self.connection.send_command_and_wait(cmd, expected_patterns=[self.patterns['SUCCESS_GENERIC'], self.patterns['PRIVILEGED_PROMPT']], timeout=self.timeouts['command_default'])
+            yield self.connection.send_command_and_wait(cmd, expected_patterns=self._save_expected_patterns(), timeout=self.timeouts['command_default'])
             # TODO: Проверка результата
         
         # --- Финальное Сохранение ---
-        save_result = self.connection.send_command_and_wait("save", expected_patterns=[self.patterns['SUCCESS_GENERIC'], self.patterns['PRIVILEGED_PROMPT']], timeout=self.timeouts['command_default'])
+        save_result = yield self.connection.send_command_and_wait("save", expected_patterns=self._save_expected_patterns(), timeout=self.timeouts['command_default'])
         save_output = self.connection.get_last_output()
-        if save_result and (self.patterns['SUCCESS_GENERIC'] in save_output or self.patterns['PRIVILEGED_PROMPT'] in save_output):
+        if save_result and self._save_succeeded(save_output):
             self.logger.success("💾 Финальное сохранение выполнено успешно.")
         else:
             self.logger.error("❌ Ошибка при финальном сохранении.")
@@ -2,23 +2,73 @@
 """
 Обработчик последовательного соединения.
 """
+import logging
+import math
 import serial
 import time
 
+from utils import pattern_matcher
+from utils.metrics import command_label
+from utils.ring_buffer import ByteRingBuffer
+
+# Максимальная длительность одного блокирующего ожидания данных (сек).
+# Чтение просыпается сразу по приходу байтов, срез лишь ограничивает простой.
+READ_SLICE = 0.25
+# Шаг квантования таймаута порта, чтобы не перенастраивать порт на каждом чтении
+TIMEOUT_STEP = 0.05
+# Емкость буфера приема на порт (байт): память на порт не растет с длиной вывода
+RX_BUFFER_SIZE = 64 * 1024
+# Скорости для автоопределения, если профиль не задает baudrate_candidates
+DEFAULT_BAUDRATE_CANDIDATES = [9600, 115200, 38400, 19200, 57600]
+# Ожидание ответа на Enter при проверке одной скорости (сек)
+BAUD_PROBE_WAIT = 1.0
+# Пауза тишины, после которой ответ на пробу считается полученным (сек)
+BAUD_PROBE_QUIET = 0.2
+# Минимальные объем ответа и доля читаемых байтов, при которых скорость считается верной
+BAUD_PROBE_MIN_BYTES = 3
+BAUD_PROBE_MIN_LEGIBILITY = 0.9
+
+def legibility(data):
+    """
+    Доля читаемых байтов (печатный ASCII, табуляция и перевод строки) в данных.
+    На неверной скорости порт принимает мусор с большим числом непечатных байтов.
+    """
+    if not data:
+        return 0.0
+    readable = sum(1 for b in data if 32 <= b < 127 or b in (9, 10, 13))
+    return readable / len(data)
+
+def probe_order(current, candidates):
+    """Порядок проверки скоростей: сначала текущая, затем остальные кандидаты."""
+    return [current] + [rate for rate in candidates if rate != current]
+
 class SerialConnection:
-    def __init__(self, port, baudrate, logger):
+    def __init__(self, port, baudrate, logger, recorder=None):
+        """recorder - SessionRecorder для записи сессии (None - без записи)."""
         self.port = port
         self.baudrate = baudrate
         self.logger = logger
+        self.recorder = recorder
+        self.metrics = None         # RunMetrics прогона (задается DLinkReset)
+        self.bytes_read = 0
+        self.bytes_written = 0
         self.conn = None
+        self.rx = ByteRingBuffer(RX_BUFFER_SIZE)
+        self._last_span = (0, 0)
         self._last_output = ""
+        self._wait_span = (0, 0)
+        self._read_timeout = None
+        self._last_match = None
 
     def connect(self):
         """Устанавливает соединение."""
         try:
             self.conn = serial.Serial(self.port, self.baudrate, timeout=1)
             self.logger.debug(f"🔌 Попытка подключения к {self.port} ({self.baudrate} baud)...")
-            time.sleep(1) # Стабилизация
+            if self.recorder:
+                self.recorder.open()
+                self.logger.info(f"⏺️ Запись сессии в {self.recorder.path}")
+            self.sleep(1) # Стабилизация
             self.logger.info(f"✅ Подключение к {self.port} ({self.baudrate} baud) установлено.")
         except Exception as e:
             self.logger.critical(f"❌(CRITICAL) Ошибка: Не удалось подключиться к порту {self.port}: {e}")
@@ -26,58 +76,186 @@ class SerialConnection:
 
     def disconnect(self):
         """Закрывает соединение."""
+        if self.recorder:
+            self.recorder.close()
         if self.conn and self.conn.is_open:
             self.conn.close()
             self.logger.info(f"🔌 Соединение с {self.port} закрыто.")
 
+    def set_baudrate(self, baudrate):
+        """Меняет скорость порта без переподключения. Принятое на прежней скорости отбрасывается."""
+        if self.conn:
+            # Уже записанные байты должны уйти на прежней скорости
+            self.conn.flush()
+            self.conn.baudrate = baudrate
+            self.conn.reset_input_buffer()
+        self.baudrate = baudrate
+
+    def detect_baudrate(self, candidates=None, probe=b'\r', wait=BAUD_PROBE_WAIT):
+        """
+        Подбирает скорость консоли: на каждой скорости отправляет probe и оценивает читаемость ответа.
+        Возвращает найденную скорость (порт остается на ней) или None - тогда скорость не меняется.
+        """
+        original = self.baudrate
+        for rate in probe_order(original, candidates or DEFAULT_BAUDRATE_CANDIDATES):
+            if rate != self.baudrate:
+                self.set_baudrate(rate)
+            start = self.rx.offset
+            self.send_raw(probe)
+            if self.read_available(wait):
+                deadline = self.monotonic() + wait
+                while self.monotonic() < deadline and self.read_available(BAUD_PROBE_QUIET):
+                    pass
+            answer = self.rx.view(start)
+            score = legibility(answer)
+            self.logger.debug(f"🔎 {rate} baud: {len(answer)} байт, читаемых {score:.0%}")
+            if len(answer) >= BAUD_PROBE_MIN_BYTES and score >= BAUD_PROBE_MIN_LEGIBILITY:
+                return rate
+        if self.baudrate != original:
+            self.set_baudrate(original)
+        return None
+
+    def monotonic(self):
+        """Часы соединения. Обработчики отсчитывают таймауты по ним, а не по time.monotonic()."""
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        """Пауза. Обработчики вызывают ее вместо time.sleep() (воспроизведение сжимает паузы)."""
+        time.sleep(seconds)
+
     def send_raw(self, data_bytes):
         """Отправляет сырые байты."""
         if self.conn:
             self.conn.write(data_bytes)
+            self.bytes_written += len(data_bytes)
+            if self.recorder:
+                self.recorder.record_tx(data_bytes)
+
+    def _set_read_timeout(self, timeout):
+        """Устанавливает таймаут чтения порта, только если он изменился."""
+        timeout = math.ceil(timeout / TIMEOUT_STEP) * TIMEOUT_STEP
+        if timeout != self._read_timeout:
+            self.conn.timeout = timeout
+            self._read_timeout = timeout
 
-    def read_available(self):
-        """Читает все доступные данные."""
-        if self.conn and self.conn.in_waiting > 0:
-            data = self.conn.read(self.conn.in_waiting)
-            decoded_data = data.decode('utf-8', errors='ignore')
-            self.logger.debug(f"📥 Получены сырые данные: {repr(data)} -> '{decoded_data}'")
-            return decoded_data
-        return ""
+    def _read_chunk(self, timeout):
+        """
+        Блокирующее чтение: ждет первый байт не дольше timeout
+        и сразу возвращает его вместе со всем, что уже накопилось в порту.
+        """
+        if not self.conn:
+            self.sleep(timeout)
+            return b""
+        if self.conn.in_waiting > 0:
+            return self.conn.read(self.conn.in_waiting)
+        if timeout <= 0:
+            return b""
+        self._set_read_timeout(timeout)
+        data = self.conn.read(1)
+        if data and self.conn.in_waiting > 0:
+            data += self.conn.read(self.conn.in_waiting)
+        return data
+
+    def _receive(self, timeout):
+        """Принимает порцию данных в буфер приема. Возвращает число принятых байт."""
+        data = self._read_chunk(timeout)
+        if data:
+            self.rx.write(data)
+            self.bytes_read += len(data)
+            if self.recorder:
+                self.recorder.record_rx(data)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"📥 Получены сырые данные: {repr(data)}")
+        return len(data)
+
+    def read_available(self, timeout=0):
+        """
+        Читает все доступные данные.
+        При timeout > 0 ждет появления данных не дольше timeout секунд.
+        """
+        start = self.rx.offset
+        return self.rx.text(start) if self._receive_any(timeout) else ""
+
+    def read_bytes(self, timeout=0):
+        """Как read_available, но возвращает сырые байты (двоичные протоколы, ZModem)."""
+        start = self.rx.offset
+        self._receive_any(timeout)
+        return bytes(self.rx.view(start))
+
+    def _receive_any(self, timeout):
+        """Принимает доступные данные, при timeout > 0 ждет их не дольше timeout секунд."""
+        deadline = self.monotonic() + timeout
+        received = self._receive(min(timeout, READ_SLICE))
+        while not received and self.monotonic() < deadline:
+            received = self._receive(min(deadline - self.monotonic(), READ_SLICE))
+        return received
+
+    def wait_for_pattern(self, patterns, timeout=10):
+        """
+        Ждет один из паттернов не дольше timeout секунд и возвращает PatternMatch или None.
+        Принятые данные остаются в буфере приема и не декодируются:
+        поиск идет по memoryview буфера, только по новым байтам.
+        """
+        deadline = self.monotonic() + timeout
+        scanner = pattern_matcher.get_matcher(patterns).scanner()
+        start = self.rx.offset
+        self._wait_span = (start, start)
+        self._last_match = None
+        while True:
+            remaining = deadline - self.monotonic()
+            if remaining <= 0:
+                break
+            if not self._receive(min(remaining, READ_SLICE)):
+                continue
+            self._wait_span = (start, self.rx.offset)
+            # Если за время ожидания пришло больше емкости буфера, голова вытеснена
+            base = max(start, self.rx.first_offset)
+            match = scanner.feed(self.rx.view(base), base)
+            if match:
+                self._last_match = match
+                self.logger.debug(f"🎯 Найден паттерн '{match.pattern}' в буфере (позиция {match.start - start}).")
+                return match
+        if self.logger.isEnabledFor(logging.DEBUG):
+            tail = self.rx.text(max(start, self.rx.offset - 200))
+            self.logger.debug(f"⏱️ Таймаут ожидания паттернов {patterns}. Буфер: {tail}...")
+        return None
 
     def read_until_pattern(self, patterns, timeout=10):
         """
         Читает данные до тех пор, пока не найдет один из паттернов или не истечет таймаут.
+        Возвращает принятый за время ожидания текст (не больше емкости буфера приема).
         """
-        start_time = time.monotonic()
-        buffer = ""
-        while time.monotonic() - start_time < timeout:
-            buffer += self.read_available()
-            for pattern in patterns:
-                import re
-                if re.search(pattern, buffer, re.IGNORECASE):
-                    self.logger.debug(f"🎯 Найден паттерн '{pattern}' в буфере.")
-                    return buffer
-            time.sleep(0.1)
-        self.logger.debug(f"⏱️ Таймаут ожидания паттернов {patterns}. Буфер: {buffer[-200:]}...")
-        return buffer
-
-    def send_command_and_wait(self, command, expected_patterns, timeout=10):
+        self.wait_for_pattern(patterns, timeout)
+        return self.rx.text(*self._wait_span)
+
+    def send_command_and_wait(self, command, expected_patterns, timeout=10, label=None):
         """
         Отправляет команду и ждет один из ожидаемых паттернов.
+        label - метка команды для лога и метрик вместо ее текста (логины и пароли).
         """
-        self.logger.debug(f"📤 Отправка команды: {command}")
+        self.logger.debug(f"📤 Отправка команды: {command if label is None else label}")
+        started = self.monotonic()
         self.send_raw(f"{command}\r".encode())
-        output = self.read_until_pattern(expected_patterns, timeout)
-        self._last_output = output
-        # Проверяем, какой паттерн найден
-        import re
-        for pattern in expected_patterns:
-            if re.search(pattern, output, re.IGNORECASE):
-                self.logger.debug(f"🎯 Команда '{command}' завершена с паттерном '{pattern}'.")
-                return pattern
-        self.logger.debug(f"⚠️ Команда '{command}' завершена, но ожидаемый паттерн не найден. Вывод: {output[-100:]}...")
+        match = self.wait_for_pattern(expected_patterns, timeout)
+        if self.metrics:
+            self.metrics.record_command(label or command_label(command), self.monotonic() - started, match is not None)
+        # Вывод команды декодируется лениво, при первом вызове get_last_output()
+        self._last_span = self._wait_span
+        self._last_output = None
+        # Возвращаем исходный элемент списка, совпадение с которым найдено
+        if match:
+            pattern = expected_patterns[match.name]
+            self.logger.debug(f"🎯 Команда '{command if label is None else label}' завершена с паттерном '{match.pattern}'.")
+            return pattern
+        self.logger.debug(f"⚠️ Команда '{command if label is None else label}' завершена, но ожидаемый паттерн не найден. Вывод: {self.get_last_output()[-100:]}...")
         return None
 
     def get_last_output(self):
         """Возвращает вывод последней команды."""
-        return getattr(self, '_last_output', "")
+        if self._last_output is None:
+            self._last_output = self.rx.text(*self._last_span)
+        return self._last_output
+
+    def get_last_match(self):
+        """Возвращает PatternMatch последнего успешного ожидания (или None)."""
+        return self._last_match
@@ -1,8 +1,11 @@
 # handlers/ firmware_handler.py
 """
 Обработчик для обновления PROM и прошивки.
+Профиль с "combined_prom_update": true - загрузчик применяет новый PROM при следующей загрузке:
+PROM только записывается, а перезагрузка выполняется одна, после прошивки.
 """
-import time
+from utils import upgrade_planner
+from utils.versions import Version, parse_version
 
 class FirmwareHandler:
     def __init__(self, parent):
@@ -14,215 +17,261 @@ class FirmwareHandler:
         self.timeouts = parent.timeouts
         self.firmware_info = parent.firmware_info
         self.cli_handler = parent.cli_handler # Для повторного входа
+        self.interaction = parent.interaction
 
     def update_prom(self):
         self.logger.step("💾 Блок 7: Проверка и обновление PROM")
         
-        model_info = self.firmware_info.get(self.parent.model, {})
-        prom_info = model_info.get("prom", {})
-        
-        if not prom_info or not prom_info.get("target_version"):
-            self.logger.info("✅ Обновление PROM не требуется или не поддерживается для данной модели.")
-            return "SKIP"
-            
-        # TODO: Получить текущую версию PROM через CLI (show switch)
-        # current_prom_version = ...
-        current_prom_version = "1.00.B004" # Заглушка
-        target_prom_version = prom_info["target_version"]
-        
-        # Сравнение версий (простое строковое сравнение, в реальности может быть сложнее)
-        if current_prom_version >= target_prom_version and not self.parent.force_reflash:
-            self.logger.info(f"✅ PROM актуален ({current_prom_version}). Обновление не требуется.")
-            return "SKIP"
-            
-        self.logger.info(f"🔄 Требуется обновление PROM с {current_prom_version} до {target_prom_version}.")
-        
-        tftp_ip = self.parent.report_data.get("tftp_ip_used")
-        if not tftp_ip:
-            # Пытаемся получить снова
-            # tftp_status = self.cli_handler._check_tftp_connectivity()
-            # tftp_ip = tftp_status.get("ip")
-            tftp_ip = "192.168.1.100" # Заглушка
-            
-        if not tftp_ip:
-            self.logger.error("❌ Не удалось определить IP адрес TFTP сервера для обновления PROM.")
-            return "ERROR"
-            
-        prom_filename = prom_info["filename"]
-        download_cmd = f"download firmware_fromTFTP {tftp_ip} {prom_filename}"
+        download_cmd = self._plan_prom_update()
+        if download_cmd in ("SKIP", "ERROR"):
+            return download_cmd
         
         self.logger.info(f"🔄 Обновление PROM: {download_cmd}")
-        result = self.connection.send_command_and_wait(
+        result = yield self.connection.send_command_and_wait(
             download_cmd,
-            expected_patterns=[self.patterns['FIRMWARE_DOWNLOAD_SUCCESS'], self.patterns['FIRMWARE_DOWNLOAD_ERROR'], self.patterns['PRIVILEGED_PROMPT']],
+            expected_patterns=self._download_expected_patterns(),
             timeout=self.timeouts['firmware_download']
         )
         
         download_output = self.connection.get_last_output()
-        if result == self.patterns['FIRMWARE_DOWNLOAD_SUCCESS'] or "Success" in download_output:
+        if self._download_succeeded(result, download_output):
             self.logger.success("✅ PROM успешно загружен.")
+            yield from self._wait_prompt_after_download()
         else:
             self.logger.error(f"❌ Ошибка загрузки PROM: {download_output}")
             return "ERROR"
             
         # Сохраняем
-        save_result = self.connection.send_command_and_wait("save", expected_patterns=[self.patterns['SUCCESS_GENERIC'], self.patterns['PRIVILEGED_PROMPT']], timeout=self.timeouts['command_default'])
+        save_result = yield self.connection.send_command_and_wait("save", expected_patterns=self.cli_handler._save_expected_patterns(), timeout=self.timeouts['command_default'])
         if not save_result:
             self.logger.error("❌ Ошибка сохранения после загрузки PROM.")
             return "ERROR"
+
+        if self._stage_prom():
+            return "STAGED"
             
         # Перезагружаем
         self.logger.info("🔄 PROM обновлен. Перезагрузка устройства...")
-        self.connection.send_raw(b'reboot\r')
-        time.sleep(2)
-        
-        reboot_confirm_output = self.connection.read_available()
-        if self.patterns['CONFIRM_YN'] in reboot_confirm_output:
-             self.connection.send_raw(b'Y\r')
-             time.sleep(1)
-             self.connection.send_raw(b'\r')
-             time.sleep(0.5)
-             self.connection.send_raw(b'\r')
-
-        self.connection.read_until_pattern([self.patterns['REBOOTING']], timeout=10)
+        yield from self.interaction.reboot()
         self.logger.success("✅ PROM обновлен, перезагрузка инициирована...")
         
         return "REBOOT_NEEDED"
 
-    def update_firmware(self):
-        self.logger.step("📀 Блок 8: Проверка и обновление основной прошивки")
-        
+    def _stage_prom(self):
+        """
+        True - PROM записан без перезагрузки (профиль поддерживает совмещенное обновление).
+        Если PROM уже записывался так и не применился, обновление идет с отдельной перезагрузкой.
+        """
+        if not self.device_cfg.get("combined_prom_update") or self.parent.report_data["prom_reboot_initiated"]:
+            return False
+        self.logger.success("✅ PROM записан и будет применен при перезагрузке после прошивки.")
+        return True
+
+    def _plan_prom_update(self):
+        """Определяет необходимость обновления PROM. Возвращает команду загрузки, "SKIP" или "ERROR"."""
         model_info = self.firmware_info.get(self.parent.model, {})
-        firmware_cfg = model_info.get("firmware", {})
+        prom_info = model_info.get("prom", {})
         
-        if not firmware_cfg or not firmware_cfg.get("final_version"):
-            self.logger.info("✅ Обновление прошивки не требуется или не указано в конфигурации.")
+        if not prom_info or not prom_info.get("target_version"):
+            self.logger.info("✅ Обновление PROM не требуется или не поддерживается для данной модели.")
             return "SKIP"
             
-        # TODO: Получить информацию о слотах через CLI (show firmware information)
-        # firmware_info_output = self.parent._run_show_command("show firmware information")
-        # slots_info = parse_firmware_slots(firmware_info_output) # Функция из utils
-        
-        # Для демонстрации симулируем
-        slots_info = {
-            "Slot 1": {"version": "1.21.B006", "status": "Boot"},
-            "Slot 2": {"version": "empty", "status": "Empty"}
-        }
-        self.parent.report_data["firmware_slots_before_update"] = str(slots_info)
-        
-        active_slot = None
-        empty_slot = None
-        active_version = None
-        for slot_name, slot_data in slots_info.items():
-            if slot_data["status"] == "Boot":
-                active_slot = slot_name
-                active_version = slot_data["version"]
-            elif slot_data["status"] == "Empty":
-                empty_slot = slot_name
-                
-        if not active_slot:
-            self.logger.error("❌ Не удалось определить активный слот прошивки.")
-            return "ERROR"
-            
-        final_version = firmware_cfg["final_version"]
+        # Версия из 'show switch' (проверки в CLI)
+        current_prom_version = parse_version(self.parent.device_state.get("prom"))
+        target_prom_version = Version(prom_info["target_version"])
+        if current_prom_version is None and not self.parent.force_reflash:
+            self.logger.warning("⚠️ Версия PROM не определена по 'show switch'. Обновление пропущено.")
+            return "SKIP"
         
-        # Сравнение версий
-        if active_version == final_version and not self.parent.force_reflash:
-            self.logger.info(f"✅ Активная прошивка актуальна ({active_version}). Обновление не требуется.")
+        if not self.parent.force_reflash and current_prom_version >= target_prom_version:
+            self.logger.info(f"✅ PROM актуален ({current_prom_version}). Обновление не требуется.")
             return "SKIP"
             
-        self.logger.info(f"🔄 Требуется обновление прошивки с {active_version} до {final_version}.")
-        
-        tftp_ip = self.parent.report_data.get("tftp_ip_used", "192.168.1.100") # Используем сохраненный или дефолтный
-        
-        target_slot = empty_slot if empty_slot else ("Slot 2" if active_slot == "Slot 1" else "Slot 1")
-        self.logger.info(f"Целевой слот для загрузки: {target_slot}")
+        current_label = current_prom_version or "неизвестной версии"
+        self.logger.info(f"🔄 Требуется обновление PROM с {current_label} до {target_prom_version}.")
         
-        # --- Проверка необходимости промежуточной прошивки ---
-        intermediate_needed = False
-        intermediate_version = firmware_cfg.get("intermediate_version")
-        final_filename = firmware_cfg["final_filename"]
+        # Адрес TFTP-сервера, ответившего на ping в проверках CLI
+        tftp_ip = self.parent.report_data.get("tftp_ip_used")
+        if not tftp_ip:
+            self.logger.error("❌ TFTP-сервер недоступен: загрузка PROM невозможна.")
+            return "ERROR"
+            
+        prom_filename = prom_info["filename"]
+        if not self._image_ready("prom", str(target_prom_version), prom_filename):
+            return "ERROR"
+        return f"download firmware_fromTFTP {tftp_ip} {prom_filename}"
+
+    def _download_expected_patterns(self):
+        return [self.patterns['FIRMWARE_DOWNLOAD_SUCCESS'], self.patterns['FIRMWARE_DOWNLOAD_ERROR'], self.patterns['PRIVILEGED_PROMPT']]
+
+    def _wait_prompt_after_download(self):
+        """Коммутатор принимает следующую команду только после промпта, выведенного вслед за 'success'."""
+        yield self.connection.read_until_pattern([self.patterns['PRIVILEGED_PROMPT']], timeout=self.timeouts['command_default'])
+
+    def _download_succeeded(self, result, download_output):
+        return result == self.patterns['FIRMWARE_DOWNLOAD_SUCCESS'] or "Success" in download_output
+
+    def update_firmware(self):
+        self.logger.step("📀 Блок 8: Проверка и обновление основной прошивки")
         
-        # Логика выбора файла (упрощена)
-        if intermediate_version and active_version < intermediate_version and active_version < final_version:
-            intermediate_needed = True
-            filename_to_download = firmware_cfg["intermediate_filename"]
-            self.logger.info(f"🔄 Требуется промежуточная прошивка: {intermediate_version}")
-        else:
-            filename_to_download = final_filename
-            self.logger.info(f"🔄 Загрузка финальной прошивки: {final_version}")
+        plan = self._plan_firmware_update()
+        if plan == "SKIP" and self.parent.report_data["prom_update_staged"]:
+            # Прошивка актуальна, но записанный PROM применится только после перезагрузки
+            self.logger.info("🔄 Перезагрузка для применения PROM...")
+            yield from self.interaction.reboot()
+            return "PROM_REBOOT_NEEDED"
+        if plan in ("SKIP", "ERROR"):
+            return plan
+        target_slot = plan["target_slot"]
             
         # --- Очистка целевого слота, если он не пуст ---
-        if not empty_slot:
+        if not plan["empty_slot"]:
             self.logger.info(f"🗑️ Очистка целевого слота {target_slot}...")
-            delete_cmd = f"config firmware image_id {target_slot.split()[1]} delete"
-            self.connection.send_command_and_wait(delete_cmd, expected_patterns=[self.patterns['CONFIRM_YN'], self.patterns['SUCCESS_GENERIC'], self.patterns['PRIVILEGED_PROMPT']], timeout=self.timeouts['command_default'])
+            yield self.connection.send_command_and_wait(plan["delete_cmd"], expected_patterns=self._delete_expected_patterns(), timeout=self.timeouts['command_default'])
             delete_confirm = self.connection.get_last_output()
             if self.patterns['CONFIRM_YN'] in delete_confirm:
-                self.connection.send_raw(b'Y\r')
-                time.sleep(1)
-                self.connection.send_raw(b'\r')
-                time.sleep(0.5)
-                self.connection.send_raw(b'\r')
-                # Ждем завершения
-                self.connection.read_until_pattern([self.patterns['SUCCESS_GENERIC'], self.patterns['PRIVILEGED_PROMPT']], timeout=10)
+                # Ждем завершения удаления
+                yield from self.interaction.confirm(self.cli_handler._save_expected_patterns(), timeout=self.timeouts['command_default'])
                 self.logger.success(f"✅ Слот {target_slot} очищен.")
             else:
                 self.logger.warning(f"⚠️ Очистка слота {target_slot} может не потребоваться или уже выполнена.")
         
         # --- Загрузка прошивки ---
-        image_id = target_slot.split()[1]
-        download_cmd = f"download firmware_fromTFTP {tftp_ip} {filename_to_download} image_id {image_id}"
-        
-        self.logger.info(f"🔄 Загрузка прошивки: {download_cmd}")
-        result = self.connection.send_command_and_wait(
-            download_cmd,
-            expected_patterns=[self.patterns['FIRMWARE_DOWNLOAD_SUCCESS'], self.patterns['FIRMWARE_DOWNLOAD_ERROR'], self.patterns['PRIVILEGED_PROMPT']],
+        self.logger.info(f"🔄 Загрузка прошивки: {plan['download_cmd']}")
+        result = yield self.connection.send_command_and_wait(
+            plan["download_cmd"],
+            expected_patterns=self._download_expected_patterns(),
             timeout=self.timeouts['firmware_download']
         )
         
         download_output = self.connection.get_last_output()
-        if result == self.patterns['FIRMWARE_DOWNLOAD_SUCCESS'] or "Success" in download_output:
-            self.logger.success(f"✅ Прошивка {filename_to_download} успешно загружена в {target_slot}.")
+        if self._download_succeeded(result, download_output):
+            self.logger.success(f"✅ Прошивка {plan['filename']} успешно загружена в {target_slot}.")
+            yield from self._wait_prompt_after_download()
         else:
             self.logger.error(f"❌ Ошибка загрузки прошивки: {download_output}")
             return "ERROR"
             
         # --- Установка загруженной прошивки как загрузочной ---
-        bootup_cmd = f"config firmware image_id {image_id} boot_up"
-        self.connection.send_command_and_wait(bootup_cmd, expected_patterns=[self.patterns['SUCCESS_GENERIC'], self.patterns['PRIVILEGED_PROMPT']], timeout=self.timeouts['command_default'])
+        yield self.connection.send_command_and_wait(plan["bootup_cmd"], expected_patterns=self.cli_handler._save_expected_patterns(), timeout=self.timeouts['command_default'])
         bootup_output = self.connection.get_last_output()
-        if any(s in bootup_output for s in self.patterns['SUCCESS_GENERIC']) or self.patterns['PRIVILEGED_PROMPT'] in bootup_output:
+        if self.cli_handler._save_succeeded(bootup_output):
             self.logger.success(f"✅ Прошивка в {target_slot} установлена как загрузочная.")
         else:
             self.logger.error(f"❌ Ошибка установки прошивки как загрузочной: {bootup_output}")
             return "ERROR"
             
         # --- Сохранение конфигурации ---
-        save_result = self.connection.send_command_and_wait("save", expected_patterns=[self.patterns['SUCCESS_GENERIC'], self.patterns['PRIVILEGED_PROMPT']], timeout=self.timeouts['command_default'])
+        save_result = yield self.connection.send_command_and_wait("save", expected_patterns=self.cli_handler._save_expected_patterns(), timeout=self.timeouts['command_default'])
         if not save_result:
             self.logger.error("❌ Ошибка сохранения после загрузки прошивки.")
             return "ERROR"
             
         # --- Перезагрузка ---
         self.logger.info("🔄 Прошивка обновлена. Перезагрузка устройства...")
-        self.connection.send_raw(b'reboot\r')
-        time.sleep(2)
-        
-        reboot_confirm_output = self.connection.read_available()
-        if self.patterns['CONFIRM_YN'] in reboot_confirm_output:
-             self.connection.send_raw(b'Y\r')
-             time.sleep(1)
-             self.connection.send_raw(b'\r')
-             time.sleep(0.5)
-             self.connection.send_raw(b'\r')
-
-        self.connection.read_until_pattern([self.patterns['REBOOTING']], timeout=10)
+        yield from self.interaction.reboot()
         self.logger.success("✅ Прошивка обновлена, перезагрузка инициирована...")
         
+        self._after_firmware_reboot(plan)
+        return "REBOOT_NEEDED"
+
+    def _plan_firmware_update(self):
+        """
+        Определяет необходимость и параметры обновления прошивки.
+        Возвращает словарь с планом, "SKIP" или "ERROR".
+        """
+        model_info = self.firmware_info.get(self.parent.model, {})
+        firmware_cfg = model_info.get("firmware", {})
+        
+        if not firmware_cfg or not firmware_cfg.get("final_version"):
+            self.logger.info("✅ Обновление прошивки не требуется или не указано в конфигурации.")
+            return "SKIP"
+            
+        # Слоты из 'show firmware information' (проверки в CLI)
+        slots = self.parent.device_state.get("slots", [])
+        active_slot = next((slot for slot in slots if slot["boot"]), None)
+        empty_slot = next((slot for slot in slots if not slot["version"]), None)
+                
+        if not active_slot:
+            self.logger.error("❌ Не удалось определить активный слот прошивки.")
+            return "ERROR"
+            
+        active_version = parse_version(active_slot["version"])
+        if active_version is None:
+            self.logger.error(f"❌ Не удалось разобрать версию активной прошивки: {active_slot['version']}")
+            return "ERROR"
+        final_version = firmware_cfg["final_version"]
+
+        upgrade = upgrade_planner.plan_upgrade(
+            active_version, firmware_cfg, force=self.parent.force_reflash,
+            flash_seconds=self.timeouts.get("flash_estimate", upgrade_planner.FLASH_ESTIMATE),
+            reboot_seconds=self.timeouts.get("reboot_estimate", upgrade_planner.REBOOT_ESTIMATE))
+        if upgrade is None:
+            self.logger.error(f"❌ Нет допустимого пути обновления с {active_version} до {final_version} "
+                              "(firmware_info.json: min_from/max_from образов).")
+            return "ERROR"
+        if not upgrade.steps:
+            self.logger.info(f"✅ Активная прошивка актуальна ({active_version}). Обновление не требуется.")
+            return "SKIP"
+
+        self.logger.info(f"🗺️ План обновления прошивки: {upgrade.describe()} "
+                         f"(перезагрузок: {upgrade.reboots}, ~{upgrade.estimated_seconds / 60:.0f} мин)")
+        if self.parent.report_data["firmware_upgrade_plan"] is None:
+            self.parent.report_data["firmware_upgrade_plan"] = upgrade.to_dict()
+        
+        # Адрес TFTP-сервера, ответившего на ping в проверках CLI; без него слот не трогаем
+        tftp_ip = self.parent.report_data.get("tftp_ip_used")
+        if not tftp_ip:
+            self.logger.error("❌ TFTP-сервер недоступен: загрузка прошивки невозможна.")
+            return "ERROR"
+
+        # Пустой слот, иначе другой занятый; устройство с одним слотом перезаписывает активный
+        others = [slot for slot in slots if slot is not active_slot]
+        image_id = (empty_slot or (others[0] if others else active_slot))["id"]
+        target_slot = f"image_id {image_id}"
+        self.logger.info(f"Целевой слот для загрузки: {target_slot}")
+        
+        # --- Первый шаг плана; следующие - после перезагрузки и повторных проверок в CLI ---
+        step = upgrade.steps[0]
+        intermediate_needed = len(upgrade.steps) > 1
+        filename_to_download = step.filename
+        version_to_download = str(step.version)
+        if intermediate_needed:
+            self.logger.info(f"🔄 Требуется промежуточная прошивка: {version_to_download}")
+        else:
+            self.logger.info(f"🔄 Загрузка финальной прошивки: {final_version}")
+
+        if not self._image_ready("firmware", version_to_download, filename_to_download):
+            return "ERROR"
+            
+        return {
+            "target_slot": target_slot,
+            "empty_slot": empty_slot["id"] if empty_slot else None,
+            "image_id": image_id,
+            "filename": filename_to_download,
+            "intermediate_needed": intermediate_needed,
+            "delete_cmd": f"config firmware image_id {image_id} delete",
+            "download_cmd": f"download firmware_fromTFTP {tftp_ip} {filename_to_download} image_id {image_id}",
+            "bootup_cmd": f"config firmware image_id {image_id} boot_up",
+        }
+
+    def _image_ready(self, kind, version, filename):
+        """Проверяет образ в хранилище до отправки команды загрузки (если хранилище задано)."""
+        store = self.parent.firmware_store
+        if store is None:
+            return True
+        problem = store.check(self.parent.model, kind, version, filename)
+        if problem:
+            self.logger.error(f"❌ Образ {filename} ({version}) не готов к загрузке: {problem}")
+            return False
+        self.logger.debug(f"Образ {filename} ({version}) проверен в хранилище.")
+        return True
+
+    def _delete_expected_patterns(self):
+        return [self.patterns['CONFIRM_YN'], self.patterns['SUCCESS_GENERIC'], self.patterns['PRIVILEGED_PROMPT']]
+
+    def _after_firmware_reboot(self, plan):
         # --- Если это была промежуточная прошивка, нужно будет снова обновить ---
-        if intermediate_needed and filename_to_download == firmware_cfg["intermediate_filename"]:
+        if plan["intermediate_needed"]:
             self.logger.info("ℹ️ Была загружена промежуточная прошивка. После перезагрузки потребуется загрузить финальную.")
             # При следующем входе в CLI будет снова вызван update_firmware
-            
-        return "REBOOT_NEEDED"
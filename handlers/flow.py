@@ -0,0 +1,48 @@
+# handlers/flow.py
+"""
+Выполнение сценариев обработчиков с синхронным и асинхронным подключением.
+Сценарий - генератор: каждый вызов ввода-вывода подключения он отдает через yield
+и получает обратно результат, вложенные сценарии вызываются через yield from:
+
+    result = yield self.connection.send_command_and_wait(command, patterns, timeout=10)
+    output = yield from self.parent._run_show_command("show switch")
+
+С SerialConnection вызов уже выполнен - run() просто возвращает результат в сценарий.
+С AsyncSerialConnection вызов возвращает корутину - run_async() ожидает ее.
+Поэтому логика каждого шага написана один раз (как движок utils/zmodem.py без ввода-вывода),
+а DLinkReset и AsyncDLinkReset отличаются только подключением и способом выполнения.
+Синхронные методы подключения (monotonic, set_baudrate, get_last_output) вызываются без yield.
+"""
+import inspect
+
+
+def run(flow):
+    """Выполняет сценарий с синхронным подключением. Возвращает результат сценария."""
+    try:
+        value = next(flow)
+        while True:
+            if inspect.isawaitable(value):
+                value.close()
+                raise TypeError("Сценарий отдал корутину при синхронном выполнении (нужен run_async)")
+            value = flow.send(value)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_async(flow):
+    """
+    Выполняет сценарий в цикле событий: корутины ожидаются, остальные значения возвращаются
+    в сценарий как есть. Ошибка ожидания передается в сценарий (его try/finally срабатывают).
+    """
+    try:
+        value = next(flow)
+        while True:
+            if inspect.isawaitable(value):
+                try:
+                    value = await value
+                except BaseException as e:
+                    value = flow.throw(e)
+                    continue
+            value = flow.send(value)
+    except StopIteration as stop:
+        return stop.value
@@ -0,0 +1,145 @@
+# handlers/interaction.py
+"""
+Общие диалоги с устройством: подтверждение (Y/N), перезагрузка и смена скорости консоли.
+Каждый шаг ждет фактический ответ устройства вместо фиксированных пауз;
+длительность шагов пишется в лог и в метрики команд ('reboot', 'confirm').
+Шаги - сценарии handlers/flow.py: вызываются из других сценариев через yield from.
+"""
+from handlers.connection import DEFAULT_BAUDRATE_CANDIDATES
+
+# Ожидание запроса (Y/N) или начала перезагрузки после 'reboot' (сек)
+REBOOT_PROMPT_WAIT = 10
+# Команда смены скорости консоли (профиль может задать свою в console_speed_command)
+CONSOLE_SPEED_COMMAND = "config serial_port baudrate {baudrate}"
+# Ожидание ответа на команду смены скорости (сек)
+CONSOLE_SWITCH_WAIT = 3
+# Ожидание ответа на Enter при проверке новой скорости (сек)
+CONSOLE_PROBE_WAIT = 1.0
+
+
+class Interaction:
+    def __init__(self, parent):
+        self.parent = parent
+        self.logger = parent.logger
+        self.connection = parent.connection
+        self.patterns = parent.patterns
+        self.device_cfg = parent.device_cfg
+        self._console_base = None   # Скорость до ускорения консоли (None - консоль не ускорена)
+
+    def confirm(self, done_patterns, timeout=10):
+        """
+        Отвечает 'Y' на запрос (Y/N) и ждет один из done_patterns (результат или промпт).
+        Возвращает найденный паттерн или None; вывод - connection.get_last_output().
+        """
+        started = self.connection.monotonic()
+        result = yield self.connection.send_command_and_wait("Y", expected_patterns=done_patterns, timeout=timeout, label="confirm")
+        self._log_step("Подтверждение", started, result)
+        return result
+
+    def reboot(self):
+        """Отправляет 'reboot', подтверждает при запросе и ждет начала перезагрузки."""
+        started = self.connection.monotonic()
+        self.parent.metrics.count("reboots")
+        result = yield self.connection.send_command_and_wait(
+            "reboot",
+            expected_patterns=self._reboot_patterns(),
+            timeout=REBOOT_PROMPT_WAIT
+        )
+        if result == self.patterns['CONFIRM_YN']:
+            result = yield from self.confirm([self.patterns['REBOOTING']], timeout=REBOOT_PROMPT_WAIT)
+        return self._reboot_started(started, result)
+
+    def detect_baudrate(self):
+        """Определяет скорость консоли по читаемому ответу на Enter и переключает порт на нее."""
+        configured = self.connection.baudrate
+        candidates = self.device_cfg.get("baudrate_candidates", DEFAULT_BAUDRATE_CANDIDATES)
+        self.logger.info(f"🔎 Определение скорости консоли ({', '.join(map(str, candidates))})...")
+        return self._baudrate_detected(configured, (yield self.connection.detect_baudrate(candidates)))
+
+    def raise_console_speed(self):
+        """
+        Поднимает скорость консоли до parent.console_baudrate на время сессии (в привилегированном CLI).
+        Скорость не сохраняется в конфигурацию: restore_console_speed() возвращает прежнюю до 'save'.
+        Возвращает True, если консоль работает на новой скорости.
+        """
+        rate = self.parent.console_baudrate
+        if not rate or self._console_base is not None or rate == self.connection.baudrate:
+            return False
+        base = self.connection.baudrate
+        if not (yield from self._switch_console_speed(rate)):
+            return False
+        self._console_base = base
+        self.parent.report_data["console_baudrate"] = rate
+        return True
+
+    def restore_console_speed(self):
+        """Возвращает скорость консоли, действовавшую до raise_console_speed()."""
+        if self._console_base is None:
+            return True
+        base, self._console_base = self._console_base, None
+        self.parent.report_data["console_baudrate"] = None
+        return (yield from self._switch_console_speed(base))
+
+    def _switch_console_speed(self, rate):
+        """
+        Меняет скорость на устройстве, затем на порту, и проверяет ответ на новой скорости.
+        Если ответа нет, скорость консоли подбирается между новой и прежней.
+        """
+        old = self.connection.baudrate
+        started = self.connection.monotonic()
+        command = self._console_speed_command(rate)
+        result = yield self.connection.send_command_and_wait(command, self._console_switch_patterns(), timeout=CONSOLE_SWITCH_WAIT)
+        if not self._console_switch_accepted(result, rate):
+            return False
+        self.connection.set_baudrate(rate)
+        detected = yield self.connection.detect_baudrate([old], wait=CONSOLE_PROBE_WAIT)
+        return self._console_switched(started, old, rate, detected)
+
+    def _baudrate_detected(self, configured, detected):
+        self.parent.report_data["baudrate_detected"] = detected
+        if detected is None:
+            self.logger.warning(f"⚠️ Скорость консоли не определена (нет читаемого ответа), остаемся на {configured} baud.")
+        elif detected != configured:
+            self.logger.warning(f"⚠️ Консоль работает на {detected} baud вместо {configured}, порт переключен.")
+        else:
+            self.logger.success(f"✅ Скорость консоли {detected} baud подтверждена.")
+        return detected
+
+    def _console_speed_command(self, rate):
+        return self.device_cfg.get("console_speed_command", CONSOLE_SPEED_COMMAND).format(baudrate=rate)
+
+    def _console_switch_patterns(self):
+        # Промпт не ждем: запоздавший промпт предыдущей команды переключил бы порт раньше устройства
+        return [self.patterns['SUCCESS_GENERIC'], self.patterns['ERROR_GENERIC']]
+
+    def _console_switch_accepted(self, result, rate):
+        if result == self.patterns['ERROR_GENERIC']:
+            self.logger.warning(f"⚠️ Устройство отклонило смену скорости консоли на {rate} baud.")
+            return False
+        return True
+
+    def _console_switched(self, started, old, rate, detected):
+        self._log_step("Смена скорости консоли", started, detected == rate)
+        if detected == rate:
+            self.logger.info(f"⚡ Скорость консоли: {old} -> {rate} baud.")
+            return True
+        if detected == old:
+            self.logger.warning(f"⚠️ Нет ответа на {rate} baud, консоль остается на {old} baud.")
+        else:
+            self.connection.set_baudrate(old)
+            self.logger.error(f"❌ Консоль не отвечает ни на {rate}, ни на {old} baud.")
+        return False
+
+    def _reboot_patterns(self):
+        return [self.patterns['CONFIRM_YN'], self.patterns['REBOOTING']]
+
+    def _reboot_started(self, started, result):
+        self._log_step("Перезагрузка", started, result)
+        if result != self.patterns['REBOOTING']:
+            self.logger.warning("⚠️ Устройство не подтвердило начало перезагрузки.")
+            return False
+        return True
+
+    def _log_step(self, name, started, result):
+        status = "ответ получен" if result else "без ответа"
+        self.logger.debug(f"⏱️ {name}: {self.connection.monotonic() - started:.2f} с ({status}).")
@@ -2,9 +2,15 @@
 """
 Обработчик для работы с режимом Password Recovery.
 """
-import time
 import re
 
+# Пауза между комбинациями при переборе (сек): ожидание индикатора Recovery после каждой
+COMBO_INTERVAL = 0.5
+# Интервал повторной отправки выученной комбинации внутри ее окна (сек)
+KEY_REPEAT_INTERVAL = 0.1
+# Запас к выученному окну задержек с каждой стороны (сек)
+KEY_WINDOW_MARGIN = 0.5
+
 class RecoveryHandler:
     def __init__(self, parent):
         self.parent = parent
@@ -16,88 +22,177 @@ class RecoveryHandler:
         self.stats_manager = parent.stats_manager
         self.credentials = parent.credentials
         self.reset_commands = parent.reset_commands
+        self.interaction = parent.interaction
+        # Отправленные комбинации (combo_data, задержка, время отправки, интервал ожидания) -
+        # учитываются, когда ожидание Recovery завершено
+        self.sent_combinations = []
 
     def attempt_recovery_entry(self):
         self.logger.step("🔄 Блок 2: Попытка входа в Password Recovery Mode")
         self.logger.info("⚠️ Пожалуйста, ПЕРЕЗАГРУЗИТЕ устройство сейчас.")
         
-        boot_detected = self._monitor_boot_and_send_combinations()
+        output = yield from self._monitor_boot_and_send_combinations()
         
-        if not boot_detected:
+        if output is None:
             self.logger.warning("⚠️ Индикаторы загрузки не найдены... Переход к CLI.")
             return "CLI_FALLBACK"
 
-        output = self.connection.read_until_pattern(
-            [p for p in self.patterns['recovery_indicators']],
-            timeout=60
-        )
+        if not self._recovery_entered(output):
+            output = yield self.connection.read_until_pattern(
+                [p for p in self.patterns['recovery_indicators']],
+                timeout=60
+            )
+        self._settle_combinations(self._recovery_entered(output))
         
-        if any(ind in output for ind in self.patterns['recovery_indicators']):
+        if self._recovery_entered(output):
             self.logger.success("✅ Успешно вошли в Password Recovery Mode!")
             
-            self.connection.send_raw(b'\r')
-            time.sleep(1)
+            yield self.connection.send_raw(b'\r')
             
-            prompt_output = self.connection.read_until_pattern(
-                [self.patterns['USER_PROMPT'], self.patterns['LOGIN_PROMPT'], self.patterns['PASSWORD_PROMPT']],
+            prompt_output = yield self.connection.read_until_pattern(
+                self._recovery_prompt_patterns(),
                 timeout=self.timeouts['prompt_wait']
             )
-            
-            if self.patterns['USER_PROMPT'] in prompt_output:
-                self.logger.info("✅ Доступ получен (пароля нет)!")
-                self.parent.report_data["reset_method"] = "Recovery (No Password)"
-                return "SUCCESS"
-            elif self.patterns['LOGIN_PROMPT'] in prompt_output or self.patterns['PASSWORD_PROMPT'] in prompt_output:
-                self.logger.info("ℹ️ Обнаружен запрос логина/пароля.")
-                return "AUTH_NEEDED"
-            else:
-                self.logger.warning("⚠️ Recovery Mode не отвечает после входа.")
-                return "CLI_FALLBACK"
+            return self._classify_recovery_prompt(prompt_output)
         else:
             self.logger.warning("⚠️ Не удалось войти в Recovery Mode. Переход к CLI.")
             return "CLI_FALLBACK"
 
+    def _recovery_prompt_patterns(self):
+        return [self.patterns['USER_PROMPT'], self.patterns['LOGIN_PROMPT'], self.patterns['PASSWORD_PROMPT']]
+
+    def _classify_recovery_prompt(self, prompt_output):
+        """Определяет результат входа в Recovery Mode по ответу на Enter."""
+        if self.patterns['USER_PROMPT'] in prompt_output:
+            self.logger.info("✅ Доступ получен (пароля нет)!")
+            self.parent.report_data["reset_method"] = "Recovery (No Password)"
+            return "SUCCESS"
+        elif self.patterns['LOGIN_PROMPT'] in prompt_output or self.patterns['PASSWORD_PROMPT'] in prompt_output:
+            self.logger.info("ℹ️ Обнаружен запрос логина/пароля.")
+            return "AUTH_NEEDED"
+        else:
+            self.logger.warning("⚠️ Recovery Mode не отвечает после входа.")
+            return "CLI_FALLBACK"
+
+    def _recovery_entered(self, output):
+        return any(ind in output for ind in self.patterns['recovery_indicators'])
+
     def _monitor_boot_and_send_combinations(self):
-        combinations = self.device_cfg.get("recovery_combinations", [])
-        sorted_combinations = self.stats_manager.sort_by_stats(combinations, "recovery_keys")
-        
-        start_time = time.monotonic()
-        timeout = self.timeouts['reboot_wait']
-        
-        while time.monotonic() - start_time < timeout:
-            output = self.connection.read_available()
-            if output:
-                if any(ind in output for ind in self.patterns['boot_indicators']):
-                    self.logger.debug(f"📥 Получен индикатор загрузки.")
-                    if self.parent.interaction_start_time is None:
-                        self.parent.interaction_start_time = time.monotonic()
-                        self.parent.report_data["interaction_start_time"] = self.parent.interaction_start_time
-                    
-                    self._check_model_indicator(output)
-
-                    for combo_data in sorted_combinations:
-                        combo_bytes = bytes.fromhex(combo_data['hex'])
-                        self.logger.debug(f"📤 Отправлена комбинация: {combo_data['id']} (HEX: {combo_data['hex']})")
-                        self.connection.send_raw(combo_bytes)
-                        time.sleep(0.5)
-                    return True
-            time.sleep(0.1)
-        return False
+        """
+        Ждет индикатор загрузки и отправляет комбинации входа в Recovery.
+        Сначала - выученную для модели комбинацию в выученном окне, затем остальные по очереди.
+        Отправка прекращается, как только появился индикатор Recovery. Результаты комбинаций
+        учитываются позже (_settle_combinations): индикатор может прийти и после перебора.
+        Возвращает принятый после индикатора загрузки текст (None - загрузка не обнаружена).
+        """
+        # Блокирующее ожидание: реагируем на индикатор сразу, как только он пришел
+        output = yield self.connection.read_until_pattern(
+            self.patterns['boot_indicators'],
+            timeout=self.timeouts['reboot_wait']
+        )
+        if not any(ind in output for ind in self.patterns['boot_indicators']):
+            return None
+        boot_time = self.connection.monotonic()
+        self._on_boot_detected(output)
+
+        return (yield from self._send_combinations(boot_time))
+
+    def _send_combinations(self, boot_time):
+        self.sent_combinations = []
+        timing = self.stats_manager.get_recovery_timing(self.parent.model)
+        combinations = self._sorted_combinations()
+        plan = self._learned_key_plan(combinations, timing)
+        if plan:
+            combo_data, window_start, window_end = plan
+            self.logger.debug(f"🎯 Выученное окно {combo_data['id']}: {window_start:.2f}-{window_end:.2f} с после индикатора")
+            yield self.connection.sleep(max(0, window_start - (self.connection.monotonic() - boot_time)))
+            combo_bytes = bytes.fromhex(combo_data['hex'])
+            while True:
+                sent_at = self.connection.monotonic()
+                delay = sent_at - boot_time
+                yield self.connection.send_raw(combo_bytes)
+                output = yield self.connection.read_until_pattern(self.patterns['recovery_indicators'], timeout=KEY_REPEAT_INTERVAL)
+                if self._recovery_entered(output):
+                    self._sent(combo_data, boot_time, sent_at, KEY_REPEAT_INTERVAL)
+                    return output
+                if delay >= window_end:
+                    break
+            self.logger.debug(f"Выученное окно {combo_data['id']} не сработало, перебор остальных комбинаций.")
+            self._sent(combo_data, boot_time, sent_at, KEY_REPEAT_INTERVAL)
+            combinations = [c for c in combinations if c['id'] != combo_data['id']]
+
+        for combo_data in combinations:
+            sent_at = self.connection.monotonic()
+            self.logger.debug(f"📤 Отправлена комбинация: {combo_data['id']} (HEX: {combo_data['hex']})")
+            yield self.connection.send_raw(bytes.fromhex(combo_data['hex']))
+            self._sent(combo_data, boot_time, sent_at, COMBO_INTERVAL)
+            output = yield self.connection.read_until_pattern(self.patterns['recovery_indicators'], timeout=COMBO_INTERVAL)
+            if self._recovery_entered(output):
+                return output
+        return ""
+
+    def _sorted_combinations(self):
+        """Комбинации профиля по статистике модели (при малом числе попыток - семейства и общей)."""
+        return self.stats_manager.sort_by_stats(self.device_cfg.get("recovery_combinations", []), "recovery_keys",
+                                                self.parent.stats_context())
+
+    def _learned_key_plan(self, combinations, timing):
+        """
+        Выученная комбинация и окно отправки (сек от индикатора загрузки) или None,
+        если для модели еще нет удачных входов.
+        """
+        for combo_data in combinations:
+            delays = timing.get(combo_data['id'], {}).get("delays")
+            if delays:
+                return combo_data, max(0, min(delays) - KEY_WINDOW_MARGIN), max(delays) + KEY_WINDOW_MARGIN
+        return None
 
-    def _check_model_indicator(self, output):
-        base_model_indicator = self.device_cfg.get("base_model_indicator")
-        if base_model_indicator and base_model_indicator not in output:
-            self.logger.error(f"❌ ОБНАРУЖЕНО НЕСООТВЕТСТВИЕ! Ожидалась модель с индикатором '{base_model_indicator}'")
-            # В реальной реализации запрос (Y/N) и возможное завершение
-            # answer = input("Продолжить? (Y/N): ")
-            # if answer.upper() != 'Y':
-            #     raise SystemExit(1)
-            self.logger.warning("Продолжаем, несмотря на несоответствие (симуляция).")
+    def _sent(self, combo_data, boot_time, sent_at, interval):
+        self.sent_combinations.append((combo_data, sent_at - boot_time, sent_at, interval))
+
+    def _settle_combinations(self, entered):
+        """
+        Учитывает отправленные комбинации сразу после того, как ожидание Recovery закончилось.
+        При входе удачной считается последняя отправленная, остальные - неудачными.
+        """
+        sent, self.sent_combinations = self.sent_combinations, []
+        now = self.connection.monotonic()
+        for index, (combo_data, delay, sent_at, interval) in enumerate(sent):
+            success = entered and index == len(sent) - 1
+            # Задержка выучивается, только если индикатор пришел в интервал ожидания после этой
+            # отправки. Пришел позже (например, в запасном ожидании) - загрузчик мог отреагировать
+            # на более раннюю комбинацию: вход учитывается, задержка не сохраняется.
+            credited = success and now - sent_at <= interval
+            self._record_key_result(combo_data, success, delay if credited else None)
+        if sent:
+            self.stats_manager.save_stats("recovery_keys")
+            self.stats_manager.save_stats("recovery_timing")
+
+    def _record_key_result(self, combo_data, success, delay=None):
+        """Учитывает попытку комбинации в общей статистике и в статистике задержек модели."""
+        if success and delay is not None:
+            self.logger.debug(f"📥 Recovery Mode по комбинации {combo_data['id']} через {delay:.2f} с после индикатора.")
+        elif success:
+            self.logger.debug(f"📥 Recovery Mode после комбинации {combo_data['id']}: индикатор пришел позже, задержка не учитывается.")
+        self.stats_manager.update_stats("recovery_keys", combo_data['id'], success=success,
+                                        session=self.parent.session_id, context=self.parent.stats_context())
+        if self.parent.model:
+            self.stats_manager.update_recovery_timing(self.parent.model, combo_data['id'], success, delay)
+
+    def _on_boot_detected(self, output):
+        """Фиксирует начало взаимодействия с устройством и проверяет модель."""
+        self.logger.debug(f"📥 Получен индикатор загрузки.")
+        if self.parent.interaction_start_time is None:
+            self.parent.interaction_start_time = self.connection.monotonic()
+            self.parent.report_data["interaction_start_time"] = self.parent.interaction_start_time
+
+        # Баннер загрузчика содержит модель: профиль уточняется до перебора комбинаций
+        self.parent.identify_model(output)
 
     def authorize_in_recovery(self):
         self.logger.step("🔑 Блок 2.А: Авторизация в Password Recovery Mode")
         credentials_list = self.credentials.get("recovery", [])
-        sorted_credentials = self.stats_manager.sort_by_stats(credentials_list, "credentials")
+        sorted_credentials = self.stats_manager.sort_by_stats(credentials_list, "credentials", self.parent.stats_context())
         
         for cred in sorted_credentials:
             login = cred['login']
@@ -106,63 +201,47 @@ class RecoveryHandler:
             
             self.logger.debug(f"Пробуем учетные данные: {cred_id}")
             
-            self.connection.send_command_and_wait(login, expected_patterns=[self.patterns['PASSWORD_PROMPT']], timeout=self.timeouts['login_attempt'])
-            self.connection.send_command_and_wait(password, expected_patterns=[self.patterns['USER_PROMPT'], self.patterns['LOGIN_FAILED_INDICATOR']], timeout=self.timeouts['login_attempt'])
+            yield self.connection.send_command_and_wait(login, expected_patterns=[self.patterns['PASSWORD_PROMPT']], timeout=self.timeouts['login_attempt'], label="login")
+            yield self.connection.send_command_and_wait(password, expected_patterns=[self.patterns['USER_PROMPT'], self.patterns['LOGIN_FAILED_INDICATOR']], timeout=self.timeouts['login_attempt'], label="password")
             
-            final_output = self.connection.get_last_output()
-            if self.patterns['USER_PROMPT'] in final_output and not any(err in final_output for err in self.patterns['LOGIN_FAILED_INDICATOR']):
-                self.logger.success(f"✅ Успешный вход в Recovery с учетными данными {cred_id}!")
-                self.stats_manager.update_stats("credentials", cred_id, success=True)
+            if self._check_recovery_login(cred_id, self.connection.get_last_output()):
                 return True
-            else:
-                self.logger.debug(f"Попытка с {cred_id} не удалась.")
-                self.stats_manager.update_stats("credentials", cred_id, success=False)
         
         self.logger.error("❌ Пароли для Recovery Mode не подошли.")
         return False
 
+    def _check_recovery_login(self, cred_id, final_output):
+        """Проверяет результат попытки входа и обновляет статистику."""
+        if self.patterns['USER_PROMPT'] in final_output and not any(err in final_output for err in self.patterns['LOGIN_FAILED_INDICATOR']):
+            self.logger.success(f"✅ Успешный вход в Recovery с учетными данными {cred_id}!")
+            self.stats_manager.update_stats("credentials", cred_id, success=True,
+                                            session=self.parent.session_id, context=self.parent.stats_context())
+            return True
+        self.logger.debug(f"Попытка с {cred_id} не удалась.")
+        self.stats_manager.update_stats("credentials", cred_id, success=False,
+                                        session=self.parent.session_id, context=self.parent.stats_context())
+        return False
+
     def execute_recovery_reset(self):
         self.logger.step("🗑️ Блок 3: Выполнение сброса через Password Recovery Mode")
         self.parent.report_data["reset_was_performed"] = True
         
-        commands = self.reset_commands.get(self.device_cfg.get("recovery_commands", "recovery"), [])
-        sorted_commands = self.stats_manager.sort_by_stats(commands, "reset_commands")
-        
         success_count = 0
-        for cmd_data in sorted_commands:
+        for cmd_data in self._sorted_reset_commands():
             cmd = cmd_data['command']
-            cmd_id = cmd_data['id']
             
-            result = self.connection.send_command_and_wait(
+            result = yield self.connection.send_command_and_wait(
                 cmd,
-                expected_patterns=[
-                    self.patterns['SUCCESS_GENERIC'],
-                    self.patterns['USER_PROMPT'],
-                    self.patterns['ERROR_GENERIC'],
-                    self.patterns['CONFIRM_YN']
-                ],
+                expected_patterns=self._reset_expected_patterns(),
                 timeout=self.timeouts['command_default']
             )
             
             if result == self.patterns['CONFIRM_YN']:
                 self.logger.debug("Обнаружено подтверждение (Y/N), отправляем Y...")
-                self.connection.send_raw(b'Y\r')
-                time.sleep(1)
-                self.connection.send_raw(b'\r')
-                time.sleep(0.5)
-                self.connection.send_raw(b'\r')
-
-            final_output = self.connection.get_last_output()
-            success_found = any(s in final_output for s in self.patterns['SUCCESS_GENERIC']) or self.patterns['USER_PROMPT'] in final_output
-            error_found = any(e in final_output for e in self.patterns['ERROR_GENERIC'])
-            
-            if success_found and not error_found:
-                self.logger.success(f"✅ Команда '{cmd}' выполнена успешно!")
-                self.stats_manager.update_stats("reset_commands", cmd_id, success=True)
+                yield from self.interaction.confirm(self._confirm_done_patterns(), timeout=self.timeouts['command_default'])
+
+            if self._check_reset_command(cmd_data, self.connection.get_last_output()):
                 success_count += 1
-            else:
-                self.logger.warning(f"⚠️ Команда '{cmd}' не выполнена или выполнена с ошибкой.")
-                self.stats_manager.update_stats("reset_commands", cmd_id, success=False)
         
         self.stats_manager.save_stats("reset_commands")
         self.stats_manager.save_stats("credentials")
@@ -171,17 +250,38 @@ class RecoveryHandler:
             return False
             
         self.logger.info("Перезагрузка устройства после сброса...")
-        self.connection.send_raw(b'reboot\r')
-        time.sleep(2)
-        
-        reboot_confirm_output = self.connection.read_available()
-        if self.patterns['CONFIRM_YN'] in reboot_confirm_output:
-             self.connection.send_raw(b'Y\r')
-             time.sleep(1)
-             self.connection.send_raw(b'\r')
-             time.sleep(0.5)
-             self.connection.send_raw(b'\r')
-
-        self.connection.read_until_pattern([self.patterns['REBOOTING']], timeout=10)
+        yield from self.interaction.reboot()
         self.logger.success("✅ Сброс выполнен, перезагрузка инициирована...")
         return True
+
+    def _sorted_reset_commands(self):
+        commands = self.reset_commands.get(self.device_cfg.get("recovery_commands", "recovery"), [])
+        return self.stats_manager.sort_by_stats(commands, "reset_commands", self.parent.stats_context())
+
+    def _reset_expected_patterns(self):
+        return [
+            self.patterns['SUCCESS_GENERIC'],
+            self.patterns['USER_PROMPT'],
+            self.patterns['ERROR_GENERIC'],
+            self.patterns['CONFIRM_YN']
+        ]
+
+    def _confirm_done_patterns(self):
+        """Ответ на подтверждение команды сброса: результат или промпт."""
+        return [p for p in self._reset_expected_patterns() if p != self.patterns['CONFIRM_YN']]
+
+    def _check_reset_command(self, cmd_data, final_output):
+        """Проверяет результат команды сброса и обновляет статистику."""
+        cmd = cmd_data['command']
+        success_found = any(s in final_output for s in self.patterns['SUCCESS_GENERIC']) or self.patterns['USER_PROMPT'] in final_output
+        error_found = any(e in final_output for e in self.patterns['ERROR_GENERIC'])
+
+        if success_found and not error_found:
+            self.logger.success(f"✅ Команда '{cmd}' выполнена успешно!")
+            self.stats_manager.update_stats("reset_commands", cmd_data['id'], success=True,
+                                            session=self.parent.session_id, context=self.parent.stats_context())
+            return True
+        self.logger.warning(f"⚠️ Команда '{cmd}' не выполнена или выполнена с ошибкой.")
+        self.stats_manager.update_stats("reset_commands", cmd_data['id'], success=False,
+                                        session=self.parent.session_id, context=self.parent.stats_context())
+        return False
@@ -0,0 +1,101 @@
+# handlers/replay_connection.py
+"""
+Воспроизведение записанной сессии (см. utils/session_recorder.py) вместо реального порта.
+Позволяет повторить сбой с объекта и прогнать конечный автомат DLinkReset без коммутатора.
+"""
+import time
+
+from handlers.connection import SerialConnection
+from utils.session_recorder import read_session, RX, TX
+
+# Допуск сравнения времени (сек): данные в записи отмечаются в момент чтения программой,
+# и накопленная ошибка округления не должна сдвигать их на следующее чтение
+CLOCK_TOLERANCE = 0.001
+
+
+class ReplaySerialConnection(SerialConnection):
+    """
+    Подменяет порт записанной сессией и работает по виртуальным часам.
+
+    Принятые в записи данные выдаются по своим отметкам времени, но время отсчитывается
+    от момента, когда программа отправила ту же по счету передачу, что предшествовала им
+    в записи. Поэтому ответы приходят «в ответ» на команды, даже если программа
+    дошла до них раньше или позже, чем при записи.
+
+    speed - множитель скорости: 0 - без реальных пауз (ожидания и паузы мгновенные),
+    1 - в реальном времени, 10 - в десять раз быстрее.
+    """
+    def __init__(self, session_path, logger, speed=0):
+        self.session_info, records = read_session(session_path)
+        super().__init__(self.session_info.get("port", str(session_path)),
+                         self.session_info.get("baudrate"), logger)
+        self.session_path = session_path
+        self.speed = speed
+        self._now = 0.0
+        self._shift = 0.0   # Сдвиг отметок записи относительно виртуальных часов
+        self._rx = []       # (время, число предшествующих передач, байты)
+        self._tx = []       # (время, байты)
+        for direction, timestamp, data in records:
+            if direction == RX:
+                self._rx.append((timestamp, len(self._tx), data))
+            elif direction == TX:
+                self._tx.append((timestamp, data))
+        self._rx_pos = 0
+        self._tx_count = 0
+        self._diverged = False
+
+    def connect(self):
+        self.logger.info(f"▶️ Воспроизведение сессии {self.session_path} "
+                         f"({len(self._rx)} блоков приема, {len(self._tx)} передач).")
+        self.sleep(1) # Стабилизация, как при реальном подключении
+
+    def disconnect(self):
+        self.logger.info(f"⏹️ Воспроизведение завершено: виртуальное время {self._now:.1f} с.")
+
+    def monotonic(self):
+        return self._now
+
+    def _advance(self, seconds):
+        if seconds <= 0:
+            return
+        self._now += seconds
+        if self.speed:
+            time.sleep(seconds / self.speed)
+
+    def sleep(self, seconds):
+        self._advance(seconds)
+
+    def send_raw(self, data_bytes):
+        self.bytes_written += len(data_bytes)
+        if self._tx_count < len(self._tx):
+            recorded_at, recorded = self._tx[self._tx_count]
+            if recorded != data_bytes and not self._diverged:
+                self._diverged = True
+                self.logger.warning(f"⚠️ Воспроизведение расходится с записью: отправлено {data_bytes!r}, "
+                                    f"в записи {recorded!r} (передача №{self._tx_count + 1}).")
+            # Ответы на эту передачу отсчитываются от текущего момента
+            self._shift = self._now - recorded_at
+        self._tx_count += 1
+
+    def _due(self, index):
+        """Виртуальное время, когда блок приема index становится доступен (None - ждет передачи)."""
+        timestamp, tx_before, _ = self._rx[index]
+        if tx_before > self._tx_count:
+            return None
+        return timestamp + self._shift
+
+    def _read_chunk(self, timeout):
+        if self._rx_pos < len(self._rx):
+            due = self._due(self._rx_pos)
+            if due is not None and due <= self._now + max(timeout, 0) + CLOCK_TOLERANCE:
+                self._advance(due - self._now)
+                chunks = []
+                while self._rx_pos < len(self._rx):
+                    due = self._due(self._rx_pos)
+                    if due is None or due > self._now + CLOCK_TOLERANCE:
+                        break
+                    chunks.append(self._rx[self._rx_pos][2])
+                    self._rx_pos += 1
+                return b"".join(chunks)
+        self._advance(timeout)
+        return b""
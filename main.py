@@ -11,18 +11,42 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from dlink_reset import DLinkReset
+from utils.session_recorder import read_session
+from utils.ordering import POLICIES, DEFAULT_POLICY
 
 
 def parse_arguments():
     """Парсит аргументы командной строки."""
     parser = argparse.ArgumentParser(description="Сброс и прошивка коммутаторов D-Link.")
-    parser.add_argument("--port", required=True, help="COM-порт (например, COM3)")
-    parser.add_argument("--model", required=True, help="Модель устройства (например, DES-3200-28)")
+    parser.add_argument("--port", help="COM-порт (например, COM3)")
+    parser.add_argument("--model", help="Модель устройства (например, DES-3200-28); без нее - определяется по выводу консоли")
     parser.add_argument("--vendor", default="D-Link", help="Производитель (по умолчанию D-Link)")
     parser.add_argument("--force-reflash", action="store_true", help="Принудительно перепрошить, даже если версия совпадает")
     parser.add_argument("--debug", action="store_true", help="Включить подробное логирование")
+    parser.add_argument("--record", nargs="?", const=True, default=None, metavar="FILE",
+                        help="Записать сессию порта (без FILE - в папку logs)")
+    parser.add_argument("--replay", metavar="FILE", help="Воспроизвести записанную сессию вместо порта")
+    parser.add_argument("--metrics-dir", help="Папка для метрик прогона: JSON и .prom для node_exporter (по умолчанию reports)")
+    parser.add_argument("--replay-speed", type=float, default=0,
+                        help="Скорость воспроизведения: 0 - мгновенно (по умолчанию), 1 - реальное время")
+    parser.add_argument("--firmware-store", help="Хранилище образов (firmware.py): проверять образ до загрузки на коммутатор")
+    parser.add_argument("--autobaud", action="store_true", help="Определить скорость консоли при подключении")
+    parser.add_argument("--console-baudrate", type=int, help="Ускорить консоль до этой скорости на время проверок в CLI (например 115200)")
+    parser.add_argument("--ordering", choices=sorted(POLICIES), default=DEFAULT_POLICY,
+                        help="Порядок перебора учетных данных и команд: thompson (по умолчанию), ucb или count (по числу успехов)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Не продолжать прерванный прогон по журналу порта (stats/journal), начинать с начала")
     # Можно добавить другие аргументы по необходимости
-    return parser.parse_args()
+    args = parser.parse_args()
+
+    if args.replay:
+        # Порт и модель по умолчанию берутся из записи
+        info, _ = read_session(args.replay)
+        args.port = args.port or info.get("port")
+        args.model = args.model or info.get("model")
+    if not args.port:
+        parser.error("необходимо указать --port")
+    return args
 
 def main():
     """Основная точка входа."""
@@ -34,7 +58,16 @@ def main():
         model=args.model,
         vendor=args.vendor,
         force_reflash=args.force_reflash,
-        debug=args.debug
+        debug=args.debug,
+        record_session=args.record,
+        replay_session=args.replay,
+        replay_speed=args.replay_speed,
+        metrics_dir=args.metrics_dir,
+        firmware_store=args.firmware_store,
+        autobaud=args.autobaud,
+        console_baudrate=args.console_baudrate,
+        ordering=args.ordering,
+        resume=not args.no_resume
     )
     
     try:
@@ -0,0 +1,129 @@
+# ordering_eval.py
+"""
+Офлайн-оценка политик порядка перебора (utils/ordering.py) по журналу попыток из stats.
+Журнал разбивается на эпизоды: попытки одного прогона (session) до первого успеха.
+Для каждого эпизода политика упорядочивает известные элементы по статистике, накопленной
+ею самой на предыдущих эпизодах; стоимость эпизода - позиция сработавшего элемента
+(все элементы перед ним считаются неудачными попытками и учитываются в статистике политики).
+Эпизоды без успеха не оцениваются: любая политика перебрала бы все элементы.
+
+Пример:
+    python ordering_eval.py --stat-type credentials
+    python ordering_eval.py --stat-type reset_commands --runs 50 --half-life-days 7
+    python ordering_eval.py --stat-type recovery_keys --context D-Link/DES-3200-28
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from statistics import mean
+
+# Добавляем текущую директорию в путь поиска модулей
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils import ordering
+from utils.stats_manager import StatsManager
+
+# Стоимость одной неудачной попытки по умолчанию (сек): таймаут login_attempt
+DEFAULT_ATTEMPT_COST = 20
+
+
+def split_episodes(history):
+    """Эпизоды [[попытка, ...], ...] в порядке завершения; последняя попытка эпизода - успех или обрыв."""
+    episodes, open_episodes = [], {}
+    for attempt in history:
+        episode = open_episodes.setdefault(attempt["session"], [])
+        episode.append(attempt)
+        if attempt["success"]:
+            episodes.append(open_episodes.pop(attempt["session"]))
+    episodes.extend(open_episodes.values())
+    return sorted(episodes, key=lambda episode: episode[-1]["ts"])
+
+
+def known_items(history):
+    """Элементы журнала в порядке первого появления (приближение порядка профиля)."""
+    return list(dict.fromkeys(attempt["item_id"] for attempt in history))
+
+
+def replay(policy, episodes, items, half_life):
+    """Стоимость (число попыток) каждого успешного эпизода при заданной политике."""
+    stats, costs = {}, []
+    for episode in episodes:
+        now = episode[0]["ts"]
+        if not episode[-1]["success"]:
+            for attempt in episode:
+                ordering.record(stats.setdefault(attempt["item_id"], ordering.new_entry()), False, attempt["ts"], half_life)
+            continue
+        snapshot = {item_id: ordering.decayed(entry, now, half_life) for item_id, entry in stats.items()}
+        order = [item["id"] for item in policy.order([{"id": item_id} for item_id in items], snapshot)]
+        position = order.index(episode[-1]["item_id"])
+        for item_id in order[:position]:
+            ordering.record(stats.setdefault(item_id, ordering.new_entry()), False, now, half_life)
+        ordering.record(stats.setdefault(order[position], ordering.new_entry()), True, now, half_life)
+        costs.append(position + 1)
+    return costs
+
+
+def evaluate(history, policies, runs=20, half_life_days=ordering.DEFAULT_HALF_LIFE_DAYS, seed=0):
+    """{политика: {"episodes", "mean_attempts"}} плюс "history" - фактический перебор из журнала."""
+    episodes = split_episodes(history)
+    items = known_items(history)
+    half_life = half_life_days * 86400
+    succeeded = [episode for episode in episodes if episode[-1]["success"]]
+    results = {"history": {"episodes": len(succeeded),
+                           "mean_attempts": round(mean(len(e) for e in succeeded), 3) if succeeded else None}}
+    for name in policies:
+        # Случайные политики усредняются по нескольким прогонам с разными зернами
+        repeats = runs if name == "thompson" else 1
+        costs = []
+        for run in range(repeats):
+            policy = ordering.create_policy(name, rng=random.Random(seed + run))
+            costs.extend(replay(policy, episodes, items, half_life))
+        results[name] = {"episodes": len(succeeded), "mean_attempts": round(mean(costs), 3) if costs else None}
+    return results
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Офлайн-оценка политик порядка перебора по журналу попыток.")
+    parser.add_argument("--stats-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "stats"),
+                        help="Папка статистики (по умолчанию stats)")
+    parser.add_argument("--stat-type", default="credentials",
+                        help="Тип статистики: credentials, reset_commands или recovery_keys")
+    parser.add_argument("--context", help="Только попытки модели (D-Link/DES-3200-28) или ветки прошивки (D-Link/DES-3200-28/4.51)")
+    parser.add_argument("--policies", default=",".join(ordering.POLICIES), help="Политики через запятую")
+    parser.add_argument("--runs", type=int, default=20, help="Прогонов для усреднения Thompson sampling")
+    parser.add_argument("--half-life-days", type=float, default=ordering.DEFAULT_HALF_LIFE_DAYS,
+                        help="Период полураспада веса попытки (дней)")
+    parser.add_argument("--attempt-cost", type=float, default=DEFAULT_ATTEMPT_COST,
+                        help="Стоимость одной попытки для оценки времени (сек)")
+    parser.add_argument("--output", help="Сохранить результат в JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    history = StatsManager(args.stats_dir).attempt_history(args.stat_type, args.context)
+    if not history:
+        print(f"Журнал попыток '{args.stat_type}' пуст{' для ' + args.context if args.context else ''}.")
+        sys.exit(1)
+
+    policies = [name.strip() for name in args.policies.split(",") if name.strip()]
+    results = evaluate(history, policies, runs=args.runs, half_life_days=args.half_life_days)
+    print(f"--- {args.stat_type}: {len(history)} попыток, успешных эпизодов: {results['history']['episodes']} ---")
+    for name, result in results.items():
+        attempts = result["mean_attempts"]
+        if attempts is None:
+            print(f"    {name:10} нет успешных эпизодов")
+            continue
+        seconds = (attempts - 1) * args.attempt_cost
+        print(f"    {name:10} попыток до успеха: {attempts:.2f}  (~{seconds:.0f} с на неудачные попытки)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"stat_type": args.stat_type, "attempt_cost": args.attempt_cost,
+                       "half_life_days": args.half_life_days, "results": results}, f, indent=4, ensure_ascii=False)
+        print(f"--- Результаты сохранены в {args.output} ---")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,792 @@
+# simulator.py
+"""
+Виртуальный коммутатор D-Link на псевдотерминале (только Linux/Unix).
+Эмулирует загрузку (boot_indicators), Password Recovery Mode, запросы UserName:/Password:,
+промпт CLI, подтверждения (Y/N), загрузку ПО по TFTP и перезагрузку для профилей из config/devices.
+DLinkReset подключается к нему как к обычному порту (путь /dev/pts/N).
+
+Пример:
+    python simulator.py --model DES-3200-28 --time-scale 0.05 --link /tmp/ttyDLINK0
+    python main.py --port /tmp/ttyDLINK0 --model DES-3200-28
+"""
+import argparse
+import heapq
+import os
+import random
+import select
+import signal
+import sys
+import termios
+import threading
+import time
+import tty
+from pathlib import Path
+
+# Добавляем текущую директорию в путь поиска модулей
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils import config_loader, zmodem
+from utils.upgrade_planner import image_files
+
+# Длительности «медленных» операций (сек) при time_scale=1
+BOOT_TIME = 60          # От индикатора загрузки до приглашения CLI
+DOWNLOAD_TIME = 60      # Загрузка файла по TFTP
+TFTP_TIMEOUT = 20       # Ответ на загрузку с недоступного сервера
+SAVE_TIME = 3
+PING_INTERVAL = 1
+# Окно после индикатора загрузки, в которое принимаются клавиши Recovery/Boot Menu (не масштабируется)
+KEY_WINDOW = 3.0
+
+CTRL_C = "\x03"
+# Пункты Boot Configuration Menu: образ, принимаемый по ZModem, по ответу на запрос Image ID
+BOOT_MENU_IMAGES = ("1", "2", "P")
+# Скорости консоли, которые принимает 'config serial_port baudrate'
+CONSOLE_BAUDRATES = (9600, 19200, 38400, 115200)
+# Код скорости termios -> baud (скорость, на которую хост настроил порт)
+TERMIOS_BAUDRATES = {getattr(termios, f"B{rate}"): rate
+                     for rate in (1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200) if hasattr(termios, f"B{rate}")}
+# Команды сброса, запрашивающие подтверждение (Y/N)
+CONFIRM_COMMANDS = ("reset config", "reset all", "reset system", "restore default", "system_default")
+
+
+class ZmodemReceiver:
+    """
+    Приемник ZModem загрузчика (Boot Configuration Menu) для эмулятора.
+    partial - (имя файла, данные) прерванной передачи для продолжения по ZCRESUM.
+    error_rate - вероятность порчи байта в каждой принятой порции данных.
+    stall_at - после приема стольких байт приемник перестает отвечать (проверка таймаутов).
+    """
+    def __init__(self, partial=None, error_rate=0.0, stall_at=None, buflen=0):
+        self.partial = partial
+        self.error_rate = error_rate
+        self.stall_at = stall_at
+        self.buflen = buflen
+        self.buffer = bytearray()
+        self.state = "HEADER"       # HEADER | SKIP | FILE_INFO | DATA
+        self.filename = None
+        self.data = bytearray()
+        self.resume = False
+        self.complete = False       # ZEOF на полной длине файла
+        self.finished = False       # ZFIN
+        self.aborted = False        # отмена отправителем (CAN)
+        self.stalled = False
+        self.errors = 0
+
+    def start(self):
+        return zmodem.hex_header(zmodem.ZRINIT, self._capabilities())
+
+    def _capabilities(self):
+        return (zmodem.CANFDX | zmodem.CANOVIO | zmodem.CANFC32) << 24 | self.buflen
+
+    def feed(self, data):
+        """Принимает байты отправителя и возвращает ответ приемника."""
+        if bytes((zmodem.ZDLE,)) * 5 in self.buffer + data:
+            self.aborted = True
+            return b""
+        if self.stalled:
+            return b""
+        if self.state == "DATA" and data and random.random() < self.error_rate:
+            data = bytearray(data)
+            data[random.randrange(len(data))] ^= 0x01
+        self.buffer += data
+        out = bytearray()
+        while not self.stalled:
+            if self.state in ("HEADER", "SKIP"):
+                reply = self._read_header()
+            else:
+                reply = self._read_subpacket()
+            if reply is None:
+                break
+            out += reply
+        return bytes(out)
+
+    def _read_header(self):
+        start = self.buffer.find(bytes((zmodem.ZPAD, zmodem.ZDLE)))
+        if start < 0:
+            del self.buffer[:-1]
+            return None
+        header, end = zmodem.parse_header(self.buffer, start + 1)
+        if end is None:
+            del self.buffer[:start]
+            return None
+        kind = self.buffer[start + 2]
+        del self.buffer[:end]
+        if header:
+            return self._on_header(*header)
+        if self.state == "HEADER" and kind in (zmodem.ZHEX, zmodem.ZBIN, zmodem.ZBIN32):
+            self.errors += 1
+            return zmodem.hex_header(zmodem.ZNAK)
+        return b""
+
+    def _on_header(self, frame_type, arg):
+        if frame_type == zmodem.ZRQINIT:
+            return self.start()
+        if frame_type == zmodem.ZFILE:
+            self.resume = arg >> 24 == zmodem.ZCRESUM
+            self.state = "FILE_INFO"
+        elif frame_type == zmodem.ZDATA:
+            if arg != len(self.data):
+                self.state = "SKIP"
+                return zmodem.hex_header(zmodem.ZRPOS, len(self.data))
+            self.state = "DATA"
+        elif frame_type == zmodem.ZEOF and arg == len(self.data):
+            self.complete = True
+            self.state = "HEADER"
+            return self.start()
+        elif frame_type == zmodem.ZFIN:
+            self.finished = True
+            return zmodem.hex_header(zmodem.ZFIN)
+        return b""
+
+    def _read_subpacket(self):
+        data, frame_end, end = zmodem.read_subpacket(self.buffer, 0)
+        if end is None:
+            return None
+        del self.buffer[:end]
+        if data is None:
+            # Ошибка CRC: отбрасываем поток до следующего заголовка ZDATA
+            self.errors += 1
+            self.state = "SKIP"
+            return zmodem.hex_header(zmodem.ZRPOS, len(self.data))
+        if self.state == "FILE_INFO":
+            self.filename = data.split(b"\0")[0].decode("latin-1")
+            if self.resume and self.partial and self.partial[0] == self.filename:
+                self.data = bytearray(self.partial[1])
+            self.state = "HEADER"
+            return zmodem.hex_header(zmodem.ZRPOS, len(self.data))
+        self.data += data
+        if self.stall_at is not None and len(self.data) >= self.stall_at:
+            self.stalled = True
+            return b""
+        reply = b""
+        if frame_end in (zmodem.ZCRCQ, zmodem.ZCRCW):
+            reply = zmodem.hex_header(zmodem.ZACK, len(self.data))
+        if frame_end in (zmodem.ZCRCE, zmodem.ZCRCW):
+            self.state = "HEADER"
+        return reply
+
+
+class VirtualSwitch:
+    """
+    Эмулятор консоли коммутатора. Весь вывод планируется как события во времени
+    и выполняется одним потоком; Ctrl+C отменяет вывод текущей команды.
+
+    recovery_key - HEX комбинации входа в Recovery Mode (по умолчанию первая из профиля).
+    recovery_login, cli_login - пара (логин, пароль) или None (вход без пароля).
+    reachable_ips - адреса, отвечающие на ping и TFTP (по умолчанию первый из tftp_ip_candidates).
+    accepted_reset_commands - команды сброса, которые устройство знает (по умолчанию все из профиля).
+    baud_delay - выводить данные со скоростью порта (10 бит на байт).
+    console_baudrate - скорость консоли устройства (по умолчанию baudrate профиля). Если хост
+    открыл порт на другой скорости, обе стороны видят вместо данных мусор.
+    time_scale - множитель длительности медленных операций (0.05 - в 20 раз быстрее).
+    zmodem_error_rate, zmodem_stall_at - помехи при приеме по ZModem (см. ZmodemReceiver);
+    зависание срабатывает один раз, следующая передача продолжает прерванную.
+    """
+    def __init__(self, model, vendor="D-Link", config_dir=None, time_scale=1.0, baud_delay=False,
+                 echo=True, recovery_key=None, recovery_login=None, cli_login=None,
+                 reachable_ips=None, accepted_reset_commands=None, prom_version="1.00.B004",
+                 firmware_version="4.38.B000", power_on_delay=2.0, console_baudrate=None,
+                 zmodem_error_rate=0.0, zmodem_stall_at=None):
+        config_dir = config_dir or Path(__file__).resolve().parent / "config"
+        configs = config_loader.load_all_configs(config_dir, model, vendor)
+        self.model = model
+        self.device_cfg = configs["device"]
+        self.patterns = configs["patterns"]
+        self.credentials = configs["credentials"]
+        self.firmware_info = configs["firmware_info"].get(model, {})
+        self.time_scale = time_scale
+        self.echo = echo
+        self.power_on_delay = power_on_delay
+
+        self.baudrate = self.device_cfg.get("baudrate", 9600)
+        self.baud_delay = baud_delay
+        self.console_baudrate = console_baudrate or self.baudrate
+        self.saved_baudrate = self.console_baudrate
+
+        combinations = self.device_cfg.get("recovery_combinations", [])
+        self.recovery_key = bytes.fromhex(recovery_key or (combinations[0]["hex"] if combinations else "20"))
+        self.boot_menu_key = bytes.fromhex(self.device_cfg.get("boot_menu_combination", "33"))
+        self.recovery_login = recovery_login
+        self.cli_login = cli_login
+        candidates = self.device_cfg.get("tftp_ip_candidates", [])
+        self.reachable_ips = set(reachable_ips if reachable_ips is not None else candidates[:1])
+
+        reset_commands = configs["reset_commands"]
+        self.recovery_commands = reset_commands.get(self.device_cfg.get("recovery_commands", "recovery"), [])
+        self.cli_commands = reset_commands.get(self.device_cfg.get("cli_commands", "cli"), [])
+        if accepted_reset_commands is None:
+            accepted_reset_commands = [c["command"] for c in self.recovery_commands + self.cli_commands]
+        self.accepted_reset_commands = set(accepted_reset_commands)
+
+        # Состояние «железа»
+        self.prom_version = prom_version
+        self.pending_prom = None
+        self.slots = {"1": firmware_version, "2": None}
+        self.boot_slot = "1"
+        self.mac_address = "00-1E-58-" + "-".join(f"{b:02X}" for b in os.urandom(3))
+
+        # Прием по ZModem в Boot Configuration Menu
+        self.zmodem_error_rate = zmodem_error_rate
+        self.zmodem_stall_at = zmodem_stall_at
+        self.zmodem_received = []   # (образ, имя файла, размер)
+        self._zmodem = None
+        self._zmodem_image = None
+        self._zmodem_partial = None
+
+        # Состояние консоли
+        self.mode = "off"
+        self._line = ""
+        self._login = None
+        self._confirm_action = None
+        self._busy_return = "cli"  # Режим, в который консоль вернется после команды
+        self._key_window_end = 0
+        self._events = []
+        self._seq = 0
+        self._generation = 0     # Увеличивается при отмене: старые события игнорируются
+
+        self.port = None
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {"reboots": 0, "bytes_in": 0, "bytes_out": 0, "commands": 0}
+
+    # --- Жизненный цикл ---
+
+    def start(self):
+        """Создает псевдотерминал, запускает эмуляцию и возвращает путь к порту."""
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._thread = threading.Thread(target=self._loop, name=f"sim-{self.model}", daemon=True)
+        self._thread.start()
+        self.power_cycle(self.power_on_delay)
+        return self.port
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._master = self._slave = None
+
+    def power_cycle(self, delay=0.0):
+        """Выключает и снова включает устройство."""
+        with self._lock:
+            self._cancel()
+            self.mode = "off"
+            self._schedule(delay, action=self._boot)
+
+    # --- Планировщик ---
+
+    def _schedule(self, delay, text=None, action=None):
+        self._seq += 1
+        heapq.heappush(self._events, (time.monotonic() + delay, self._seq, self._generation, text, action))
+
+    def _slow(self, seconds):
+        return seconds * self.time_scale
+
+    def _cancel(self):
+        """Отменяет весь запланированный вывод."""
+        self._generation += 1
+        self._events = []
+
+    def _loop(self):
+        while not self._stop.is_set():
+            with self._lock:
+                timeout = 0.1
+                if self._events:
+                    timeout = min(timeout, max(0, self._events[0][0] - time.monotonic()))
+            try:
+                readable, _, _ = select.select([self._master], [], [], timeout)
+            except (OSError, ValueError):
+                return
+            if readable:
+                try:
+                    data = os.read(self._master, 1024)
+                except OSError:
+                    return
+                with self._lock:
+                    self.stats["bytes_in"] += len(data)
+                    self._on_input(data)
+            self._fire_due()
+
+    def _fire_due(self):
+        while True:
+            with self._lock:
+                if not self._events or self._events[0][0] > time.monotonic():
+                    return
+                _, _, generation, text, action = heapq.heappop(self._events)
+                if generation != self._generation:
+                    continue
+                if text:
+                    self._write(text)
+                if action:
+                    action()
+
+    def _host_baudrate(self):
+        """Скорость, на которую хост настроил порт (None - неизвестна)."""
+        try:
+            return TERMIOS_BAUDRATES.get(termios.tcgetattr(self._slave)[5])
+        except (termios.error, TypeError):
+            return None
+
+    def _baud_mismatch(self):
+        host = self._host_baudrate()
+        return host is not None and host != self.console_baudrate
+
+    @staticmethod
+    def _garble(data):
+        """Байты, принятые на чужой скорости: в основном непечатные символы."""
+        return bytes(0x80 | ((b * 37 + 11) & 0x7F) for b in data)
+
+    def _write(self, text):
+        self._write_bytes(text.encode())
+
+    def _write_bytes(self, data):
+        if self._baud_mismatch():
+            data = self._garble(data)
+        self.stats["bytes_out"] += len(data)
+        if not self.baud_delay:
+            os.write(self._master, data)
+            return
+        # Скорость порта: не больше 16 байт за раз
+        byte_time = 10.0 / self.console_baudrate
+        for i in range(0, len(data), 16):
+            chunk = data[i:i + 16]
+            os.write(self._master, chunk)
+            time.sleep(len(chunk) * byte_time)
+
+    # --- Загрузка ---
+
+    def _boot(self):
+        self.stats["reboots"] += 1
+        self.mode = "booting"
+        self.console_baudrate = self.saved_baudrate
+        if self.pending_prom:
+            self.prom_version, self.pending_prom = self.pending_prom, None
+        self._write(f"\r\n  {self.model} Boot Procedure                V{self.prom_version}\r\n"
+                    "-------------------------------------------------------------------------------\r\n"
+                    "  Power On Self Test ........................................  100 %\r\n")
+        self._schedule(1.0, f"  MAC Address   : {self.mac_address}\r\n  H/W Version   : A1\r\n\r\n"
+                            "  Starting system ... Press any key to stop auto-boot\r\n",
+                       action=self._open_key_window)
+
+    def _open_key_window(self):
+        self._key_window_end = time.monotonic() + KEY_WINDOW
+        self._schedule(KEY_WINDOW + self._slow(BOOT_TIME),
+                       f"  Please Wait, Loading V{self.slots[self.boot_slot]} Runtime Image .......... 100 %\r\n"
+                       "  Device Discovery ...\r\n  Configuration init .......... Done\r\n",
+                       action=self._show_login)
+
+    def _show_login(self):
+        self._write(f"\r\n{self.model} Fast Ethernet Switch\r\nCommand Line Interface\r\n\r\n"
+                    f"Firmware: Build {self.slots[self.boot_slot]}\r\n"
+                    "Copyright(C) 2012 D-Link Corporation. All rights reserved.\r\n")
+        if self.cli_login:
+            self.mode = "cli_user"
+            self._write("\r\nUserName:")
+        else:
+            self._enter_cli()
+
+    def _enter_cli(self):
+        self.mode = "cli"
+        self._write(self._prompt())
+
+    def _prompt(self):
+        if self.mode.startswith("recovery"):
+            return "\r\n> "
+        return f"\r\n{self.model}:admin#"
+
+    # --- Ввод ---
+
+    def _on_input(self, data):
+        if self._baud_mismatch():
+            # Ввод на чужой скорости не распознается: устройство отвечает эхом мусора
+            if self.mode in ("cli", "recovery") and self.echo:
+                self._write("?" * len(data))
+            return
+        text = data.decode("latin-1")
+        if self.mode in ("off", "booting"):
+            self._on_boot_input(data)
+            return
+        if self.mode == "zmodem":
+            self._on_zmodem_input(data)
+            return
+        if self.mode == "zmodem_done":
+            # Завершающее "OO" отправителя
+            return
+        if self.mode == "recovery_banner":
+            # «Press any key to login...»
+            if self.recovery_login:
+                self.mode = "recovery_user"
+                self._write("\r\nUserName:")
+            else:
+                self.mode = "recovery"
+                self._write(self._prompt())
+            return
+        for ch in text:
+            if ch == CTRL_C:
+                self._interrupt()
+            elif ch == "\r":
+                line, self._line = self._line, ""
+                if self.echo and not self.mode.endswith("_password"):
+                    self._write("\r\n")
+                self._on_line(line.strip())
+            elif ch == "\n":
+                continue
+            else:
+                self._line += ch
+                if self.echo and not self.mode.endswith("_password"):
+                    self._write(ch)
+
+    def _on_boot_input(self, data):
+        """Во время загрузки реагирует только на клавиши в окне после индикатора."""
+        if self.mode != "booting" or time.monotonic() > self._key_window_end:
+            return
+        if self.recovery_key in data:
+            self._cancel()
+            self.mode = "recovery_banner"
+            self._write("\r\n\r\n  Password Recovery Mode\r\n\r\n  Press any key to login...\r\n")
+        elif self.boot_menu_key in data:
+            self._cancel()
+            self.mode = "boot_menu"
+            self._write("\r\n\r\n  Boot Configuration Menu\r\n\r\n  Image Option\r\n"
+                        "  [Z] Download image via ZModem\r\n  [B] Console baud rate\r\n  [R] Reboot\r\n"
+                        + self._boot_menu_prompt())
+
+    # --- Boot Configuration Menu ---
+
+    def _boot_menu_prompt(self):
+        return "\r\n  Please Select Boot Method: "
+
+    def _on_boot_menu(self, mode, line):
+        key = line.upper()
+        if mode == "boot_menu_baud":
+            self.mode = "boot_menu"
+            if not line.isdigit() or int(line) not in CONSOLE_BAUDRATES:
+                self._write("\r\n  Invalid baud rate\r\n" + self._boot_menu_prompt())
+                return
+            self._write(f"\r\n  Change the terminal baud rate to {line} now.\r\n")
+            # До перезагрузки: после нее загрузчик снова работает на сохраненной скорости
+            self.console_baudrate = int(line)
+            self._schedule(0.05, self._boot_menu_prompt())
+        elif mode == "boot_menu_image":
+            if key not in BOOT_MENU_IMAGES:
+                self.mode = "boot_menu"
+                self._write("\r\n  Invalid image ID\r\n" + self._boot_menu_prompt())
+                return
+            self.mode = "zmodem"
+            self._zmodem_image = key
+            self._zmodem = ZmodemReceiver(self._zmodem_partial, self.zmodem_error_rate, self.zmodem_stall_at)
+            self.zmodem_stall_at = None
+            self._write("\r\n  Ready to receive, start ZModem transfer now...\r\n")
+            self._write_bytes(self._zmodem.start())
+        elif key == "Z":
+            self.mode = "boot_menu_image"
+            self._write("\r\n  Download Protocol: [ZModem]\r\n  Image ID (1/2/P): ")
+        elif key == "B":
+            self.mode = "boot_menu_baud"
+            self._write(f"\r\n  Baud rate ({'/'.join(map(str, CONSOLE_BAUDRATES))}) [{self.console_baudrate}]: ")
+        elif key == "R":
+            self._reboot()
+        elif key:
+            self._write("\r\n  Invalid selection\r\n" + self._boot_menu_prompt())
+        else:
+            self._write(self._boot_menu_prompt())
+
+    def _on_zmodem_input(self, data):
+        receiver = self._zmodem
+        reply = receiver.feed(data)
+        if reply:
+            self._write_bytes(reply)
+        if receiver.aborted:
+            if receiver.filename and receiver.data:
+                self._zmodem_partial = (receiver.filename, bytes(receiver.data))
+            self.mode = "boot_menu"
+            self._write("\r\n  Download aborted\r\n" + self._boot_menu_prompt())
+        elif receiver.finished:
+            # Завершающее "OO" отправителя еще в пути: меню выводится чуть позже
+            self.mode = "zmodem_done"
+            self._schedule(0.2, action=self._zmodem_done)
+
+    def _zmodem_done(self):
+        receiver, self._zmodem = self._zmodem, None
+        self.mode = "boot_menu"
+        known = self._known_files().get(receiver.filename)
+        if not receiver.complete or not known:
+            self._write("\r\n  Download failed\r\n" + self._boot_menu_prompt())
+            return
+        self._zmodem_partial = None
+        self.zmodem_received.append((self._zmodem_image, receiver.filename, len(receiver.data)))
+        kind, version = known
+        if self._zmodem_image == "P":
+            self.pending_prom = version
+        else:
+            self.slots[self._zmodem_image] = version
+            self.boot_slot = self._zmodem_image
+        self._write(f"\r\n  Download complete. Image {self._zmodem_image} updated.\r\n" + self._boot_menu_prompt())
+
+    def _interrupt(self):
+        if self.mode in ("busy", "confirm"):
+            self._cancel()
+            self.mode = self._busy_return
+        self._line = ""
+        self._write(self._prompt())
+
+    def _on_line(self, line):
+        mode = self.mode
+        if mode in ("cli_user", "recovery_user"):
+            self._login = line
+            self.mode = mode.replace("_user", "_password")
+            self._write("\r\nPassword:")
+        elif mode in ("cli_password", "recovery_password"):
+            expected = self.cli_login if mode == "cli_password" else self.recovery_login
+            if (self._login, line) == tuple(expected):
+                self.mode = "cli" if mode == "cli_password" else "recovery"
+                self._write(self._prompt())
+            else:
+                self.mode = mode.replace("_password", "_user")
+                self._write("\r\nLogin failed!\r\n\r\nUserName:")
+        elif mode == "confirm":
+            action, self._confirm_action = self._confirm_action, None
+            self.mode = self._busy_return
+            if line.upper().startswith("Y"):
+                action()
+            else:
+                self._write(self._prompt())
+        elif mode.startswith("boot_menu"):
+            self._on_boot_menu(mode, line)
+        elif mode in ("cli", "recovery"):
+            self.stats["commands"] += 1
+            self._busy_return = mode
+            self._on_command(line)
+        # В режиме busy ввод игнорируется до завершения команды
+
+    # --- Команды ---
+
+    def _finish(self, delay, text=""):
+        """Завершает команду выводом text и промптом через delay секунд."""
+        self.mode = "busy"
+        self._schedule(delay, text, action=self._command_done)
+
+    def _command_done(self):
+        self.mode = self._busy_return
+        self._write(self._prompt())
+
+    def _confirm(self, question, action):
+        self.mode = "confirm"
+        self._confirm_action = action
+        self._write(f"{question} (Y/N)")
+
+    def _on_command(self, line):
+        words = line.split()
+        if not words:
+            self._write(self._prompt())
+            return
+        recovery = self.mode == "recovery"
+        self._write(f"Command: {line}\r\n\r\n")
+
+        if line == "reboot":
+            self._confirm("Are you sure you want to proceed with the system reboot?", self._reboot)
+        elif line in self.accepted_reset_commands:
+            if line in CONFIRM_COMMANDS:
+                self._confirm("This command will reset the configuration. Are you sure?",
+                              lambda: self._finish(self._slow(SAVE_TIME), "Success.\r\n"))
+            else:
+                self._finish(0.05, "Success.\r\n")
+        elif recovery:
+            self._finish(0, "Unknown command\r\n")
+        elif words[0] == "save":
+            self.saved_baudrate = self.console_baudrate
+            self._finish(self._slow(SAVE_TIME), "Saving all configurations to NV-RAM.......... Done.\r\n")
+        elif words[:3] == ["config", "serial_port", "baudrate"] and len(words) == 4:
+            self._config_baudrate(words[3])
+        elif line == "show switch":
+            self._finish(0.1, self._show_switch())
+        elif line == "show firmware information":
+            self._finish(0.1, self._show_firmware())
+        elif line == "dir":
+            self._finish(0.1, self._dir())
+        elif words[0] == "ping" and len(words) > 1:
+            self._ping(words[1])
+        elif words[:2] == ["download", "firmware_fromTFTP"] and len(words) >= 4:
+            self._download(words[2], words[3], words[5] if len(words) >= 6 else self.boot_slot)
+        elif words[:2] == ["config", "firmware"] and len(words) >= 5:
+            self._config_firmware(words[3], words[4])
+        elif line == "enable":
+            self._finish(0)
+        elif line in self.device_cfg.get("post_config_commands", []):
+            self._finish(0.05, "Success.\r\n")
+        else:
+            self._finish(0, "Available commands: ..\r\nUnknown command\r\n")
+
+    def _config_baudrate(self, value):
+        if not value.isdigit() or int(value) not in CONSOLE_BAUDRATES:
+            self._finish(0, "Invalid baudrate\r\nFail!\r\n")
+            return
+        self._write("Success.\r\n")
+        # Промпт выводится уже на новой скорости
+        self.console_baudrate = int(value)
+        self._finish(0.05)
+
+    def _reboot(self):
+        self._write("\r\nPlease wait, the switch is rebooting...\r\nRebooting...\r\n")
+        self.mode = "off"
+        self._schedule(1.0, action=self._boot)
+
+    def _ping(self, ip):
+        self.mode = "busy"
+        reachable = ip in self.reachable_ips
+        for i in range(4):
+            line = f"Reply from {ip}, time<10ms\r\n" if reachable else "Request timed out.\r\n"
+            self._schedule(self._slow(PING_INTERVAL) * (i + 1), line)
+        received = 4 if reachable else 0
+        self._schedule(self._slow(PING_INTERVAL) * 4,
+                       f"\r\n Ping Statistics for {ip}\r\n Packets: Sent = 4, Received = {received}, Lost = {4 - received}\r\n",
+                       action=self._command_done)
+
+    def _known_files(self):
+        files = {}
+        prom = self.firmware_info.get("prom", {})
+        if prom.get("filename"):
+            files[prom["filename"]] = ("prom", prom.get("target_version"))
+        for version, filename in image_files(self.firmware_info.get("firmware", {})):
+            files[filename] = ("firmware", version)
+        return files
+
+    def _download(self, ip, filename, image_id):
+        if ip not in self.reachable_ips:
+            self._finish(self._slow(TFTP_TIMEOUT), "Connecting to server.................... TFTP timeout\r\n")
+            return
+        known = self._known_files().get(filename)
+        if not known:
+            self._finish(self._slow(1), "Connecting to server.................... Done.\r\nFile not found\r\n")
+            return
+        kind, version = known
+
+        def store():
+            if kind == "prom":
+                self.pending_prom = version
+            else:
+                self.slots[image_id] = version
+
+        self.mode = "busy"
+        self._schedule(self._slow(1), "Connecting to server.................... Done.\r\n")
+        self._schedule(self._slow(DOWNLOAD_TIME), "Download firmware....................... Done.  Do not power off!\r\n"
+                                                  "Please wait, programming flash......... Done.\r\n"
+                                                  "Download firmware success\r\n", action=store)
+        self._schedule(self._slow(DOWNLOAD_TIME) + 0.01, action=self._command_done)
+
+    def _config_firmware(self, image_id, operation):
+        if image_id not in self.slots:
+            self._finish(0, "Invalid image ID\r\n")
+        elif operation == "boot_up":
+            if not self.slots[image_id]:
+                self._finish(0, "Failed: image is empty\r\n")
+            else:
+                self.boot_slot = image_id
+                self._finish(0.05, "Success.\r\n")
+        elif operation == "delete":
+            def delete():
+                self.slots[image_id] = None
+                self._finish(0.5, "Success.\r\n")
+            self._confirm(f"Are you sure you want to delete image {image_id}?", delete)
+        else:
+            self._finish(0, "Unknown command\r\n")
+
+    def _show_switch(self):
+        return (f"Device Type                : {self.model} Fast Ethernet Switch\r\n"
+                f"MAC Address                : {self.mac_address}\r\n"
+                "IP Address                 : 10.90.90.90 (Manual)\r\n"
+                "VLAN Name                  : default\r\n"
+                "Subnet Mask                : 255.0.0.0\r\n"
+                "Default Gateway            : 0.0.0.0\r\n"
+                f"Boot PROM Version          : Build {self.prom_version}\r\n"
+                f"Firmware Version           : Build {self.slots[self.boot_slot]}\r\n"
+                "Hardware Version           : A1\r\n"
+                "System Name                : \r\n"
+                "Serial Port                : 9600,8,None,1\r\n")
+
+    def _show_firmware(self):
+        lines = []
+        for image_id, version in sorted(self.slots.items()):
+            boot = "(Boot up firmware)" if image_id == self.boot_slot else ""
+            lines.append(f" Image ID     : {image_id}{boot}\r\n")
+            if version:
+                lines.append(f" Version      : {version}\r\n Size         : 4599220 Bytes\r\n"
+                             " Update Time  : 2012/01/01 00:00:00\r\n From         : 10.90.90.91\r\n\r\n")
+            else:
+                lines.append(" Version      : (Empty)\r\n\r\n")
+        return "".join(lines)
+
+    def _dir(self):
+        lines = [" Directory of /c:\r\n\r\n",
+                 " Idx Info      Attr  Size       Update Time          Name\r\n",
+                 " --- --------- ---- ---------- ------------------- ----------------\r\n"]
+        images = [(image_id, version) for image_id, version in sorted(self.slots.items()) if version]
+        for index, (image_id, version) in enumerate(images, 1):
+            info = "RUN(*)" if image_id == self.boot_slot else "RUN"
+            lines.append(f" {index:>3} {info:<9} -rw-  {4599220:<10} 2012/01/01 00:00:00  runtime{image_id}.had\r\n")
+        lines.append(f" {len(images) + 1:>3} {'CFG(*)':<9} -rw-  {29986:<10} 2012/01/01 00:00:00  config.cfg\r\n")
+        return "".join(lines)
+
+
+def parse_login(text):
+    """Разбирает пару LOGIN:PASSWORD (пароль может быть пустым)."""
+    login, sep, password = text.partition(":")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Ожидается формат LOGIN:PASSWORD, получено '{text}'")
+    return (login, password)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Виртуальный коммутатор D-Link на псевдотерминале.")
+    parser.add_argument("--model", required=True, help="Модель (профиль из config/devices)")
+    parser.add_argument("--vendor", default="D-Link", help="Производитель (по умолчанию D-Link)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Множитель длительности загрузки/TFTP (по умолчанию 1)")
+    parser.add_argument("--baud-delay", action="store_true", help="Выводить данные со скоростью порта из профиля")
+    parser.add_argument("--console-baudrate", type=int, help="Скорость консоли устройства (по умолчанию из профиля)")
+    parser.add_argument("--zmodem-error-rate", type=float, default=0.0, help="Вероятность порчи порции данных при приеме по ZModem")
+    parser.add_argument("--recovery-key", help="HEX комбинации входа в Recovery Mode (по умолчанию первая из профиля)")
+    parser.add_argument("--recovery-login", type=parse_login, help="LOGIN:PASSWORD для Recovery Mode")
+    parser.add_argument("--cli-login", type=parse_login, help="LOGIN:PASSWORD для CLI")
+    parser.add_argument("--reachable-ip", action="append", help="Адрес доступного TFTP-сервера (можно несколько)")
+    parser.add_argument("--link", help="Создать символическую ссылку на порт (например, /tmp/ttyDLINK0)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    switch = VirtualSwitch(args.model, vendor=args.vendor, time_scale=args.time_scale,
+                           baud_delay=args.baud_delay, recovery_key=args.recovery_key,
+                           recovery_login=args.recovery_login, cli_login=args.cli_login,
+                           reachable_ips=args.reachable_ip, console_baudrate=args.console_baudrate,
+                           zmodem_error_rate=args.zmodem_error_rate)
+    port = switch.start()
+    if args.link:
+        if os.path.islink(args.link):
+            os.remove(args.link)
+        os.symlink(port, args.link)
+        port = f"{args.link} -> {port}"
+    print(f"Виртуальный {args.vendor} {args.model} запущен на {port}. Ctrl+C - остановить.")
+    # SIGTERM завершает так же, как Ctrl+C: ссылка на порт удаляется
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        switch.stop()
+        if args.link and os.path.islink(args.link):
+            os.remove(args.link)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+# tests/conftest.py
+"""
+Общая настройка тестов: корень проекта в sys.path, чтобы импортировать utils и handlers
+так же, как их импортируют main.py и fleet.py.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
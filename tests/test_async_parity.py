@@ -0,0 +1,30 @@
+# tests/test_async_parity.py
+"""
+DLinkReset и AsyncDLinkReset выполняют одни и те же сценарии (handlers/flow.py):
+на одной записанной сессии прогоны должны давать одинаковый отчет.
+"""
+from pathlib import Path
+
+from dlink_reset import DLinkReset, AsyncDLinkReset
+from utils.stats_manager import StatsManager
+
+# Сброс DES-3200-28 через Recovery Mode, обновление PROM и прошивки (запись с simulator.py)
+SESSION = Path(__file__).resolve().parent / "data" / "des3200_recovery_upgrade.dlsession"
+
+
+def replay(cls, tmp_path, tag):
+    # Политика "count" детерминирована: порядок комбинаций клавиш совпадает с записью
+    run_dir = tmp_path / tag
+    run_dir.mkdir()
+    worker = cls(port="replay", model="DES-3200-28", stats=StatsManager(run_dir, policy="count"),
+                 log_tag=tag, replay_session=SESSION, metrics_dir=run_dir)
+    worker.run()
+    return worker.report_data
+
+
+def test_sync_and_async_reports_match(tmp_path):
+    sync_report = replay(DLinkReset, tmp_path, "parity_sync")
+    async_report = replay(AsyncDLinkReset, tmp_path, "parity_async")
+    assert sync_report["overall_status"] == "Success"
+    assert sync_report["firmware_final"] == "4.51.B018"
+    assert sync_report == async_report
@@ -0,0 +1,74 @@
+# tests/test_show_parser.py
+"""Разбор 'show switch' и 'dir' по таблице базового профиля D-Link (utils/show_parser.py)."""
+import json
+from pathlib import Path
+
+import pytest
+
+from utils.show_parser import compile_parsers
+
+PROFILE = Path(__file__).resolve().parent.parent / "config" / "devices" / "_D-Link.json"
+
+# Вывод DES-3200-28, записанный с консоли
+SHOW_SWITCH = (
+    "show switch\r\n"
+    "Command: show switch\r\n"
+    "\r\n"
+    "Device Type                : DES-3200-28 Fast Ethernet Switch\r\n"
+    "MAC Address                : 00-1E-58-AE-AC-27\r\n"
+    "IP Address                 : 10.90.90.90 (Manual)\r\n"
+    "VLAN Name                  : default\r\n"
+    "Subnet Mask                : 255.0.0.0\r\n"
+    "Default Gateway            : 0.0.0.0\r\n"
+    "Boot PROM Version          : Build 1.00.B004\r\n"
+    "Firmware Version           : Build 4.38.B000\r\n"
+    "Hardware Version           : A1\r\n"
+    "System Name                : \r\n"
+    "Serial Port                : 9600,8,None,1\r\n"
+    "\r\n"
+    "DES-3200-28:admin#"
+)
+
+DIR = (
+    "dir\r\n"
+    "Command: dir\r\n"
+    "\r\n"
+    " Directory of /c:\r\n"
+    "\r\n"
+    " Idx Info      Attr  Size       Update Time          Name\r\n"
+    " --- --------- ---- ---------- ------------------- ----------------\r\n"
+    "   1 RUN(*)    -rw-  4599220    2012/01/01 00:00:00  runtime1.had\r\n"
+    "   2 RUN       -rw-  4513172    2011/06/14 11:02:37  runtime2.had\r\n"
+    "   3 CFG(*)    -rw-  29986      2012/01/01 00:00:00  config.cfg\r\n"
+    "\r\n"
+    " 29618 KB total (21498 KB free)\r\n"
+    "DES-3200-28:admin#"
+)
+
+
+@pytest.fixture(scope="module")
+def parsers():
+    with open(PROFILE, "r", encoding="utf-8") as f:
+        return compile_parsers(json.load(f)["show_parsers"])
+
+
+def test_show_switch_fields(parsers):
+    assert parsers["show switch"].parse(SHOW_SWITCH) == {
+        "model": "DES-3200-28",
+        "mac_address": "00-1E-58-AE-AC-27",
+        "prom": "1.00.B004",
+        "firmware": "4.38.B000",
+    }
+
+
+def test_show_switch_missing_fields_are_none(parsers):
+    result = parsers["show switch"].parse("Device Type : DES-3200-28\r\n")
+    assert result["model"] == "DES-3200-28"
+    assert result["mac_address"] is None and result["firmware"] is None
+
+
+def test_dir_records(parsers):
+    records = parsers["dir"].parse(DIR)["records"]
+    assert [record["name"] for record in records] == ["runtime1.had", "runtime2.had", "config.cfg"]
+    assert records[0] == {"index": "1", "info": "RUN(*)", "attr": "-rw-", "size": "4599220",
+                          "time": "2012/01/01 00:00:00", "name": "runtime1.had"}
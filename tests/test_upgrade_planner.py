@@ -0,0 +1,52 @@
+# tests/test_upgrade_planner.py
+"""План обновления прошивки по графу версий (utils/upgrade_planner.py)."""
+from utils.upgrade_planner import plan_upgrade
+from utils.versions import Version
+
+# Целевой образ ставится только с 4.38.x, а 4.38 - только с 4.0 и новее
+FIRMWARE = {
+    "final_version": "4.51.B018",
+    "final_filename": "DES3200R_4.51.B018.had",
+    "images": [
+        {"version": "4.51.B018", "filename": "DES3200R_4.51.B018.had", "min_from": "4.38.B000"},
+        {"version": "4.38.B000", "filename": "DES3200R_4.38.B000.had", "min_from": "4.0"},
+        {"version": "4.0.B010", "filename": "DES3200R_4.0.B010.had"},
+    ],
+}
+
+
+def versions(plan):
+    return [str(step.version) for step in plan.steps]
+
+
+def test_two_hop_plan_follows_min_from_chain():
+    plan = plan_upgrade(Version("4.04.B005"), FIRMWARE)
+    assert versions(plan) == ["4.38.B000", "4.51.B018"]
+    assert plan.reboots == 2
+    assert plan.to_dict()["files"] == ["DES3200R_4.38.B000.had", "DES3200R_4.51.B018.had"]
+    assert plan.describe() == "4.04.B005 -> 4.38.B000 -> 4.51.B018"
+
+
+def test_old_version_takes_extra_hop():
+    plan = plan_upgrade(Version("3.60.B001"), FIRMWARE)
+    assert versions(plan) == ["4.0.B010", "4.38.B000", "4.51.B018"]
+
+
+def test_direct_step_when_min_from_is_met():
+    plan = plan_upgrade(Version("4.38.B000"), FIRMWARE)
+    assert versions(plan) == ["4.51.B018"]
+
+
+def test_estimate_counts_flash_and_reboot_per_step():
+    plan = plan_upgrade(Version("4.04.B005"), FIRMWARE, flash_seconds=100, reboot_seconds=20)
+    assert plan.estimated_seconds == 240
+
+
+def test_up_to_date_gives_empty_plan_unless_forced():
+    assert plan_upgrade(Version("4.51.B018"), FIRMWARE).steps == []
+    assert versions(plan_upgrade(Version("4.51.B018"), FIRMWARE, force=True)) == ["4.51.B018"]
+
+
+def test_no_path_returns_none():
+    firmware = dict(FIRMWARE, images=[FIRMWARE["images"][0]])
+    assert plan_upgrade(Version("4.04.B005"), firmware) is None
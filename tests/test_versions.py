@@ -0,0 +1,42 @@
+# tests/test_versions.py
+"""Порядок версий PROM и прошивок (utils/versions.py)."""
+import pytest
+
+from utils.versions import Version, parse_version
+
+
+def test_numeric_components_are_compared_as_numbers():
+    # Строковое сравнение дало бы '4.9.B001' > '4.38.B000'
+    assert Version("4.9.B001") < Version("4.38.B000") < Version("4.51.B018")
+
+
+def test_build_suffix_orders_builds_of_one_release():
+    assert Version("1.00.B004") < Version("1.00.B010")
+    assert Version("4.51.B018") > Version("4.51.B009")
+
+
+def test_trailing_zeros_are_ignored():
+    assert Version("4.4.1") == Version("4.4.1.0")
+    assert Version("4.4.1.0.001") > Version("4.4.1")
+    assert hash(Version("4.4.1")) == hash(Version("4.4.1.0.0"))
+
+
+def test_build_and_v_prefixes_are_stripped():
+    assert Version("Build 4.51.B018") == Version("4.51.B018")
+    assert Version("V2.00.005") == Version("2.00.005")
+
+
+def test_letter_suffix_follows_plain_number():
+    assert Version("1.10") < Version("1.10a") < Version("1.11")
+
+
+def test_parse_version_returns_none_for_unknown_format():
+    assert parse_version(None) is None
+    assert parse_version("") is None
+    assert parse_version("unknown") is None
+    assert parse_version("4.51.B018") == Version("4.51.B018")
+
+
+def test_version_raises_on_unknown_format():
+    with pytest.raises(ValueError):
+        Version("4..51")
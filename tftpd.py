@@ -0,0 +1,60 @@
+# tftpd.py
+"""
+Отдельный запуск встроенного TFTP-сервера (utils/tftp_server.py) для раздачи образов
+коммутаторам, которые прошиваются через main.py или GUI.
+По умолчанию раздаются только файлы, указанные в config/firmware_info.json.
+--root может указывать на хранилище образов (firmware.py): образы проверяются по SHA-256
+и раздаются через mmap.
+
+Пример:
+    python tftpd.py --root firmware
+    python tftpd.py --root firmware --port 6969 --max-blksize 8192 --max-windowsize 32
+Проверка на локальной машине:
+    curl --tftp-blksize 1468 -o test.had tftp://127.0.0.1:6969/DES3200_Run_4_51_B018.had
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+
+# Добавляем текущую директорию в путь поиска модулей
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils import config_loader
+from utils.tftp_server import TftpServer, firmware_filenames
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="TFTP-сервер образов PROM и прошивок.")
+    parser.add_argument("--root", required=True, help="Папка с образами или хранилище образов")
+    parser.add_argument("--host", default="0.0.0.0", help="Адрес (по умолчанию все интерфейсы)")
+    parser.add_argument("--port", type=int, default=69, help="UDP-порт (по умолчанию 69)")
+    parser.add_argument("--max-blksize", type=int, default=1468, help="Наибольший blksize, на который соглашается сервер")
+    parser.add_argument("--max-windowsize", type=int, default=64, help="Наибольший windowsize, на который соглашается сервер")
+    parser.add_argument("--any-file", action="store_true", help="Раздавать любые файлы из папки, а не только из firmware_info.json")
+    parser.add_argument("--debug", action="store_true", help="Включить подробное логирование")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, format="%(asctime)s %(message)s")
+
+    allowed = None
+    if not args.any_file:
+        firmware_info = config_loader.load_json_config(Path(__file__).resolve().parent / "config" / "firmware_info.json")
+        allowed = firmware_filenames(firmware_info)
+    server = TftpServer(args.root, host=args.host, port=args.port, allowed=allowed,
+                        max_blksize=args.max_blksize, max_windowsize=args.max_windowsize)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"❌ Не удалось запустить TFTP-сервер: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# utils/checkpoint_journal.py
+"""
+Журнал контрольных точек прогона DLinkReset. Каждый переход состояния и ключевые факты
+report_data дописываются строкой JSON в файл порта (stats/journal/<порт>.jsonl) с fsync:
+запись переживает падение процесса и отключение адаптера. Оборванная последняя строка
+при чтении пропускается.
+Новый прогон на том же порту находит незавершенный прогон и, если быстрая проверка CLI
+показывает тот же MAC, продолжает после сброса, а не начинает с Recovery Mode.
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+from utils import logger
+
+# Факты отчета, которые восстанавливаются при продолжении прогона
+FACTS = [
+    "model_detected", "mac_address", "reset_method", "reset_status", "reset_was_performed",
+    "prom_initial", "firmware_initial", "firmware_slots_before_update", "firmware_upgrade_plan",
+    "prom_reboot_initiated", "firmware_reboot_initiated", "tftp_ip_used", "overall_status",
+]
+# Незавершенный прогон старше этого срока не продолжается (сек)
+MAX_AGE = 24 * 3600
+# Размер журнала, после которого в нем остается только последний прогон (байт)
+MAX_BYTES = 1024 * 1024
+
+
+def same_mac(first, second):
+    """Сравнение MAC без учета регистра и разделителей ('00-1E-58-...' и '00:1e:58:...')."""
+    def normalize(mac):
+        return "".join(ch for ch in (mac or "").upper() if ch.isalnum())
+    return bool(normalize(first)) and normalize(first) == normalize(second)
+
+
+class CheckpointJournal:
+    def __init__(self, journal_dir, port):
+        self.port = port
+        self.path = Path(journal_dir) / f"{logger.safe_name(port)}.jsonl"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._compact()
+
+    def record(self, run_id, state, next_state, report_data):
+        """Дописывает переход state -> next_state и факты отчета."""
+        entry = {
+            "ts": time.time(),
+            "run": run_id,
+            "port": self.port,
+            "mac": report_data.get("mac_address"),
+            "state": state,
+            "next": next_state,
+            "facts": {key: report_data.get(key) for key in FACTS},
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def entries(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue # Строка, оборванная при падении
+        return entries
+
+    def pending(self, now=None):
+        """
+        Последняя запись незавершенного прогона, который можно продолжить, или None.
+        Прогон, дошедший до FINISHED, закрыт при любом итоге: после ошибки следующий запуск
+        начинает с Recovery. Продолжать есть смысл только после сброса и когда MAC уже известен.
+        """
+        entries = self.entries()
+        if not entries:
+            return None
+        last = entries[-1]
+        facts = last.get("facts", {})
+        if last.get("next") == "FINISHED":
+            return None
+        if (now or time.time()) - last.get("ts", 0) > MAX_AGE:
+            return None
+        if not facts.get("reset_was_performed") or not last.get("mac"):
+            return None
+        return last
+
+    def _compact(self):
+        """Оставляет в разросшемся журнале только последний прогон (атомарная замена файла)."""
+        try:
+            if self.path.stat().st_size <= MAX_BYTES:
+                return
+        except FileNotFoundError:
+            return
+        entries = self.entries()
+        last_run = entries[-1]["run"] if entries else None
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                if entry.get("run") == last_run:
+                    f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
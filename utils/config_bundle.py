@@ -0,0 +1,121 @@
+# utils/config_bundle.py
+"""
+Скомпилированная конфигурация устройства: файлы папки config и профиль модели, проверенные
+по схемам (config_loader.validate_configs), и заранее скомпилированные паттерны и таблицы разбора.
+Сборка выполняется один раз на (папку, производителя, модель): в процессе результат общий
+для всех экземпляров DLinkReset, на диске проверенные данные кешируются в config/.cache.
+Кеш сбрасывается при изменении любого исходного файла (время изменения и размер).
+"""
+import json
+import os
+import threading
+
+from utils import config_loader, pattern_matcher, show_parser
+
+# Папка дискового кеша внутри папки config
+CACHE_DIR = ".cache"
+# Версия формата кеша: меняется вместе со схемами конфигурации
+CACHE_VERSION = 4
+
+
+class ConfigBundle:
+    """
+    Проверенная конфигурация одной модели. Общая для всех потоков - только для чтения:
+    экземпляр, которому нужно изменить набор, копирует его (см. DLinkReset._load_configs).
+    """
+    def __init__(self, configs, model, vendor):
+        self.model = model
+        self.vendor = vendor
+        self.device = configs['device']
+        self.patterns = configs['patterns']
+        self.credentials = configs['credentials']
+        self.reset_commands = configs['reset_commands']
+        self.timeouts = configs['timeouts']
+        self.firmware_info = configs['firmware_info']
+        # Все регулярные выражения компилируются один раз; ошибки видны до работы с портом
+        self.pattern_matcher = pattern_matcher.compile_patterns(self.patterns)
+        # Матчеры отдельных наборов попадают в кеш get_matcher: ожидания не компилируют их заново
+        self.matchers = {key: pattern_matcher.get_matcher([entry]) for key, entry in self.patterns.items()}
+        # Таблицы разбора вывода 'show ...' профиля
+        self.show_parsers = show_parser.compile_parsers(self.device.get("show_parsers"))
+
+
+_bundles = {}
+_lock = threading.Lock()
+
+
+def source_files(config_dir, model, vendor):
+    """Файлы, из которых собирается конфигурация модели (все профили - из-за наследования)."""
+    return [os.path.join(config_dir, filename) for filename in config_loader.MAIN_CONFIG_FILES.values()] + \
+        config_loader.devices_files(config_dir)
+
+
+def _signature(files):
+    """Версия формата и [путь, время изменения, размер] файлов - в виде, который сохраняется в JSON."""
+    signature = [CACHE_VERSION]
+    for path in files:
+        try:
+            st = os.stat(path)
+            signature.append([path, st.st_mtime_ns, st.st_size])
+        except OSError:
+            signature.append([path, None, None])
+    return signature
+
+
+def _cache_path(config_dir, model, vendor):
+    return os.path.join(config_dir, CACHE_DIR, f"{config_loader.profile_name(model, vendor)}.json")
+
+
+def _read_cache(path, signature):
+    """
+    Проверенные конфигурации из кеша или None (нет файла, устарел, поврежден).
+    Кеш - обычный JSON: данные load_all_configs, паттерны компилируются в ConfigBundle.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get("signature") != signature:
+        return None
+    return cached.get("configs")
+
+
+def _write_cache(path, signature, configs):
+    """Атомарная запись кеша; папка только для чтения - не ошибка, просто без кеша."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"signature": signature, "configs": configs}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_bundle(config_dir, model, vendor, use_disk_cache=True):
+    """
+    Конфигурация модели: из памяти процесса, из дискового кеша или с разбором и проверкой файлов.
+    model=None - базовый профиль производителя (модель определяется по выводу консоли).
+    Ошибки конфигурации - config_loader.ConfigError, отсутствие профиля - FileNotFoundError.
+    """
+    config_dir = os.path.abspath(config_dir)
+    files = source_files(config_dir, model, vendor)
+    signature = _signature(files)
+    key = (config_dir, vendor, model)
+    with _lock:
+        cached = _bundles.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        cache_path = _cache_path(config_dir, model, vendor)
+        configs = _read_cache(cache_path, signature) if use_disk_cache else None
+        if configs is None:
+            configs = config_loader.load_all_configs(config_dir, model, vendor)
+            config_loader.validate_configs(configs, config_loader.profile_name(model, vendor))
+            if use_disk_cache:
+                _write_cache(cache_path, signature, configs)
+        bundle = ConfigBundle(configs, model, vendor)
+        _bundles[key] = (signature, bundle)
+        return bundle
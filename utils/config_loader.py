@@ -1,53 +1,329 @@
 # utils/config_loader.py
 """
 Загрузчик и валидатор конфигурационных файлов.
+Профили устройств (config/devices) наследуются: "extends" - имя базового профиля
+(базовые профили производителя и семейств начинаются с "_"). Наборы команд сброса
+можно задать в профиле списком вместо имени набора из reset_commands.json.
 """
+import copy
 import json
 import os
+import re
+import threading
+
+from utils import pattern_matcher
+
+class ConfigError(ValueError):
+    """Конфигурация не соответствует схеме; текст содержит путь к ошибочному значению."""
+
+def load_json_config(file_path):
+    """Загружает один JSON-файл конфигурации; отсутствующий файл - пустой словарь."""
+    if os.path.exists(file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    print(f"⚠️ Файл конфигурации не найден: {file_path}")
+    return {}
+
+# Основные конфигурационные файлы: ключ в configs -> имя файла в папке config
+MAIN_CONFIG_FILES = {
+    'patterns': 'patterns.json',
+    'credentials': 'credentials.json',
+    'reset_commands': 'reset_commands.json',
+    'timeouts': 'timeouts.json',
+    'firmware_info': 'firmware_info.json',
+}
+
+# Префикс имени базового профиля (производителя, семейства): такие файлы не являются моделями
+BASE_PROFILE_PREFIX = "_"
+# Ключи профиля с набором команд сброса и набор по умолчанию
+COMMAND_SET_KEYS = {"recovery_commands": "recovery", "cli_commands": "cli"}
+
+def profile_name(model, vendor):
+    """Имя профиля: "<vendor>_<model>"; без модели - базовый профиль производителя "_<vendor>"."""
+    return f"{vendor}_{model}" if model else f"{BASE_PROFILE_PREFIX}{vendor}"
+
+def device_config_path(config_dir, model, vendor):
+    return os.path.join(config_dir, "devices", f"{profile_name(model, vendor)}.json")
+
+def devices_files(config_dir):
+    """Все файлы профилей папки devices (включая базовые)."""
+    devices_dir = os.path.join(config_dir, "devices")
+    if not os.path.isdir(devices_dir):
+        return []
+    return sorted(os.path.join(devices_dir, name) for name in os.listdir(devices_dir) if name.endswith(".json"))
+
+def merge_profiles(base, override):
+    """Профиль-наследник: словари сливаются рекурсивно, остальные значения (и списки) заменяются."""
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_profiles(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+class ProfileIndex:
+    """
+    Профили папки devices с разрешенным наследованием. Поиск за O(1):
+    по производителю и модели (имя файла "<vendor>_<model>.json") и по base_model_indicator
+    (по умолчанию - имя модели). detect() находит модель в выводе консоли одним проходом
+    по объединенному выражению всех индикаторов.
+    """
+    def __init__(self, config_dir):
+        self.config_dir = config_dir
+        self._raw = {}
+        for path in devices_files(config_dir):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._raw[os.path.basename(path)[:-5]] = json.load(f)
+        self._resolved = {}
+        self.profiles = {}      # (vendor, model) -> профиль
+        self.by_indicator = {}  # base_model_indicator -> (vendor, model)
+        for name in self._raw:
+            if name.startswith(BASE_PROFILE_PREFIX):
+                continue
+            vendor, _, model = name.partition("_")
+            profile = self._resolve(name, [])
+            profile.setdefault("base_model_indicator", model)
+            indicator = profile["base_model_indicator"]
+            if indicator in self.by_indicator:
+                raise ConfigError(f"devices/{name}: base_model_indicator '{indicator}' уже занят "
+                                  f"{'_'.join(self.by_indicator[indicator])}")
+            self.profiles[(vendor, model)] = profile
+            self.by_indicator[indicator] = (vendor, model)
+        self._matcher = None
+
+    def _resolve(self, name, chain):
+        if name in chain:
+            raise ConfigError(f"devices/{chain[0]}: циклическое наследование {' -> '.join(chain + [name])}")
+        if name not in self._raw:
+            raise ConfigError(f"devices/{chain[-1]}: базовый профиль '{name}' не найден")
+        if name not in self._resolved:
+            profile = dict(self._raw[name])
+            parent = profile.pop("extends", None)
+            if parent is not None and not isinstance(parent, str):
+                raise ConfigError(f"devices/{name}.extends: ожидается имя профиля, получено {parent!r}")
+            self._resolved[name] = merge_profiles(self._resolve(parent, chain + [name]), profile) \
+                if parent else copy.deepcopy(profile)
+        return copy.deepcopy(self._resolved[name])
+
+    def get(self, vendor, model):
+        """Копия профиля модели (без модели - базового профиля производителя) или None."""
+        if not model:
+            name = profile_name(model, vendor)
+            return self._resolve(name, []) if name in self._raw else None
+        profile = self.profiles.get((vendor, model))
+        return copy.deepcopy(profile) if profile is not None else None
+
+    def find(self, indicator):
+        """(vendor, model) по base_model_indicator или None."""
+        return self.by_indicator.get(indicator)
+
+    def matcher(self):
+        """
+        Матчер всех индикаторов моделей. Индикатор не должен быть частью более длинного имени
+        ('DES-3028' в 'DES-3028P'), а при общем начале более длинный проверяется первым.
+        """
+        if self._matcher is None:
+            indicators = sorted(self.by_indicator, key=len, reverse=True)
+            self._matcher = pattern_matcher.PatternMatcher(
+                {indicator: rf"(?<![\w-]){re.escape(indicator)}(?![\w-])" for indicator in indicators})
+        return self._matcher
+
+    def detect(self, text):
+        """(vendor, model) первого индикатора модели в тексте или None."""
+        match = self.matcher().search(text) if text else None
+        return self.by_indicator[match.name] if match else None
+
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+def load_profile_index(config_dir):
+    """Индекс профилей; пересобирается, только если файлы папки devices изменились."""
+    files = devices_files(config_dir)
+    signature = tuple((path, os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in files)
+    key = os.path.abspath(config_dir)
+    with _index_lock:
+        cached = _indexes.get(key)
+        if cached is None or cached[0] != signature:
+            cached = (signature, ProfileIndex(config_dir))
+            _indexes[key] = cached
+        return cached[1]
 
 def load_all_configs(config_dir, model, vendor):
     """Загружает все конфигурационные файлы."""
     configs = {}
     
     # Загрузка основных конфигов
-    main_config_files = {
-        'patterns': 'patterns.json',
-        'credentials': 'credentials.json',
-        'reset_commands': 'reset_commands.json',
-        'timeouts': 'timeouts.json',
-        'firmware_info': 'firmware_info.json',
-    }
+    for key, filename in MAIN_CONFIG_FILES.items():
+        configs[key] = load_json_config(os.path.join(config_dir, filename))
     
-    for key, filename in main_config_files.items():
-        file_path = os.path.join(config_dir, filename)
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                configs[key] = json.load(f)
-        else:
-            configs[key] = {}
-            print(f"⚠️ Файл конфигурации не найден: {file_path}")
-    
-    # Загрузка конфига устройства
-    device_filename = f"{vendor}_{model}.json"
-    device_file_path = os.path.join(config_dir, "devices", device_filename)
-    if os.path.exists(device_file_path):
-        with open(device_file_path, 'r', encoding='utf-8') as f:
-            configs['device'] = json.load(f)
-    else:
-        raise FileNotFoundError(f"❌ Конфигурационный файл для устройства {vendor} {model} не найден: {device_file_path}")
+    # Загрузка конфига устройства (с учетом наследования)
+    device = load_profile_index(config_dir).get(vendor, model)
+    if device is None:
+        raise FileNotFoundError(f"❌ Конфигурационный файл для устройства {vendor} {model or ''} не найден: "
+                                f"{device_config_path(config_dir, model, vendor)}")
+
+    # Наборы команд, заданные в профиле списком, получают имя в reset_commands
+    for key, default in COMMAND_SET_KEYS.items():
+        commands = device.get(key, default)
+        if isinstance(commands, list):
+            name = f"{profile_name(model, vendor)}:{default}"
+            configs['reset_commands'] = dict(configs['reset_commands'], **{name: commands})
+            device[key] = name
+    configs['device'] = device
 
     # Слияние таймаутов, если есть дефолты и специфичные для модели (пока просто используем общие)
     # ...
     return configs
 
-def validate_configs(device_cfg, patterns):
-    """Выполняет базовую валидацию конфигов."""
-    required_device_keys = ['baudrate', 'recovery_combinations']
-    for key in required_device_keys:
-        if key not in device_cfg:
-            raise ValueError(f"Отсутствует обязательный ключ в конфигурации устройства: {key}")
-
-    required_pattern_keys = ['boot_indicators', 'recovery_indicators', 'USER_PROMPT', 'PRIVILEGED_PROMPT']
-    for key in required_pattern_keys:
-        if key not in patterns:
-            raise ValueError(f"Отсутствует обязательный ключ в паттернах: {key}")
+class Fields:
+    """Схема словаря: обязательные и необязательные ключи; values - схема значений с произвольными ключами."""
+    def __init__(self, required=None, optional=None, values=None):
+        self.required = required or {}
+        self.optional = optional or {}
+        self.values = values
+
+
+class AnyOf:
+    """Значение подходит под одну из схем."""
+    def __init__(self, *schemas):
+        self.schemas = schemas
+
+
+class Hex:
+    """Строка шестнадцатеричных байт (комбинации клавиш)."""
+
+
+class Regex:
+    """Регулярное выражение (таблицы разбора show_parsers)."""
+
+
+NUMBER = (int, float)
+# Паттерн patterns.json: строка или список строк
+PATTERN = AnyOf(str, [str])
+CREDENTIAL = Fields(required={"id": str, "login": str, "password": str})
+RESET_COMMAND = Fields(required={"id": str, "command": str}, optional={"confirm": bool})
+# Образ прошивки с ограничением версий, с которых его можно ставить (utils/upgrade_planner.py)
+FIRMWARE_IMAGE = Fields(required={"version": str, "filename": str}, optional={"min_from": str, "max_from": str})
+# Таблица разбора одной команды (utils/show_parser.py)
+SHOW_PARSER = Fields(optional={"fields": Fields(values=AnyOf(Regex, [Regex])), "records": AnyOf(Regex, [Regex])})
+
+DEVICE_SCHEMA = Fields(
+    required={
+        "baudrate": int,
+        "recovery_combinations": [Fields(required={"id": str, "hex": Hex}, optional={"description": str})],
+    },
+    optional={
+        "base_model_indicator": str,
+        "family": str,
+        "boot_menu_combination": Hex,
+        "recovery_commands": str,
+        "cli_commands": str,
+        "tftp_ip_candidates": [str],
+        "post_config_commands": [str],
+        "baudrate_candidates": [int],
+        "console_speed_command": str,
+        "boot_menu": dict,
+        "combined_prom_update": bool,
+        "show_parsers": Fields(values=SHOW_PARSER),
+    },
+)
+CONFIG_SCHEMAS = {
+    "device": DEVICE_SCHEMA,
+    "patterns": Fields(
+        required={key: PATTERN for key in ["boot_indicators", "recovery_indicators", "USER_PROMPT", "PRIVILEGED_PROMPT"]},
+        values=PATTERN),
+    "credentials": Fields(optional={"recovery": [CREDENTIAL], "cli": [CREDENTIAL]}),
+    "reset_commands": Fields(values=[RESET_COMMAND]),
+    "timeouts": Fields(
+        required={key: NUMBER for key in ["reboot_wait", "prompt_wait", "login_attempt", "command_default",
+                                          "firmware_download", "ping_wait", "boot_menu_wait"]},
+        values=NUMBER),
+    # модель -> prom/firmware -> имена файлов и версии; firmware.images - граф обновления
+    "firmware_info": Fields(values=Fields(
+        optional={"firmware": Fields(optional={"images": [FIRMWARE_IMAGE]}, values=str)},
+        values=Fields(values=str))),
+}
+
+
+def _type_name(schema):
+    if isinstance(schema, tuple):
+        return " или ".join(t.__name__ for t in schema)
+    return getattr(schema, "__name__", type(schema).__name__)
+
+
+def check_schema(value, schema, path):
+    """Проверяет значение по схеме; при несоответствии - ConfigError с путем к значению."""
+    if isinstance(schema, AnyOf):
+        for option in schema.schemas:
+            try:
+                return check_schema(value, option, path)
+            except ConfigError:
+                pass
+        raise ConfigError(f"{path}: недопустимое значение {value!r}")
+    if schema is Hex:
+        try:
+            if not isinstance(value, str) or not bytes.fromhex(value):
+                raise ValueError
+        except ValueError:
+            raise ConfigError(f"{path}: ожидается HEX-строка, получено {value!r}")
+        return
+    if schema is Regex:
+        if not isinstance(value, str):
+            raise ConfigError(f"{path}: ожидается регулярное выражение, получено {type(value).__name__}")
+        try:
+            re.compile(value)
+        except re.error as e:
+            raise ConfigError(f"{path}: некорректное регулярное выражение {value!r}: {e}")
+        return
+    if isinstance(schema, list):
+        if not isinstance(value, list):
+            raise ConfigError(f"{path}: ожидается список, получено {type(value).__name__}")
+        for index, item in enumerate(value):
+            check_schema(item, schema[0], f"{path}[{index}]")
+        return
+    if isinstance(schema, Fields):
+        if not isinstance(value, dict):
+            raise ConfigError(f"{path}: ожидается словарь, получено {type(value).__name__}")
+        for key in schema.required:
+            if key not in value:
+                raise ConfigError(f"{path}: отсутствует обязательный ключ '{key}'")
+        for key, item in value.items():
+            item_schema = schema.required.get(key) or schema.optional.get(key) or schema.values
+            if item_schema is not None:
+                check_schema(item, item_schema, f"{path}.{key}")
+        return
+    # bool - подкласс int, но в конфигурации это разные вещи
+    if not isinstance(value, schema) or (isinstance(value, bool) and schema is not bool):
+        raise ConfigError(f"{path}: ожидается {_type_name(schema)}, получено {type(value).__name__}")
+
+
+def _check_unique_ids(items, path):
+    ids = [item["id"] for item in items]
+    duplicates = sorted({item_id for item_id in ids if ids.count(item_id) > 1})
+    if duplicates:
+        raise ConfigError(f"{path}: повторяющиеся id: {', '.join(duplicates)}")
+
+
+def validate_configs(configs, model=""):
+    """
+    Проверяет все конфигурации (результат load_all_configs) по схемам CONFIG_SCHEMAS
+    и перекрестные ссылки: наборы команд сброса из профиля, уникальность id.
+    Ошибки - ConfigError до начала работы с портом.
+    """
+    for key, schema in CONFIG_SCHEMAS.items():
+        check_schema(configs.get(key, {}), schema, f"{key}.json" if key != "device" else f"devices/{model}")
+
+    device = configs["device"]
+    reset_commands = configs.get("reset_commands", {})
+    for key, default in COMMAND_SET_KEYS.items():
+        name = device.get(key, default)
+        if name not in reset_commands:
+            raise ConfigError(f"devices/{model}.{key}: набора команд '{name}' нет в reset_commands.json")
+    _check_unique_ids(device["recovery_combinations"], f"devices/{model}.recovery_combinations")
+    for name, commands in reset_commands.items():
+        _check_unique_ids(commands, f"reset_commands.json.{name}")
+    for kind, credentials in configs.get("credentials", {}).items():
+        _check_unique_ids(credentials, f"credentials.json.{kind}")
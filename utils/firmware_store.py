@@ -0,0 +1,228 @@
+# utils/firmware_store.py
+"""
+Локальное хранилище образов PROM и прошивок с адресацией по SHA-256.
+Файлы лежат в objects/<первые 2 символа>/<sha256>, индекс index.json связывает
+модель, тип образа (prom/firmware) и версию с хешем, а хеш - с размером и именами файлов.
+Каждый образ проверяется один раз (повторно - только если файл изменился),
+раздача идет через mmap без чтения файла в память.
+"""
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from utils.upgrade_planner import image_files
+
+INDEX_FILE = "index.json"
+OBJECTS_DIR = "objects"
+HASH_CHUNK = 1024 * 1024
+
+
+class FirmwareStoreError(Exception):
+    pass
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FirmwareStore:
+    """
+    Хранилище образов. Один экземпляр можно использовать из нескольких потоков.
+
+    Индекс:
+        "images": {sha256: {"size", "filenames": [...], "added", "verified_mtime_ns"}}
+        "models": {модель: {"prom"|"firmware": {версия: sha256}}}
+    """
+    def __init__(self, root):
+        self.root = Path(root)
+        self._lock = threading.RLock()
+        self._maps = {}     # sha256 -> (файл, mmap) открытых образов
+        self.index = self._load_index()
+
+    @staticmethod
+    def is_store(path):
+        return (Path(path) / INDEX_FILE).is_file()
+
+    def _load_index(self):
+        index_path = self.root / INDEX_FILE
+        if index_path.exists():
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        else:
+            index = {}
+        index.setdefault("images", {})
+        index.setdefault("models", {})
+        return index
+
+    def _save_index(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        index_path = self.root / INDEX_FILE
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+    def object_path(self, sha256):
+        return self.root / OBJECTS_DIR / sha256[:2] / sha256
+
+    # --- Добавление ---
+
+    def add(self, source_path, model, kind, version, filename=None):
+        """
+        Копирует образ в хранилище и привязывает его к модели и версии.
+        filename - имя, под которым образ запрашивают по TFTP (по умолчанию имя исходного файла).
+        Возвращает sha256.
+        """
+        source_path = Path(source_path)
+        filename = filename or source_path.name
+        sha256 = _sha256_file(source_path)
+        target = self.object_path(sha256)
+        with self._lock:
+            if not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = target.with_suffix(".tmp")
+                shutil.copyfile(source_path, tmp_path)
+                if _sha256_file(tmp_path) != sha256:
+                    os.remove(tmp_path)
+                    raise FirmwareStoreError(f"Файл {source_path} изменился во время копирования")
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, target)
+            image = self.index["images"].setdefault(sha256, {"size": target.stat().st_size, "filenames": [],
+                                                             "added": datetime.now().isoformat(timespec="seconds")})
+            image["verified_mtime_ns"] = target.stat().st_mtime_ns
+            if filename not in image["filenames"]:
+                image["filenames"].append(filename)
+            self.index["models"].setdefault(model, {}).setdefault(kind, {})[version] = sha256
+            self._save_index()
+        return sha256
+
+    def import_firmware_info(self, source_dir, firmware_info):
+        """
+        Добавляет образы, перечисленные в firmware_info.json, из папки source_dir.
+        Возвращает (добавленные, отсутствующие) - списки имен файлов.
+        """
+        added, missing = [], []
+        for model, kind, version, filename in self.expected_images(firmware_info):
+            source_path = Path(source_dir) / filename
+            if source_path.is_file():
+                self.add(source_path, model, kind, version, filename)
+                added.append(filename)
+            else:
+                missing.append(filename)
+        return added, missing
+
+    @staticmethod
+    def expected_images(firmware_info):
+        """Образы из firmware_info.json: (модель, тип, версия, имя файла)."""
+        for model, model_info in firmware_info.items():
+            prom = model_info.get("prom", {})
+            if prom.get("filename") and prom.get("target_version"):
+                yield model, "prom", prom["target_version"], prom["filename"]
+            for version, filename in image_files(model_info.get("firmware", {})):
+                yield model, "firmware", version, filename
+
+    # --- Поиск и проверка ---
+
+    def lookup(self, model, kind, version):
+        """sha256 образа модели нужного типа и версии или None."""
+        with self._lock:
+            return self.index["models"].get(model, {}).get(kind, {}).get(version)
+
+    def find_by_filename(self, filename):
+        with self._lock:
+            for sha256, image in self.index["images"].items():
+                if filename in image["filenames"]:
+                    return sha256
+        return None
+
+    def verify(self, sha256):
+        """
+        Проверяет наличие, размер и хеш образа. Хеш пересчитывается, только если файл
+        изменился после прошлой проверки. Возвращает None или описание проблемы.
+        """
+        with self._lock:
+            image = self.index["images"].get(sha256)
+            if image is None:
+                return "образ не зарегистрирован в индексе"
+            path = self.object_path(sha256)
+            try:
+                stat = path.stat()
+            except OSError:
+                return f"файл {path} отсутствует"
+            if stat.st_size != image["size"]:
+                return f"размер {stat.st_size} вместо {image['size']}"
+            if image.get("verified_mtime_ns") == stat.st_mtime_ns:
+                return None
+            if _sha256_file(path) != sha256:
+                return "контрольная сумма SHA-256 не совпадает"
+            image["verified_mtime_ns"] = stat.st_mtime_ns
+            self._save_index()
+            return None
+
+    def check(self, model, kind, version, filename):
+        """
+        Проверяет, что образ для модели и версии есть в хранилище, цел и доступен под именем filename.
+        Возвращает None или описание проблемы.
+        """
+        with self._lock:
+            sha256 = self.lookup(model, kind, version)
+            if sha256 is None:
+                return f"нет в хранилище ({model}, {kind} {version})"
+            if filename not in self.index["images"].get(sha256, {}).get("filenames", []):
+                return f"в хранилище образ записан под другим именем, чем {filename}"
+            return self.verify(sha256)
+
+    def verify_all(self):
+        """Проверяет все образы. Возвращает {sha256: описание проблемы} для неисправных."""
+        with self._lock:
+            hashes = list(self.index["images"])
+        problems = {}
+        for sha256 in hashes:
+            problem = self.verify(sha256)
+            if problem:
+                problems[sha256] = problem
+        return problems
+
+    # --- Раздача ---
+
+    def open_image(self, filename):
+        """
+        Проверенный образ по имени файла как memoryview на mmap (только чтение).
+        Отображение общее для всех передач и закрывается в close().
+        """
+        sha256 = self.find_by_filename(filename)
+        if sha256 is None:
+            raise FirmwareStoreError(f"Образ {filename} не найден в хранилище")
+        with self._lock:
+            if sha256 not in self._maps:
+                problem = self.verify(sha256)
+                if problem:
+                    raise FirmwareStoreError(f"Образ {filename} поврежден: {problem}")
+                f = open(self.object_path(sha256), "rb")
+                if self.index["images"][sha256]["size"] == 0:
+                    # mmap не отображает пустые файлы
+                    self._maps[sha256] = (f, b"")
+                else:
+                    self._maps[sha256] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            return memoryview(self._maps[sha256][1])
+
+    def close(self):
+        with self._lock:
+            for f, mapped in self._maps.values():
+                if isinstance(mapped, mmap.mmap):
+                    try:
+                        mapped.close()
+                    except BufferError:
+                        # Передача еще держит memoryview: отображение закроется вместе с ним
+                        pass
+                f.close()
+            self._maps.clear()
@@ -4,6 +4,7 @@
 """
 import logging
 import os
+import re
 from datetime import datetime
 import queue
 
@@ -25,25 +26,35 @@ logging.addLevelName(logging.CRITICAL, "CRITICAL")
 logging.Logger.step = step
 logging.Logger.success = success
 
-def setup_logger(logs_dir, debug=False):
-    """Настраивает и возвращает логгер."""
-    logger = logging.getLogger(f"DLinkReset_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+def setup_logger(logs_dir, debug=False, tag=None):
+    """
+    Настраивает и возвращает логгер.
+    tag - метка экземпляра (например, имя порта) для пакетного режима:
+    у каждого порта свой логгер, свой файл и префикс в консоли.
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    suffix = f"_{safe_name(tag)}" if tag else ""
+    logger = logging.getLogger(f"DLinkReset_{timestamp}{suffix}")
     logger.setLevel(logging.DEBUG if debug else logging.INFO)
 
     if not logger.handlers:
-        log_filename = f"dlink_reset_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+        log_filename = f"dlink_reset_{timestamp}{suffix}.log"
         file_handler = logging.FileHandler(os.path.join(logs_dir, log_filename), encoding='utf-8')
         file_formatter = logging.Formatter('%(asctime)s [%(levelname)-8s] %(message)s')
         file_handler.setFormatter(file_formatter)
         logger.addHandler(file_handler)
 
         console_handler = logging.StreamHandler()
-        console_formatter = logging.Formatter('%(message)s')
+        console_formatter = logging.Formatter(f"[{tag}] %(message)s" if tag else '%(message)s')
         console_handler.setFormatter(console_formatter)
         logger.addHandler(console_handler)
 
     return logger
 
+def safe_name(text):
+    """Приводит строку (например, '/dev/ttyUSB0') к виду, допустимому в имени файла."""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(text)).strip('_')
+
 # --- Обработчик для очереди логов GUI ---
 class QueueLogHandler(logging.Handler):
     """Обработчик логов, отправляющий записи в очередь."""
@@ -0,0 +1,129 @@
+# utils/metrics.py
+"""
+Метрики прогона DLinkReset: время и число посещений состояний, перезагрузки,
+объем обмена с портом, команды и их задержка.
+Экспорт в report_data, JSON и текстовый файл Prometheus (node_exporter textfile collector).
+"""
+import json
+import os
+import re
+
+# Команды, чей вывод не отличается по аргументам: метка = первые слова без аргументов
+_LABEL_WORD = re.compile(r"^[A-Za-z_]+$")
+
+
+def command_label(command, max_words=2):
+    """
+    Метка команды для метрик: первые слова из букв ('show switch', 'download firmware_fromTFTP').
+    Аргументы (адреса, имена файлов) отбрасываются, чтобы число меток не росло.
+    """
+    words = []
+    for word in command.split()[:max_words]:
+        if not _LABEL_WORD.match(word):
+            break
+        words.append(word)
+    return " ".join(words) or "other"
+
+
+class RunMetrics:
+    """Счетчики одного прогона."""
+    def __init__(self):
+        self.states = {}        # состояние -> {"visits", "seconds", "max_seconds"}
+        self.visits = []        # [(состояние, секунды)] в порядке прохождения
+        self.commands = {}      # метка -> {"count", "seconds", "max_seconds", "timeouts"}
+        self.counters = {"reboots": 0}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.duration = None
+
+    def record_state(self, state, seconds):
+        entry = self.states.setdefault(state, {"visits": 0, "seconds": 0.0, "max_seconds": 0.0})
+        entry["visits"] += 1
+        entry["seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        self.visits.append((state, round(seconds, 3)))
+
+    def record_command(self, label, seconds, matched):
+        entry = self.commands.setdefault(label, {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "timeouts": 0})
+        entry["count"] += 1
+        entry["seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        if not matched:
+            entry["timeouts"] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        def rounded(table):
+            return {name: {k: round(v, 3) if isinstance(v, float) else v for k, v in data.items()}
+                    for name, data in table.items()}
+        return {
+            "duration_seconds": round(self.duration, 3) if self.duration is not None else None,
+            "states": rounded(self.states),
+            "state_sequence": self.visits,
+            "commands": rounded(self.commands),
+            "counters": dict(self.counters),
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+    def save_json(self, path, extra=None):
+        data = dict(extra or {})
+        data["metrics"] = self.to_dict()
+        _atomic_write(path, json.dumps(data, indent=4, ensure_ascii=False))
+
+    def save_prometheus(self, path, labels, success=None):
+        """
+        Пишет метрики последнего прогона в формате Prometheus text exposition.
+        labels - общие метки (порт, модель); файл заменяется атомарно.
+        """
+        lines = []
+
+        def metric(name, help_text, samples, metric_type="gauge"):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for extra, value in samples:
+                lines.append(f"{name}{_format_labels(dict(labels, **extra))} {value}")
+
+        metric("dlink_run_duration_seconds", "Длительность прогона.", [({}, _num(self.duration or 0))])
+        if success is not None:
+            metric("dlink_run_success", "1 - прогон завершен успешно.", [({}, int(bool(success)))])
+        metric("dlink_state_visits", "Число посещений состояния.",
+               [({"state": s}, d["visits"]) for s, d in self.states.items()])
+        metric("dlink_state_seconds", "Суммарное время в состоянии.",
+               [({"state": s}, _num(d["seconds"])) for s, d in self.states.items()])
+        metric("dlink_state_max_seconds", "Самое долгое посещение состояния.",
+               [({"state": s}, _num(d["max_seconds"])) for s, d in self.states.items()])
+        metric("dlink_commands", "Число отправленных команд.",
+               [({"command": c}, d["count"]) for c, d in self.commands.items()])
+        metric("dlink_command_seconds", "Суммарная задержка ответа на команду.",
+               [({"command": c}, _num(d["seconds"])) for c, d in self.commands.items()])
+        metric("dlink_command_timeouts", "Команды без ожидаемого ответа.",
+               [({"command": c}, d["timeouts"]) for c, d in self.commands.items()])
+        metric("dlink_counter", "Прочие счетчики прогона (перезагрузки и т.п.).",
+               [({"name": n}, v) for n, v in self.counters.items()])
+        metric("dlink_serial_bytes_read", "Принято байт из порта.", [({}, self.bytes_read)])
+        metric("dlink_serial_bytes_written", "Отправлено байт в порт.", [({}, self.bytes_written)])
+        _atomic_write(path, "\n".join(lines) + "\n")
+
+
+def _num(value):
+    return f"{value:.3f}"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _atomic_write(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,127 @@
+# utils/ordering.py
+"""
+Политики порядка перебора (учетные данные, команды сброса, комбинации клавиш Recovery).
+Каждый элемент - "рука" многорукого бандита: попытка стоит до login_attempt секунд,
+поэтому важно чаще начинать с того, что срабатывает сейчас, и изредка пробовать новое.
+Счетчики затухают со временем (weighted_*): старые успехи весят меньше недавних.
+"""
+import math
+import random
+
+# Период полураспада веса попытки (дней)
+DEFAULT_HALF_LIFE_DAYS = 30
+# Априорное Beta(a, b) для Thompson sampling: без данных вероятность успеха 0.5
+THOMPSON_PRIOR = (1.0, 1.0)
+# Коэффициент исследования UCB1
+UCB_EXPLORATION = math.sqrt(2)
+
+
+def decay(value, elapsed, half_life):
+    """Вес value спустя elapsed секунд при периоде полураспада half_life (сек)."""
+    if not value or elapsed <= 0 or not half_life:
+        return value
+    return value * 0.5 ** (elapsed / half_life)
+
+
+def new_entry():
+    return {"success": 0, "total": 0, "weighted_success": 0.0, "weighted_total": 0.0, "updated": None}
+
+
+def record(entry, success, now, half_life):
+    """Учитывает попытку в записи статистики (та же арифметика, что и в StatsManager)."""
+    elapsed = now - entry["updated"] if entry["updated"] is not None else 0
+    entry["success"] += int(bool(success))
+    entry["total"] += 1
+    entry["weighted_success"] = decay(entry["weighted_success"], elapsed, half_life) + int(bool(success))
+    entry["weighted_total"] = decay(entry["weighted_total"], elapsed, half_life) + 1
+    entry["updated"] = now
+
+
+def decayed(entry, now, half_life):
+    """Копия записи с весами, затухшими к моменту now."""
+    elapsed = now - entry["updated"] if entry.get("updated") is not None else 0
+    return dict(entry,
+                weighted_success=decay(entry.get("weighted_success", 0.0), elapsed, half_life),
+                weighted_total=decay(entry.get("weighted_total", 0.0), elapsed, half_life))
+
+
+class SuccessCountPolicy:
+    """Прежний порядок: по числу успехов, элементы без статистики в конце."""
+    name = "count"
+
+    def order(self, items, stats):
+        def sort_key(item):
+            item_id = item.get('id')
+            if item_id and item_id in stats:
+                entry = stats[item_id]
+                # Сортируем по успехам (по убыванию), затем по общему кол-ву (по возрастанию, чтобы новые были в начале)
+                return (-entry.get('success', 0), entry.get('total', 0))
+            return (0, float('inf')) # Элементы без статистики в конец
+        return sorted(items, key=sort_key)
+
+
+class ThompsonPolicy:
+    """
+    Thompson sampling: для каждого элемента берется выборка из Beta(a + успехи, b + неудачи)
+    по затухшим счетчикам. Элементы без истории получают одну общую выборку из априорного
+    распределения и остаются в порядке профиля - без статистики порядок совпадает с профилем.
+    """
+    name = "thompson"
+
+    def __init__(self, rng=None, prior=THOMPSON_PRIOR):
+        self.rng = rng or random.Random()
+        self.prior = prior
+
+    def order(self, items, stats):
+        a, b = self.prior
+        unseen = self.rng.betavariate(a, b)
+
+        def score(item):
+            entry = stats.get(item.get('id'))
+            if not entry or entry.get("weighted_total", 0) <= 0:
+                return unseen
+            successes = entry["weighted_success"]
+            failures = max(entry["weighted_total"] - successes, 0.0)
+            return self.rng.betavariate(a + successes, b + failures)
+
+        scores = [score(item) for item in items]
+        return [item for _, item in sorted(zip(scores, items), key=lambda pair: -pair[0])]
+
+
+class UCBPolicy:
+    """
+    UCB1 по затухшим счетчикам: средняя доля успехов плюс бонус за неопределенность.
+    Элементы без истории идут первыми (в порядке профиля).
+    """
+    name = "ucb"
+
+    def __init__(self, exploration=UCB_EXPLORATION):
+        self.exploration = exploration
+
+    def order(self, items, stats):
+        weights = [stats[item.get('id')].get("weighted_total", 0) for item in items if item.get('id') in stats]
+        log_total = math.log(sum(weights) + 1)
+
+        def score(item):
+            entry = stats.get(item.get('id'))
+            if not entry or entry.get("weighted_total", 0) <= 0:
+                return float('inf')
+            n = entry["weighted_total"]
+            return entry["weighted_success"] / n + self.exploration * math.sqrt(log_total / n)
+
+        return sorted(items, key=lambda item: -score(item))
+
+
+POLICIES = {
+    "thompson": ThompsonPolicy,
+    "ucb": UCBPolicy,
+    "count": SuccessCountPolicy,
+}
+DEFAULT_POLICY = "thompson"
+
+
+def create_policy(name, rng=None):
+    """Политика по имени ('thompson', 'ucb', 'count'); rng - для воспроизводимых выборок."""
+    if name not in POLICIES:
+        raise ValueError(f"Неизвестная политика порядка: {name} (доступны: {', '.join(POLICIES)})")
+    return POLICIES[name](rng=rng) if name == "thompson" else POLICIES[name]()
@@ -1,12 +1,176 @@
 # utils/pattern_matcher.py
 """
 Утилиты для работы с паттернами.
+Паттерны компилируются один раз и объединяются в одно регулярное выражение
+с именованными группами. Поиск по растущему выводу ведется инкрементально:
+проверяются только новые данные плюс небольшое окно перекрытия.
 """
-# Пока пусто, можно добавить функции для сложного матчинга, если потребуется
-# Например, compile_patterns, match_output и т.д.
-
-def load_patterns(config_dir):
-    """Загружает паттерны из файла."""
-    # Эта функция уже реализована в config_loader.py
-    # Можно оставить здесь для логической группировки
-    pass
+import re
+from functools import lru_cache
+
+# Окно перекрытия (символов или байт): совпадение может начаться в уже просмотренных данных
+# и закончиться в новых. Должно быть не меньше длины самого длинного совпадения.
+DEFAULT_OVERLAP = 256
+
+
+class PatternMatch:
+    """Результат поиска: какой логический паттерн найден и где."""
+    __slots__ = ("name", "key", "pattern", "start", "end", "text")
+
+    def __init__(self, name, key, pattern, start, end, text):
+        self.name = name        # Логическое имя (ключ patterns.json или индекс в списке)
+        self.key = key          # Исходный элемент (строка или список строк)
+        self.pattern = pattern  # Конкретная альтернатива, давшая совпадение
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __repr__(self):
+        return f"PatternMatch(name={self.name!r}, pattern={self.pattern!r}, start={self.start}, end={self.end})"
+
+
+def _alternatives(entry):
+    """Элемент паттерна может быть строкой или списком строк (как в patterns.json)."""
+    if isinstance(entry, str):
+        return [entry]
+    if isinstance(entry, (list, tuple)):
+        return [p for p in entry if isinstance(p, str)]
+    return []
+
+
+def _check_regex(pattern, flags):
+    """Проверяет, что строка - корректное регулярное выражение."""
+    try:
+        re.compile(pattern, flags)
+    except re.error as e:
+        raise ValueError(f"Некорректный паттерн '{pattern}': {e}")
+
+
+class PatternMatcher:
+    """
+    Объединенный матчер для набора логических паттернов.
+    patterns - словарь {имя: строка|список} (формат patterns.json)
+    или список элементов (имя = индекс элемента).
+    """
+    def __init__(self, patterns, flags=re.IGNORECASE, overlap=DEFAULT_OVERLAP):
+        if isinstance(patterns, dict):
+            items = list(patterns.items())
+        else:
+            items = list(enumerate(patterns))
+
+        self.flags = flags
+        self.overlap = overlap
+        self.names = []
+        self._keys = {}
+        self._groups = {}  # имя группы -> (логическое имя, альтернатива)
+        parts = []
+        for name, entry in items:
+            alternatives = _alternatives(entry)
+            if not alternatives:
+                continue
+            self.names.append(name)
+            self._keys[name] = entry
+            for alternative in alternatives:
+                _check_regex(alternative, flags)
+                group = f"p{len(self._groups)}"
+                self._groups[group] = (name, alternative)
+                parts.append(f"(?P<{group}>{alternative})")
+
+        self._source = "|".join(parts)
+        self._regex = re.compile(self._source, flags) if parts else None
+        self._bytes_regex = None
+
+    def _regex_for(self, data):
+        """Строки ищутся текстовым выражением, bytes/memoryview - байтовым."""
+        if isinstance(data, str):
+            return self._regex
+        if self._bytes_regex is None and self._regex is not None:
+            self._bytes_regex = re.compile(self._source.encode('utf-8'), self.flags)
+        return self._bytes_regex
+
+    def _make_match(self, m, base=0):
+        name, pattern = self._groups[m.lastgroup]
+        text = m.group()
+        if not isinstance(text, str):
+            text = bytes(text).decode('utf-8', errors='ignore')
+        return PatternMatch(name, self._keys[name], pattern, base + m.start(), base + m.end(), text)
+
+    def search(self, data, pos=0, base=0):
+        """
+        Ищет самое раннее совпадение любого паттерна начиная с позиции pos.
+        data - str или байтовый объект (bytes, memoryview); base добавляется
+        к позициям результата (абсолютное смещение начала data в потоке).
+        """
+        regex = self._regex_for(data)
+        if regex is None:
+            return None
+        m = regex.search(data, pos)
+        if not m:
+            return None
+        return self._make_match(m, base)
+
+    def find_all(self, data):
+        """Возвращает {логическое имя: первое совпадение} для всех найденных паттернов."""
+        found = {}
+        regex = self._regex_for(data)
+        if regex is None:
+            return found
+        for m in regex.finditer(data):
+            name = self._groups[m.lastgroup][0]
+            if name not in found:
+                found[name] = self._make_match(m)
+        return found
+
+    def scanner(self):
+        """Создает инкрементальный сканер для растущего буфера."""
+        return IncrementalScanner(self)
+
+
+class IncrementalScanner:
+    """
+    Инкрементальный поиск по растущему буферу.
+    При каждом вызове feed() просматриваются только новые данные и окно перекрытия.
+    """
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self._scanned = 0
+
+    def feed(self, buffer, base=0):
+        """
+        Проверяет буфер, в конец которого дописаны новые данные.
+        base - абсолютное смещение начала buffer (если голова буфера была вытеснена).
+        Возвращает PatternMatch (позиции абсолютные) или None.
+        """
+        pos = max(0, self._scanned - self.matcher.overlap - base)
+        self._scanned = base + len(buffer)
+        return self.matcher.search(buffer, pos, base)
+
+    def reset(self):
+        self._scanned = 0
+
+
+def _freeze(entries):
+    """Преобразует список паттернов в хешируемый ключ для кеша."""
+    return tuple(tuple(e) if isinstance(e, list) else e for e in entries)
+
+
+@lru_cache(maxsize=256)
+def _cached_matcher(frozen_entries):
+    return PatternMatcher(list(frozen_entries))
+
+
+def get_matcher(entries):
+    """
+    Возвращает скомпилированный матчер для списка паттернов.
+    Матчеры кешируются: один и тот же набор компилируется только один раз.
+    Логическое имя совпадения - индекс элемента в entries.
+    """
+    return _cached_matcher(_freeze(entries))
+
+
+def compile_patterns(patterns):
+    """
+    Компилирует все наборы из patterns.json в один матчер (имена = ключи конфигурации).
+    Некорректные регулярные выражения обнаруживаются сразу, при загрузке конфигурации.
+    """
+    return PatternMatcher(patterns)
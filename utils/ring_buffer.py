@@ -0,0 +1,76 @@
+# utils/ring_buffer.py
+"""
+Кольцевой буфер фиксированного размера для данных последовательного порта.
+"""
+
+
+class ByteRingBuffer:
+    """
+    Хранит последние capacity байт потока.
+
+    Память выделяется один раз (bytearray удвоенного размера) и больше не растет.
+    Когда запись доходит до конца хранилища, хвост сдвигается в начало (memmove),
+    поэтому любое окно из хранимых данных непрерывно и отдается как memoryview
+    без копирования. Позиции адресуются абсолютным смещением в потоке.
+    Полученный memoryview действителен до следующей записи.
+    """
+    def __init__(self, capacity=65536):
+        if capacity <= 0:
+            raise ValueError("Размер буфера должен быть положительным")
+        self.capacity = capacity
+        self._storage = bytearray(capacity * 2)
+        self._view = memoryview(self._storage)
+        self._start = 0     # Начало хранимых данных в хранилище
+        self._end = 0       # Конец хранимых данных в хранилище
+        self._total = 0     # Всего байт записано (абсолютное смещение конца)
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def offset(self):
+        """Абсолютное смещение конца потока (сколько байт записано всего)."""
+        return self._total
+
+    @property
+    def first_offset(self):
+        """Абсолютное смещение самого старого хранимого байта."""
+        return self._total - (self._end - self._start)
+
+    def write(self, data):
+        """Дописывает данные; самые старые байты вытесняются."""
+        n = len(data)
+        if n == 0:
+            return
+        self._total += n
+        if n >= self.capacity:
+            self._view[0:self.capacity] = memoryview(data)[n - self.capacity:]
+            self._start, self._end = 0, self.capacity
+            return
+        if self._end + n > len(self._storage):
+            keep = min(self._end - self._start, self.capacity - n)
+            self._view[0:keep] = self._view[self._end - keep:self._end]
+            self._start, self._end = 0, keep
+        self._view[self._end:self._end + n] = data
+        self._end += n
+        if self._end - self._start > self.capacity:
+            self._start = self._end - self.capacity
+
+    def view(self, start=None, end=None):
+        """
+        Возвращает memoryview на данные между абсолютными смещениями [start, end).
+        Границы прижимаются к хранимому окну.
+        """
+        first = self.first_offset
+        start = first if start is None else min(max(start, first), self._total)
+        end = self._total if end is None else min(max(end, start), self._total)
+        base = self._start - first
+        return self._view[base + start:base + end]
+
+    def text(self, start=None, end=None, encoding='utf-8'):
+        """Декодирует данные между абсолютными смещениями в строку."""
+        return str(self.view(start, end), encoding, errors='ignore')
+
+    def clear(self):
+        """Очищает буфер (абсолютное смещение сохраняется)."""
+        self._start = self._end = 0
@@ -0,0 +1,80 @@
+# utils/session_recorder.py
+"""
+Запись и чтение сессий последовательного порта.
+
+Формат файла (.dlsession):
+    MAGIC, затем длина (uint32) и JSON с описанием сессии (порт, модель, скорость, время начала),
+    затем записи: направление (uint8: 0 - прием, 1 - передача), время от начала сессии
+    (double, сек, по монотонным часам), длина (uint32) и сами байты.
+"""
+import json
+import struct
+import time
+from datetime import datetime
+
+MAGIC = b"DLSESS1\n"
+RX = 0
+TX = 1
+
+_HEADER = struct.Struct("<I")
+_RECORD = struct.Struct("<BdI")
+
+
+class SessionRecorder:
+    """Пишет все принятые и переданные байты с отметками времени."""
+    def __init__(self, path, info=None):
+        self.path = path
+        self.info = dict(info or {})
+        self.info.setdefault("started", datetime.now().isoformat(timespec="seconds"))
+        self._file = None
+        self._t0 = None
+
+    def open(self):
+        """Открывает файл и начинает отсчет времени сессии."""
+        if self._file:
+            return
+        meta = json.dumps(self.info, ensure_ascii=False).encode("utf-8")
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC + _HEADER.pack(len(meta)) + meta)
+        self._t0 = time.monotonic()
+
+    def record(self, direction, data):
+        if not self._file or not data:
+            return
+        self._file.write(_RECORD.pack(direction, time.monotonic() - self._t0, len(data)))
+        self._file.write(data)
+
+    def record_rx(self, data):
+        self.record(RX, data)
+
+    def record_tx(self, data):
+        self.record(TX, data)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def read_session(path):
+    """Читает файл сессии. Возвращает (описание, [(направление, время, байты), ...])."""
+    with open(path, "rb") as f:
+        content = f.read()
+    if not content.startswith(MAGIC):
+        raise ValueError(f"Файл {path} не является записью сессии")
+    pos = len(MAGIC)
+    (meta_len,) = _HEADER.unpack_from(content, pos)
+    pos += _HEADER.size
+    info = json.loads(content[pos:pos + meta_len].decode("utf-8"))
+    pos += meta_len
+
+    records = []
+    while pos + _RECORD.size <= len(content):
+        direction, timestamp, length = _RECORD.unpack_from(content, pos)
+        pos += _RECORD.size
+        # Обрезанная последняя запись (процесс прерван во время записи) отбрасывается
+        if pos + length > len(content):
+            break
+        records.append((direction, timestamp, content[pos:pos + length]))
+        pos += length
+    return info, records
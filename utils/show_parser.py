@@ -0,0 +1,57 @@
+# utils/show_parser.py
+"""
+Табличный разбор вывода команд 'show ...' и 'dir'.
+Таблица - ключ "show_parsers" профиля устройства: базовый профиль производителя задает
+разбор по умолчанию, семейство или модель переопределяют отдельные команды и поля.
+Для каждой команды:
+    "fields"  - {поле: выражение или список альтернатив}; значение - первая группа
+                первого совпадения (без групп - все совпадение);
+    "records" - выражение или список альтернатив с именованными группами: каждое
+                совпадение - запись {группа: значение}; используется первая альтернатива,
+                давшая хотя бы одну запись.
+Выражения компилируются один раз при сборке конфигурации (ConfigBundle).
+"""
+import re
+
+# ^ и $ - границы строк вывода
+FLAGS = re.MULTILINE
+
+
+def _alternatives(spec):
+    return [spec] if isinstance(spec, str) else list(spec)
+
+
+class ShowParser:
+    """Скомпилированная таблица разбора одной команды."""
+    def __init__(self, spec):
+        self.fields = {name: [re.compile(pattern, FLAGS) for pattern in _alternatives(patterns)]
+                       for name, patterns in spec.get("fields", {}).items()}
+        self.records = [re.compile(pattern, FLAGS) for pattern in _alternatives(spec.get("records", []))]
+
+    def parse(self, text):
+        """{поле: значение или None}; если заданы records - еще "records": [запись, ...]."""
+        text = (text or "").replace("\r", "")
+        result = {name: self._field(regexes, text) for name, regexes in self.fields.items()}
+        if self.records:
+            result["records"] = self._records(text)
+        return result
+
+    @staticmethod
+    def _field(regexes, text):
+        for regex in regexes:
+            match = regex.search(text)
+            if match:
+                return (match.group(1) if regex.groups else match.group(0)).strip()
+        return None
+
+    def _records(self, text):
+        for regex in self.records:
+            records = [match.groupdict() for match in regex.finditer(text)]
+            if records:
+                return records
+        return []
+
+
+def compile_parsers(specs):
+    """{команда: ShowParser} по таблице "show_parsers" профиля."""
+    return {command: ShowParser(spec) for command, spec in (specs or {}).items()}
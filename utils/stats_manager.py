@@ -1,68 +1,340 @@
 # utils/stats_manager.py
 """
 Менеджер статистики для сортировки и обновления данных.
+Хранилище - SQLite в режиме WAL (stats/stats.sqlite3): несколько процессов на одной папке stats
+увеличивают счетчики атомарно и читают параллельно, не затирая данные друг друга.
+Порядок перебора задает политика из utils/ordering.py; каждая попытка пишется в журнал attempts
+для офлайн-оценки политик (ordering_eval.py).
+Статистика ведется по контекстам от общего к частному (все устройства, семейство, модель,
+ветка прошивки): у контекста с малым числом попыток порядок определяет более общий.
 """
 import json
 import os
+import re
+import sqlite3
+import threading
+import time
+
+from utils import ordering
+
+# Сколько последних удачных задержек клавиш Recovery хранить на комбинацию
+MAX_TIMING_SAMPLES = 20
+# Файл базы статистики в папке stats
+STATS_DB = "stats.sqlite3"
+# Ожидание блокировки базы другим процессом (сек)
+BUSY_TIMEOUT = 30
+# Сколько попыток (по весу) контекст заимствует у более общего: больше данных - меньше влияние общего
+CONTEXT_PRIOR_WEIGHT = 3
+# JSON-файлы прежнего формата: импортируются один раз при создании базы
+LEGACY_FILES = {
+    "credentials": "credentials_stats.json",
+    "reset_commands": "reset_commands_stats.json",
+    "recovery_keys": "recovery_keys_stats.json",
+    "recovery_timing": "recovery_timing_stats.json",
+}
+
+ITEM_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS item_stats (
+    stat_type        TEXT NOT NULL,
+    context          TEXT NOT NULL DEFAULT '',
+    item_id          TEXT NOT NULL,
+    success          INTEGER NOT NULL DEFAULT 0,
+    total            INTEGER NOT NULL DEFAULT 0,
+    weighted_success REAL NOT NULL DEFAULT 0,
+    weighted_total   REAL NOT NULL DEFAULT 0,
+    updated          REAL,
+    PRIMARY KEY (stat_type, context, item_id)
+);
+"""
+SCHEMA = ITEM_STATS_TABLE + """
+CREATE TABLE IF NOT EXISTS attempts (
+    seq       INTEGER PRIMARY KEY AUTOINCREMENT,
+    stat_type TEXT NOT NULL,
+    item_id   TEXT NOT NULL,
+    success   INTEGER NOT NULL,
+    ts        REAL NOT NULL,
+    session   TEXT,
+    context   TEXT
+);
+CREATE TABLE IF NOT EXISTS recovery_timing (
+    model   TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    success INTEGER NOT NULL DEFAULT 0,
+    total   INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (model, item_id)
+);
+CREATE TABLE IF NOT EXISTS recovery_delays (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    model   TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    delay   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recovery_delays_item ON recovery_delays (model, item_id, seq);
+CREATE INDEX IF NOT EXISTS attempts_type ON attempts (stat_type, seq);
+"""
+
+# Атомарное приращение счетчиков элемента в контексте; decay() - затухание за время с прошлой попытки
+UPSERT_ITEM = (
+    "INSERT INTO item_stats (stat_type, context, item_id, success, total, weighted_success, weighted_total, updated) "
+    "VALUES (?, ?, ?, ?, 1, ?, 1, ?) "
+    "ON CONFLICT (stat_type, context, item_id) DO UPDATE SET "
+    "success = success + excluded.success, total = total + 1, "
+    "weighted_success = decay(weighted_success, excluded.updated - COALESCE(updated, excluded.updated), ?) "
+    "+ excluded.weighted_success, "
+    "weighted_total = decay(weighted_total, excluded.updated - COALESCE(updated, excluded.updated), ?) + 1, "
+    "updated = excluded.updated"
+)
+
+
+def model_family(model):
+    """Семейство по умолчанию - серия модели: 'DES-3200-28' -> 'DES-32xx', 'DGS-1210-28' -> 'DGS-12xx'."""
+    match = re.match(r"([A-Za-z]+)-(\d{2})", model or "")
+    return f"{match.group(1).upper()}-{match.group(2)}xx" if match else model
+
+
+def firmware_family(version):
+    """Ветка прошивки: '4.51.B018' -> '4.51'. None, если версия неизвестна."""
+    match = re.match(r"\d+\.\d+", version or "")
+    return match.group(0) if match else None
+
+
+def context_levels(vendor, model, family=None, firmware=None):
+    """
+    Контексты статистики от общего к частному: '' (все устройства), семейство, модель
+    и, если версия прошивки известна, модель с веткой прошивки. Пока модель не определена -
+    только '' и семейство профиля, если оно задано.
+    """
+    if not model:
+        return ["", f"{vendor}/{family}"] if family else [""]
+    levels = ["", f"{vendor}/{family or model_family(model)}"]
+    if f"{vendor}/{model}" not in levels:
+        levels.append(f"{vendor}/{model}")
+    branch = firmware_family(firmware)
+    if branch:
+        levels.append(f"{vendor}/{model}/{branch}")
+    return levels
+
+
+def _with_prior(entry, prior):
+    """Счетчики контекста плюс счетчики более общего контекста, урезанные до CONTEXT_PRIOR_WEIGHT попыток."""
+    entry = entry or ordering.new_entry()
+    if not prior:
+        return entry
+    weighted_scale = min(1.0, CONTEXT_PRIOR_WEIGHT / prior["weighted_total"]) if prior["weighted_total"] > 0 else 0.0
+    scale = min(1.0, CONTEXT_PRIOR_WEIGHT / prior["total"]) if prior["total"] else 0.0
+    return dict(entry,
+                success=entry["success"] + prior["success"] * scale,
+                total=entry["total"] + prior["total"] * scale,
+                weighted_success=entry["weighted_success"] + prior["weighted_success"] * weighted_scale,
+                weighted_total=entry["weighted_total"] + prior["weighted_total"] * weighted_scale)
+
 
 class StatsManager:
-    def __init__(self, stats_dir):
+    """
+    Один экземпляр может разделяться несколькими потоками (пакетный режим):
+    у каждого потока свое соединение с базой, изменения - короткие транзакции.
+    Каждое обновление сразу записывается на диск.
+    policy - имя политики порядка из utils/ordering.py или ее экземпляр.
+    half_life_days - период полураспада веса попытки для затухающих счетчиков.
+    """
+    def __init__(self, stats_dir, policy=ordering.DEFAULT_POLICY, half_life_days=ordering.DEFAULT_HALF_LIFE_DAYS):
         self.stats_dir = stats_dir
-        self.stats_files = {
-            "credentials": "credentials_stats.json",
-            "reset_commands": "reset_commands_stats.json",
-            "recovery_keys": "recovery_keys_stats.json",
-        }
-        self.stats_data = {}
-        self._load_all_stats()
-
-    def _load_all_stats(self):
-        """Загружает всю статистику из файлов."""
-        for stat_type, filename in self.stats_files.items():
+        self.db_path = os.path.join(stats_dir, STATS_DB)
+        self.policy = ordering.create_policy(policy) if isinstance(policy, str) else policy
+        self.half_life = half_life_days * 86400
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self):
+        """Соединение текущего потока (создается при первом обращении)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: транзакции открываются явно в _transaction
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.create_function("decay", 3, ordering.decay, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, statements):
+        """Выполняет [(sql, параметры)] одной транзакцией. BEGIN IMMEDIATE сразу берет блокировку записи."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _init_db(self):
+        """Создает таблицы; пустую базу заполняет из JSON-файлов прежнего формата."""
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        statements = []
+        for stat_type, filename in LEGACY_FILES.items():
             file_path = os.path.join(self.stats_dir, filename)
             if os.path.exists(file_path):
                 with open(file_path, 'r') as f:
-                    self.stats_data[stat_type] = json.load(f)
-            else:
-                self.stats_data[stat_type] = {}
-
-    def _save_stats_to_file(self, stat_type):
-        """Сохраняет статистику определенного типа в файл."""
-        if stat_type in self.stats_files:
-            file_path = os.path.join(self.stats_dir, self.stats_files[stat_type])
-            with open(file_path, 'w') as f:
-                json.dump(self.stats_data[stat_type], f, indent=4)
-
-    def sort_by_stats(self, items, stat_type):
+                    statements += self._legacy_statements(stat_type, json.load(f))
+        if not statements:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Другой процесс мог импортировать файлы раньше - проверяем под блокировкой
+            if conn.execute("SELECT 1 FROM item_stats UNION ALL SELECT 1 FROM recovery_timing LIMIT 1").fetchone() is None:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _columns(conn, table):
+        return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+    def _migrate(self, conn):
+        """
+        Приводит базу прежних версий к текущей схеме: item_stats без контекстов (и без затухающих
+        счетчиков) переносится в общий контекст '', журнал попыток получает столбец context.
+        """
+        if "context" in self._columns(conn, "item_stats") and "context" in self._columns(conn, "attempts"):
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = self._columns(conn, "item_stats")
+            if "context" not in columns:
+                weighted = "weighted_success, weighted_total, updated" if "updated" in columns else "success, total, ?"
+                conn.execute("ALTER TABLE item_stats RENAME TO item_stats_old")
+                conn.execute(ITEM_STATS_TABLE)
+                conn.execute("INSERT INTO item_stats (stat_type, context, item_id, success, total, "
+                             "weighted_success, weighted_total, updated) "
+                             f"SELECT stat_type, '', item_id, success, total, {weighted} FROM item_stats_old",
+                             () if "updated" in columns else (time.time(),))
+                conn.execute("DROP TABLE item_stats_old")
+            if "context" not in self._columns(conn, "attempts"):
+                conn.execute("ALTER TABLE attempts ADD COLUMN context TEXT")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _legacy_statements(stat_type, data):
+        if stat_type != "recovery_timing":
+            return [("INSERT OR REPLACE INTO item_stats (stat_type, item_id, success, total, "
+                     "weighted_success, weighted_total, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (stat_type, item_id, stats.get("success", 0), stats.get("total", 0),
+                      stats.get("success", 0), stats.get("total", 0), time.time()))
+                    for item_id, stats in data.items()]
+        statements = []
+        for model, items in data.items():
+            for item_id, entry in items.items():
+                statements.append(("INSERT OR REPLACE INTO recovery_timing (model, item_id, success, total) VALUES (?, ?, ?, ?)",
+                                   (model, item_id, entry.get("success", 0), entry.get("total", 0))))
+                statements += [("INSERT INTO recovery_delays (model, item_id, delay) VALUES (?, ?, ?)",
+                                (model, item_id, delay)) for delay in entry.get("delays", [])[-MAX_TIMING_SAMPLES:]]
+        return statements
+
+    def get_stats(self, stat_type, context=None):
+        """
+        Снимок статистики типа: {id: {"success", "total", "weighted_success", "weighted_total", "updated"}},
+        затухающие счетчики приведены к текущему моменту.
+        context - уровни из context_levels(): счетчики самого частного уровня с заимствованием
+        у более общих. None - только общая статистика.
+        """
+        levels = context or [""]
+        now = time.time()
+        rows = self._connect().execute(
+            "SELECT context, item_id, success, total, weighted_success, weighted_total, updated "
+            f"FROM item_stats WHERE stat_type = ? AND context IN ({', '.join('?' * len(levels))})",
+            (stat_type, *levels))
+        by_level = {}
+        for row in rows:
+            by_level.setdefault(row[0], {})[row[1]] = ordering.decayed(
+                {"success": row[2], "total": row[3], "weighted_success": row[4],
+                 "weighted_total": row[5], "updated": row[6]}, now, self.half_life)
+        combined = {}
+        for level in levels:
+            own = by_level.get(level, {})
+            combined = {item_id: _with_prior(own.get(item_id), combined.get(item_id))
+                        for item_id in {*own, *combined}}
+        return combined
+
+    def sort_by_stats(self, items, stat_type, context=None):
+        """
+        Упорядочивает список элементов (словарей с ключом 'id') политикой self.policy:
+        первыми идут те, что вероятнее сработают сейчас (в данном контексте, см. get_stats).
         """
-        Сортирует список элементов (словарей с ключом 'id') по убыванию успехов.
-        Элементы без статистики помещаются в конец.
+        return self.policy.order(items, self.get_stats(stat_type, context))
+
+    def update_stats(self, stat_type, item_id, success, session=None, context=None):
+        """
+        Обновляет статистику для элемента (атомарное приращение счетчиков) и пишет попытку в журнал.
+        session - метка прогона: по ней ordering_eval.py разбивает журнал на эпизоды перебора.
+        context - уровни из context_levels(): попытка учитывается на каждом уровне.
+        """
+        levels = context or [""]
+        now = time.time()
+        success = int(bool(success))
+        self._transaction([
+            (UPSERT_ITEM,
+             (stat_type, level, item_id, success, success, now, self.half_life, self.half_life))
+            for level in levels
+        ] + [
+            ("INSERT INTO attempts (stat_type, item_id, success, ts, session, context) VALUES (?, ?, ?, ?, ?, ?)",
+             (stat_type, item_id, success, now, session, levels[-1])),
+        ])
+
+    def attempt_history(self, stat_type, context=None):
+        """
+        Журнал попыток типа в порядке записи: [{"item_id", "success", "ts", "session", "context"}].
+        context - только попытки модели ('D-Link/DES-3200-28') или ветки ее прошивки ('D-Link/DES-3200-28/4.51').
         """
-        if stat_type not in self.stats_data:
-            return items
-            
-        def sort_key(item):
-            item_id = item.get('id')
-            if item_id and item_id in self.stats_data[stat_type]:
-                stats = self.stats_data[stat_type][item_id]
-                # Сортируем по успехам (по убыванию), затем по общему кол-ву (по возрастанию, чтобы новые были в начале)
-                return (-stats.get('success', 0), stats.get('total', 0))
-            return (0, float('inf')) # Элементы без статистики в конец
-        
-        return sorted(items, key=sort_key)
-
-    def update_stats(self, stat_type, item_id, success):
-        """Обновляет статистику для элемента."""
-        if stat_type not in self.stats_data:
-            self.stats_data[stat_type] = {}
-            
-        if item_id not in self.stats_data[stat_type]:
-            self.stats_data[stat_type][item_id] = {"success": 0, "total": 0}
-            
-        self.stats_data[stat_type][item_id]["total"] += 1
-        if success:
-            self.stats_data[stat_type][item_id]["success"] += 1
+        sql = "SELECT item_id, success, ts, session, context FROM attempts WHERE stat_type = ?"
+        params = [stat_type]
+        if context:
+            sql += " AND (context = ? OR context LIKE ?)"
+            params += [context, f"{context}/%"]
+        rows = self._connect().execute(sql + " ORDER BY seq", params)
+        return [{"item_id": item_id, "success": bool(success), "ts": ts, "session": session, "context": ctx}
+                for item_id, success, ts, session, ctx in rows]
 
     def save_stats(self, stat_type):
-        """Сохраняет статистику определенного типа."""
-        self._save_stats_to_file(stat_type)
+        """Оставлен для совместимости: update_stats уже записал изменения в базу."""
+
+    def get_recovery_timing(self, model):
+        """
+        Снимок выученных задержек входа в Recovery для модели:
+        {id комбинации: {"success", "total", "delays"}}, delays - секунды от индикатора загрузки.
+        """
+        conn = self._connect()
+        result = {item_id: {"success": success, "total": total, "delays": []} for item_id, success, total in conn.execute(
+            "SELECT item_id, success, total FROM recovery_timing WHERE model = ?", (model,))}
+        for item_id, delay in conn.execute(
+                "SELECT item_id, delay FROM recovery_delays WHERE model = ? ORDER BY seq", (model,)):
+            if item_id in result:
+                result[item_id]["delays"].append(delay)
+        return result
+
+    def update_recovery_timing(self, model, item_id, success, delay=None):
+        """Учитывает попытку комбинации для модели; для удачной сохраняет задержку."""
+        statements = [(
+            "INSERT INTO recovery_timing (model, item_id, success, total) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT (model, item_id) DO UPDATE SET "
+            "success = success + excluded.success, total = total + 1",
+            (model, item_id, int(bool(success))))]
+        if success and delay is not None:
+            statements += [
+                ("INSERT INTO recovery_delays (model, item_id, delay) VALUES (?, ?, ?)",
+                 (model, item_id, round(delay, 3))),
+                # Храним только последние MAX_TIMING_SAMPLES задержек
+                ("DELETE FROM recovery_delays WHERE model = ? AND item_id = ? AND seq NOT IN "
+                 "(SELECT seq FROM recovery_delays WHERE model = ? AND item_id = ? ORDER BY seq DESC LIMIT ?)",
+                 (model, item_id, model, item_id, MAX_TIMING_SAMPLES)),
+            ]
+        self._transaction(statements)
@@ -0,0 +1,377 @@
+# utils/tftp_server.py
+"""
+Встроенный TFTP-сервер (только чтение) для раздачи PROM и прошивок коммутаторам.
+Работает на asyncio: каждая передача - отдельный UDP-сокет (TID по RFC 1350),
+поэтому один сервер одновременно обслуживает много коммутаторов.
+Поддерживаются опции blksize (RFC 2348), windowsize (RFC 7440), tsize и timeout (RFC 2349).
+"""
+import asyncio
+import logging
+import struct
+import threading
+import time
+from pathlib import Path
+
+from utils.firmware_store import FirmwareStore, FirmwareStoreError
+from utils.upgrade_planner import image_files
+
+OP_RRQ, OP_WRQ, OP_DATA, OP_ACK, OP_ERROR, OP_OACK = range(1, 7)
+
+ERR_UNDEFINED, ERR_NOT_FOUND, ERR_ACCESS, ERR_ILLEGAL_OP, ERR_UNKNOWN_TID, ERR_OPTION = 0, 1, 2, 4, 5, 8
+
+DEFAULT_BLKSIZE = 512
+# Пределы опций по RFC 2348 и RFC 7440
+MIN_BLKSIZE, MAX_BLKSIZE = 8, 65464
+MAX_WINDOWSIZE = 65535
+# Сколько раз повторять окно без подтверждения, прежде чем прервать передачу
+DEFAULT_RETRIES = 5
+
+
+def firmware_filenames(firmware_info):
+    """Имена файлов PROM и прошивок из firmware_info.json (то, что сервер разрешает скачивать)."""
+    names = set()
+    for model_info in firmware_info.values():
+        names.add(model_info.get("prom", {}).get("filename"))
+        names.update(filename for _, filename in image_files(model_info.get("firmware", {})))
+    names.discard(None)
+    return names
+
+
+class TftpError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def _error_packet(code, message):
+    return struct.pack("!HH", OP_ERROR, code) + message.encode("ascii", "replace") + b"\0"
+
+
+def _parse_request(packet):
+    """Разбирает RRQ/WRQ: (имя файла, режим, {опция: значение}); опции в нижнем регистре."""
+    fields = packet[2:].split(b"\0")
+    if len(fields) < 3 or fields[-1] != b"":
+        raise TftpError(ERR_ILLEGAL_OP, "Malformed request")
+    fields = [f.decode("ascii", "replace") for f in fields[:-1]]
+    filename, mode = fields[0], fields[1].lower()
+    options = {}
+    for i in range(2, len(fields) - 1, 2):
+        options[fields[i].lower()] = fields[i + 1]
+    return filename, mode, options
+
+
+class _TransferProtocol(asyncio.DatagramProtocol):
+    """Сокет одной передачи: принимает пакеты только от клиента (его TID)."""
+    def __init__(self, peer):
+        self.peer = peer
+        self.transport = None
+        self.packets = asyncio.Queue()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if addr != self.peer:
+            self.transport.sendto(_error_packet(ERR_UNKNOWN_TID, "Unknown transfer ID"), addr)
+            return
+        self.packets.put_nowait(data)
+
+    def error_received(self, exc):
+        # ICMP port unreachable и т.п.: клиент пропал, передача завершится по таймауту
+        pass
+
+
+class _ListenProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server._on_request(data, addr)
+
+
+class TftpServer:
+    """
+    TFTP-сервер только на чтение файлов из root.
+
+    root - папка с файлами или хранилище образов (utils/firmware_store.py): тогда файлы
+    ищутся по имени в индексе, проверяются по SHA-256 и раздаются через mmap.
+    allowed - множество разрешенных имен файлов (None - любые файлы внутри root).
+    max_blksize, max_windowsize - верхние границы, до которых сервер соглашается на опции клиента.
+    По умолчанию blksize ограничен 1468 байтами: блок помещается в кадр Ethernet без фрагментации IP.
+    Запуск: await serve() в своем цикле событий или start()/stop() - в отдельном потоке.
+    """
+    def __init__(self, root, host="0.0.0.0", port=69, allowed=None, logger=None,
+                 max_blksize=1468, max_windowsize=64, timeout=1.0, retries=DEFAULT_RETRIES):
+        self.root = Path(root).resolve()
+        self.store = FirmwareStore(self.root) if FirmwareStore.is_store(self.root) else None
+        self.host = host
+        self.port = port
+        self.allowed = set(allowed) if allowed is not None else None
+        self.logger = logger or logging.getLogger("DLinkTFTP")
+        self.max_blksize = max_blksize
+        self.max_windowsize = max_windowsize
+        self.timeout = timeout
+        self.retries = retries
+        self.transfers = {}     # (адрес клиента, порт) -> задача передачи
+        self.completed = []     # Итоги завершенных передач
+        self._listen = None
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._stopped = None
+
+    # --- Запуск ---
+
+    async def start_async(self):
+        """Открывает слушающий сокет в текущем цикле событий. Возвращает фактический порт."""
+        self._loop = asyncio.get_running_loop()
+        self._listen, _ = await self._loop.create_datagram_endpoint(
+            lambda: _ListenProtocol(self), local_addr=(self.host, self.port))
+        self.port = self._listen.get_extra_info("sockname")[1]
+        self.logger.info(f"📡 TFTP-сервер запущен на {self.host}:{self.port}, папка {self.root}")
+        return self.port
+
+    async def stop_async(self):
+        if self._listen:
+            self._listen.close()
+            self._listen = None
+        for task in list(self.transfers.values()):
+            task.cancel()
+        if self.transfers:
+            await asyncio.gather(*self.transfers.values(), return_exceptions=True)
+        if self.store:
+            self.store.close()
+
+    async def serve(self):
+        """Обслуживает запросы до отмены задачи."""
+        await self.start_async()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop_async()
+
+    def start(self):
+        """Запускает сервер в фоновом потоке со своим циклом событий. Возвращает порт."""
+        self._thread = threading.Thread(target=self._thread_main, name="tftp", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._listen is None:
+            raise OSError(f"Не удалось запустить TFTP-сервер на {self.host}:{self.port}")
+        return self.port
+
+    def stop(self):
+        if self._thread and self._loop and self._stopped:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+            self._thread.join()
+            self._thread = None
+
+    def _thread_main(self):
+        asyncio.run(self._thread_serve())
+
+    async def _thread_serve(self):
+        self._stopped = asyncio.Event()
+        try:
+            await self.start_async()
+        except OSError as e:
+            self.logger.error(f"❌ TFTP-сервер не запущен: {e}")
+            return
+        finally:
+            self._ready.set()
+        await self._stopped.wait()
+        await self.stop_async()
+
+    # --- Запросы ---
+
+    def _on_request(self, packet, addr):
+        if len(packet) < 2:
+            return
+        opcode = struct.unpack("!H", packet[:2])[0]
+        if opcode == OP_WRQ:
+            self._listen.sendto(_error_packet(ERR_ACCESS, "Server is read-only"), addr)
+            return
+        if opcode != OP_RRQ:
+            self._listen.sendto(_error_packet(ERR_ILLEGAL_OP, "Illegal TFTP operation"), addr)
+            return
+        if addr in self.transfers:
+            # Повтор RRQ, пока исходный ответ в пути: передача уже идет
+            return
+        task = self._loop.create_task(self._transfer(packet, addr))
+        self.transfers[addr] = task
+        task.add_done_callback(lambda _: self.transfers.pop(addr, None))
+
+    def _open(self, filename):
+        """Данные файла (bytes или memoryview); только разрешенные имена, без выхода за пределы папки."""
+        name = filename.replace("\\", "/").lstrip("/")
+        if self.allowed is not None and name not in self.allowed:
+            raise TftpError(ERR_NOT_FOUND, "File not found")
+        if self.store:
+            try:
+                return self.store.open_image(name)
+            except FirmwareStoreError as e:
+                self.logger.warning(f"⚠️ TFTP: {e}")
+                raise TftpError(ERR_NOT_FOUND, "File not found")
+        path = (self.root / name).resolve()
+        if self.root not in path.parents:
+            raise TftpError(ERR_ACCESS, "Access violation")
+        if not path.is_file():
+            raise TftpError(ERR_NOT_FOUND, "File not found")
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _negotiate(self, options, size):
+        """Принятые опции (для OACK) и параметры передачи."""
+        accepted = {}
+        blksize, windowsize, timeout = DEFAULT_BLKSIZE, 1, self.timeout
+        if "blksize" in options:
+            try:
+                requested = int(options["blksize"])
+            except ValueError:
+                raise TftpError(ERR_OPTION, "Bad blksize")
+            if requested < MIN_BLKSIZE:
+                raise TftpError(ERR_OPTION, "Bad blksize")
+            blksize = min(requested, MAX_BLKSIZE, self.max_blksize)
+            accepted["blksize"] = blksize
+        if "windowsize" in options:
+            try:
+                requested = int(options["windowsize"])
+            except ValueError:
+                raise TftpError(ERR_OPTION, "Bad windowsize")
+            if requested < 1:
+                raise TftpError(ERR_OPTION, "Bad windowsize")
+            windowsize = min(requested, MAX_WINDOWSIZE, self.max_windowsize)
+            accepted["windowsize"] = windowsize
+        if "tsize" in options:
+            accepted["tsize"] = size
+        if "timeout" in options:
+            try:
+                requested = int(options["timeout"])
+            except ValueError:
+                requested = 0
+            # Неподходящее значение игнорируем (RFC 2349): опция просто не подтверждается
+            if 1 <= requested <= 255:
+                timeout = requested
+                accepted["timeout"] = requested
+        return accepted, blksize, windowsize, timeout
+
+    async def _transfer(self, packet, addr):
+        transport, protocol = await self._loop.create_datagram_endpoint(
+            lambda: _TransferProtocol(addr), local_addr=(self.host, 0))
+        try:
+            try:
+                filename, mode, options = _parse_request(packet)
+                # Образы всегда двоичные: netascii отдается как есть
+                if mode not in ("octet", "netascii"):
+                    raise TftpError(ERR_ILLEGAL_OP, f"Unsupported mode {mode}")
+                data = self._open(filename)
+                accepted, blksize, windowsize, timeout = self._negotiate(options, len(data))
+            except TftpError as e:
+                self.logger.warning(f"⚠️ TFTP {addr[0]}: отказ ({e})")
+                transport.sendto(_error_packet(e.code, str(e)), addr)
+                return
+            except OSError as e:
+                self.logger.warning(f"⚠️ TFTP {addr[0]}: ошибка чтения файла ({e})")
+                transport.sendto(_error_packet(ERR_UNDEFINED, "Read error"), addr)
+                return
+
+            self.logger.info(f"📤 TFTP {addr[0]}: {filename} ({len(data)} байт, blksize {blksize}, windowsize {windowsize})")
+            started = time.monotonic()
+            sender = _WindowSender(transport, protocol, addr, data, blksize, windowsize, timeout, self.retries)
+            try:
+                if accepted:
+                    await sender.send_oack(accepted)
+                await sender.run()
+            except TftpError as e:
+                self.logger.warning(f"⚠️ TFTP {addr[0]}: передача {filename} прервана ({e})")
+                return
+            self._record_completed(addr, filename, len(data), blksize, windowsize,
+                                   time.monotonic() - started, sender.retransmits)
+        finally:
+            transport.close()
+
+    def _record_completed(self, addr, filename, size, blksize, windowsize, seconds, retransmits):
+        rate = size / seconds if seconds > 0 else 0
+        self.completed.append({"client": addr[0], "filename": filename, "bytes": size,
+                               "seconds": round(seconds, 3), "bytes_per_second": round(rate),
+                               "blksize": blksize, "windowsize": windowsize, "retransmits": retransmits})
+        self.logger.info(f"✅ TFTP {addr[0]}: {filename} передан за {seconds:.2f} с "
+                         f"({rate / 1024:.1f} КБ/с, повторов окна: {retransmits})")
+
+
+class _WindowSender:
+    """
+    Отправка данных окнами по RFC 7440: клиент подтверждает последний блок окна
+    (или последний блок, принятый по порядку) - отправка продолжается со следующего.
+    Номера блоков в пакетах - 16 бит с переходом через 0; внутри счет ведется без переполнения.
+    """
+    def __init__(self, transport, protocol, peer, data, blksize, windowsize, timeout, retries):
+        self.transport = transport
+        self.protocol = protocol
+        self.peer = peer
+        self.data = memoryview(data)
+        self.blksize = blksize
+        self.windowsize = windowsize
+        self.timeout = timeout
+        self.retries = retries
+        # Последний блок - короче blksize (пустой, если размер кратен blksize)
+        self.last_block = len(data) // blksize + 1
+        self.retransmits = 0
+
+    async def _wait_ack(self):
+        """Ждет ACK и возвращает номер блока (16 бит) или None по таймауту."""
+        try:
+            packet = await asyncio.wait_for(self.protocol.packets.get(), self.timeout)
+        except asyncio.TimeoutError:
+            return None
+        opcode = struct.unpack("!H", packet[:2])[0] if len(packet) >= 2 else 0
+        if opcode == OP_ERROR:
+            code, = struct.unpack("!H", packet[2:4]) if len(packet) >= 4 else (ERR_UNDEFINED,)
+            message = packet[4:].rstrip(b"\0").decode("ascii", "replace")
+            raise TftpError(code, f"клиент прислал ошибку: {message}")
+        if opcode != OP_ACK or len(packet) < 4:
+            return -1
+        return struct.unpack("!H", packet[2:4])[0]
+
+    async def send_oack(self, accepted):
+        """Отправляет OACK и ждет ACK блока 0."""
+        oack = struct.pack("!H", OP_OACK) + b"".join(
+            f"{name}\0{value}\0".encode("ascii") for name, value in accepted.items())
+        for _ in range(self.retries + 1):
+            self.transport.sendto(oack, self.peer)
+            while True:
+                block = await self._wait_ack()
+                if block is None:
+                    break
+                if block == 0:
+                    return
+        raise TftpError(ERR_UNDEFINED, "нет подтверждения OACK")
+
+    def _send_block(self, block):
+        start = (block - 1) * self.blksize
+        self.transport.sendto(struct.pack("!HH", OP_DATA, block & 0xFFFF) +
+                              self.data[start:start + self.blksize], self.peer)
+
+    async def run(self):
+        acked = 0   # Последний подтвержденный блок (без переполнения)
+        failures = 0
+        while acked < self.last_block:
+            window_end = min(acked + self.windowsize, self.last_block)
+            for block in range(acked + 1, window_end + 1):
+                self._send_block(block)
+            while True:
+                block = await self._wait_ack()
+                if block is None:
+                    failures += 1
+                    self.retransmits += 1
+                    if failures > self.retries:
+                        raise TftpError(ERR_UNDEFINED, "нет подтверждений от клиента")
+                    break
+                if block < 0:
+                    continue
+                # Восстанавливаем полный номер: подтверждение относится к текущему окну
+                advance = (block - acked) & 0xFFFF
+                if advance == 0 or acked + advance > window_end:
+                    # Дубликат старого ACK: ждем дальше, окно повторится по таймауту
+                    continue
+                acked += advance
+                failures = 0
+                break
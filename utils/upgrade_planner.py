@@ -0,0 +1,116 @@
+# utils/upgrade_planner.py
+"""
+План обновления прошивки: кратчайший по числу перезагрузок путь от текущей версии до целевой
+по графу допустимых переходов. Вершины - версии, ребро v -> образ есть, если образ новее v,
+не новее целевого и v попадает в его диапазон min_from..max_from (включительно).
+Образы модели (firmware_info.json, раздел firmware):
+    final_version, final_filename               - целевой образ;
+    intermediate_version, intermediate_filename - один промежуточный образ (прежний формат):
+                                                  ставится с любой версии, а целевой - только с него;
+    images - [{"version", "filename", "min_from", "max_from"}]: дополнительные образы и ограничения
+             (образ той же версии заменяет описанный ключами выше).
+"""
+from collections import deque
+
+from utils.versions import Version
+
+# Оценка длительности шага (сек), если в timeouts.json нет flash_estimate / reboot_estimate
+FLASH_ESTIMATE = 300
+REBOOT_ESTIMATE = 120
+
+
+class FirmwareImage:
+    """Образ прошивки и диапазон версий, с которых его можно ставить."""
+    def __init__(self, version, filename, min_from=None, max_from=None):
+        self.version = Version(version)
+        self.filename = filename
+        self.min_from = Version(min_from) if min_from else None
+        self.max_from = Version(max_from) if max_from else None
+
+    def accepts(self, current):
+        return ((self.min_from is None or current >= self.min_from) and
+                (self.max_from is None or current <= self.max_from))
+
+
+def image_files(firmware_cfg):
+    """(версия, имя файла) всех образов прошивки модели - для хранилища и TFTP-сервера."""
+    files = {}
+    for kind in ("intermediate", "final"):
+        if firmware_cfg.get(f"{kind}_version") and firmware_cfg.get(f"{kind}_filename"):
+            files[firmware_cfg[f"{kind}_version"]] = firmware_cfg[f"{kind}_filename"]
+    for image in firmware_cfg.get("images", []):
+        files[image["version"]] = image["filename"]
+    return list(files.items())
+
+
+def firmware_images(firmware_cfg):
+    """Образы прошивки модели (FirmwareImage) с ограничениями переходов."""
+    images = {}
+    intermediate = firmware_cfg.get("intermediate_version")
+    if intermediate and firmware_cfg.get("intermediate_filename"):
+        image = FirmwareImage(intermediate, firmware_cfg["intermediate_filename"])
+        images[image.version] = image
+    if firmware_cfg.get("final_version") and firmware_cfg.get("final_filename"):
+        image = FirmwareImage(firmware_cfg["final_version"], firmware_cfg["final_filename"],
+                              min_from=intermediate if intermediate else None)
+        images[image.version] = image
+    for entry in firmware_cfg.get("images", []):
+        image = FirmwareImage(entry["version"], entry["filename"], entry.get("min_from"), entry.get("max_from"))
+        images[image.version] = image
+    return list(images.values())
+
+
+class UpgradePlan:
+    """Шаги обновления (FirmwareImage по порядку); каждый шаг - загрузка и перезагрузка."""
+    def __init__(self, current, steps, flash_seconds=FLASH_ESTIMATE, reboot_seconds=REBOOT_ESTIMATE):
+        self.current = current
+        self.steps = steps
+        self.estimated_seconds = len(steps) * (flash_seconds + reboot_seconds)
+
+    @property
+    def reboots(self):
+        return len(self.steps)
+
+    def describe(self):
+        return " -> ".join([str(self.current)] + [str(step.version) for step in self.steps])
+
+    def to_dict(self):
+        return {"path": [str(self.current)] + [str(step.version) for step in self.steps],
+                "files": [step.filename for step in self.steps],
+                "reboots": self.reboots,
+                "estimated_seconds": self.estimated_seconds}
+
+
+def plan_upgrade(current, firmware_cfg, force=False, flash_seconds=FLASH_ESTIMATE, reboot_seconds=REBOOT_ESTIMATE):
+    """
+    План от версии current (Version) до final_version. Пустой план - обновление не требуется,
+    None - допустимого пути нет. force - перепрошить целевой образ, даже если версия не старее.
+    """
+    target = Version(firmware_cfg["final_version"])
+    images = firmware_images(firmware_cfg)
+
+    def plan(steps):
+        return UpgradePlan(current, steps, flash_seconds, reboot_seconds)
+
+    if current >= target:
+        final_image = next((image for image in images if image.version == target), None)
+        return plan([final_image] if force and final_image else [])
+
+    # Поиск в ширину: первый найденный путь - с наименьшим числом перезагрузок
+    previous = {current: None}
+    queue = deque([current])
+    while queue and target not in previous:
+        version = queue.popleft()
+        for image in images:
+            if image.version in previous or not (version < image.version <= target) or not image.accepts(version):
+                continue
+            previous[image.version] = (version, image)
+            queue.append(image.version)
+    if target not in previous:
+        return None
+
+    steps, version = [], target
+    while previous[version]:
+        version, image = previous[version]
+        steps.append(image)
+    return plan(steps[::-1])
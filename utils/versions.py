@@ -0,0 +1,60 @@
+# utils/versions.py
+"""
+Версии PROM и прошивок D-Link: '4.51.B018', '1.00.B010', '4.4.1.10.001', 'V2.00.005'.
+Строковое сравнение ошибается на разной длине компонентов ('4.9.B001' > '4.38.B000'),
+поэтому версия разбирается на компоненты: число и буквенный префикс/суффикс сборки.
+"""
+import functools
+import re
+
+# Префикс перед версией в выводе коммутатора и в именах: 'Build 4.51.B018', 'V1.00.B010'
+PREFIX = re.compile(r"^(?:build\s+)?v?", re.IGNORECASE)
+# Компонент версии: 'B018', '51', '10a'
+COMPONENT = re.compile(r"^([A-Za-z]*)(\d+)([A-Za-z]*)$")
+
+
+@functools.total_ordering
+class Version:
+    """Версия с покомпонентным сравнением. Незначащие нули в конце не учитываются: 4.4.1 == 4.4.1.0."""
+    def __init__(self, text):
+        self.text = str(text).strip()
+        body = PREFIX.sub("", self.text)
+        key = []
+        for part in body.split(".") if body else []:
+            match = COMPONENT.match(part)
+            if not match:
+                raise ValueError(f"Неизвестный формат версии: {text!r}")
+            prefix, number, suffix = match.groups()
+            key.append((int(number), prefix.upper(), suffix.upper()))
+        if not key:
+            raise ValueError(f"Неизвестный формат версии: {text!r}")
+        while len(key) > 1 and key[-1] == (0, "", ""):
+            key.pop()
+        self.key = tuple(key)
+
+    def __eq__(self, other):
+        return isinstance(other, Version) and self.key == other.key
+
+    def __lt__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.key < other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"Version({self.text!r})"
+
+
+def parse_version(text):
+    """Version или None (нет значения или формат не распознан)."""
+    if not text:
+        return None
+    try:
+        return Version(text)
+    except ValueError:
+        return None
@@ -0,0 +1,424 @@
+# utils/zmodem.py
+"""
+Передача файла по ZModem (отправитель) без привязки к вводу-выводу.
+Движок только формирует кадры и разбирает ответы приемника; чтение и запись порта
+выполняет сценарий BootMenuHandler (синхронно или асинхронно, см. handlers/flow.py).
+
+Поддерживаются заголовки HEX/BIN16/BIN32, подпакеты данных с CRC-32 (CRC-16, если приемник
+не умеет CRC-32), потоковая передача с окном (ZCRCQ/ZACK), буфер приемника (ZCRCW)
+и продолжение передачи с позиции, которую назначает приемник (ZRPOS, ZCRESUM).
+"""
+import binascii
+import re
+import struct
+import zlib
+
+ZPAD = 0x2a         # '*'
+ZDLE = 0x18         # Ctrl+X: префикс экранирования
+ZBIN = 0x41         # 'A': двоичный заголовок с CRC-16
+ZHEX = 0x42         # 'B': HEX-заголовок
+ZBIN32 = 0x43       # 'C': двоичный заголовок с CRC-32
+XON = 0x11
+
+# Типы кадров
+ZRQINIT, ZRINIT, ZSINIT, ZACK, ZFILE, ZSKIP, ZNAK, ZABORT, ZFIN, ZRPOS, ZDATA, ZEOF, ZFERR, ZCRC = range(14)
+ZCHALLENGE, ZCOMPL, ZCAN, ZFREECNT, ZCOMMAND = range(14, 19)
+
+# Окончания подпакетов данных
+ZCRCE = 0x68        # конец кадра, дальше заголовок
+ZCRCG = 0x69        # кадр продолжается без подтверждения
+ZCRCQ = 0x6a        # кадр продолжается, ожидается ZACK
+ZCRCW = 0x6b        # конец кадра, ожидается ZACK
+ZRUB0 = 0x6c        # экранированный 0x7f
+ZRUB1 = 0x6d        # экранированный 0xff
+FRAME_ENDS = (ZCRCE, ZCRCG, ZCRCQ, ZCRCW)
+
+# Возможности приемника (ZF0 в ZRINIT)
+CANFDX = 0x01       # полный дуплекс
+CANOVIO = 0x02      # прием во время записи на диск/флеш
+CANFC32 = 0x20      # CRC-32
+ESCCTL = 0x40       # экранировать все управляющие символы
+
+# Режим передачи файла (ZF0 в ZFILE)
+ZCBIN = 1
+ZCRESUM = 3         # продолжить прерванную передачу
+
+SUBPACKET_SIZE = 1024
+# Окно потоковой передачи: сколько байт может быть отправлено без ZACK
+DEFAULT_WINDOW = 32 * 1024
+# Подпакетов за один вызов next_chunk(): между порциями обработчик читает ответы приемника
+PACKETS_PER_CHUNK = 8
+DEFAULT_RETRIES = 10
+# Отмена передачи: 8 CAN и 8 Backspace (как в lrzsz)
+CANCEL_SEQUENCE = bytes([ZDLE] * 8 + [0x08] * 8)
+
+_ESCAPE = re.compile(rb"[\x10\x11\x13\x18\x90\x91\x93]|(?<=@)[\r\x8d]")
+_ESCAPE_CTL = re.compile(rb"[\x00-\x1f\x80-\x9f]")
+_HEADER_LENGTH = {ZBIN: 7, ZBIN32: 9}
+
+
+class ZmodemError(Exception):
+    pass
+
+
+def _escape_match(m):
+    return bytes((ZDLE, m.group()[0] ^ 0x40))
+
+
+def escape(data, escape_ctl=False):
+    """Экранирует ZDLE, XON/XOFF (и все управляющие символы при escape_ctl)."""
+    return (_ESCAPE_CTL if escape_ctl else _ESCAPE).sub(_escape_match, data)
+
+
+def _arg(f0=0, f1=0, f2=0, f3=0):
+    """Аргумент заголовка из флагов: ZF0 - старший байт (четвертый байт заголовка)."""
+    return f3 | f2 << 8 | f1 << 16 | f0 << 24
+
+
+def hex_header(frame_type, arg=0):
+    body = struct.pack("<BI", frame_type, arg)
+    crc = struct.pack(">H", binascii.crc_hqx(body, 0))
+    header = b"**\x18B" + (body + crc).hex().encode() + b"\r\x8a"
+    if frame_type not in (ZACK, ZFIN):
+        header += bytes((XON,))
+    return header
+
+
+def binary_header(frame_type, arg=0, crc32=True, escape_ctl=False):
+    body = struct.pack("<BI", frame_type, arg)
+    if crc32:
+        return bytes((ZPAD, ZDLE, ZBIN32)) + escape(body + struct.pack("<I", zlib.crc32(body)), escape_ctl)
+    return bytes((ZPAD, ZDLE, ZBIN)) + escape(body + struct.pack(">H", binascii.crc_hqx(body, 0)), escape_ctl)
+
+
+def data_subpacket(data, frame_end, crc32=True, escape_ctl=False):
+    if crc32:
+        crc = struct.pack("<I", zlib.crc32(bytes((frame_end,)), zlib.crc32(data)))
+    else:
+        crc = struct.pack(">H", binascii.crc_hqx(bytes((frame_end,)), binascii.crc_hqx(data, 0)))
+    packet = escape(data, escape_ctl) + bytes((ZDLE, frame_end)) + escape(crc, escape_ctl)
+    if frame_end == ZCRCW:
+        packet += bytes((XON,))
+    return packet
+
+
+def _unescape(buffer, pos, count):
+    """
+    Читает count байт с экранированием начиная с pos.
+    Возвращает (байты, позиция после них) или (None, None), если данных не хватает.
+    """
+    out = bytearray()
+    while len(out) < count:
+        if pos >= len(buffer):
+            return None, None
+        byte = buffer[pos]
+        if byte != ZDLE:
+            out.append(byte)
+            pos += 1
+            continue
+        if pos + 1 >= len(buffer):
+            return None, None
+        out.append(_unescaped(buffer[pos + 1]))
+        pos += 2
+    return bytes(out), pos
+
+
+def _unescaped(byte):
+    if byte == ZRUB0:
+        return 0x7f
+    if byte == ZRUB1:
+        return 0xff
+    return byte ^ 0x40
+
+
+def parse_header(buffer, pos):
+    """
+    Разбирает заголовок, начинающийся с ZDLE в позиции pos (после ZPAD).
+    Возвращает ((тип, аргумент) или None при ошибке CRC, позиция после заголовка)
+    или (None, None), если заголовок еще не получен целиком.
+    """
+    if pos + 1 >= len(buffer):
+        return None, None
+    kind = buffer[pos + 1]
+    if kind == ZHEX:
+        end = pos + 2 + 14
+        if end > len(buffer):
+            return None, None
+        try:
+            raw = bytes.fromhex(bytes(buffer[pos + 2:end]).decode("ascii"))
+        except ValueError:
+            return None, pos + 2
+        body, crc = raw[:5], raw[5:]
+        if binascii.crc_hqx(body, 0) != struct.unpack(">H", crc)[0]:
+            return None, end
+        return struct.unpack("<BI", body), end
+    if kind in _HEADER_LENGTH:
+        raw, end = _unescape(buffer, pos + 2, _HEADER_LENGTH[kind])
+        if raw is None:
+            return None, None
+        body = raw[:5]
+        if kind == ZBIN32:
+            valid = zlib.crc32(body) == struct.unpack("<I", raw[5:])[0]
+        else:
+            valid = binascii.crc_hqx(body, 0) == struct.unpack(">H", raw[5:])[0]
+        return (struct.unpack("<BI", body) if valid else None), end
+    # Не заголовок: ZDLE внутри обычного вывода
+    return None, pos + 1
+
+
+def read_subpacket(buffer, pos, crc32=True):
+    """
+    Разбирает подпакет данных с позиции pos.
+    Возвращает (данные или None при ошибке CRC, окончание ZCRCx, позиция после подпакета)
+    или (None, None, None), если подпакет еще не получен целиком.
+    """
+    out = bytearray()
+    while True:
+        zdle = buffer.find(ZDLE, pos)
+        if zdle < 0 or zdle + 1 >= len(buffer):
+            return None, None, None
+        out += buffer[pos:zdle]
+        escaped = buffer[zdle + 1]
+        pos = zdle + 2
+        if escaped in FRAME_ENDS:
+            break
+        out.append(_unescaped(escaped))
+    frame_end = escaped
+    crc, pos = _unescape(buffer, pos, 4 if crc32 else 2)
+    if crc is None:
+        return None, None, None
+    if crc32:
+        valid = zlib.crc32(bytes((frame_end,)), zlib.crc32(out)) == struct.unpack("<I", crc)[0]
+    else:
+        valid = binascii.crc_hqx(bytes((frame_end,)), binascii.crc_hqx(bytes(out), 0)) == struct.unpack(">H", crc)[0]
+    return (bytes(out) if valid else None), frame_end, pos
+
+
+class HeaderReader:
+    """Выделяет заголовки из потока приемника. Прочие байты (вывод загрузчика) пропускаются."""
+    def __init__(self):
+        self._buffer = bytearray()
+        self.bad_headers = 0
+
+    def feed(self, data):
+        """Возвращает список заголовков (тип, аргумент), полученных целиком."""
+        self._buffer += data
+        if bytes((ZDLE,)) * 5 in self._buffer:
+            self._buffer.clear()
+            raise ZmodemError("Передача отменена приемником (CAN)")
+        headers = []
+        while True:
+            start = self._buffer.find(bytes((ZPAD, ZDLE)))
+            if start < 0:
+                # Оставляем ZPAD на конце: ZDLE может прийти следующей порцией
+                del self._buffer[:-1]
+                break
+            header, end = parse_header(self._buffer, start + 1)
+            if end is None:
+                del self._buffer[:start]
+                break
+            if header:
+                headers.append(header)
+            elif self._buffer[start + 2] in (ZHEX, ZBIN, ZBIN32):
+                self.bad_headers += 1
+            del self._buffer[:end]
+        return headers
+
+
+class ZmodemSender:
+    """
+    Отправитель одного файла.
+
+        sender = ZmodemSender(data, "image.had")
+        порт.write(sender.start())
+        while not sender.done:
+            порт.write(sender.next_chunk())    # b"" - ждем ответа приемника
+            sender.feed(принятые байты)        # или sender.on_timeout(), если приемник молчит
+        порт.write(sender.next_chunk())        # завершающее "OO"
+
+    data - bytes или memoryview (например, mmap образа из FirmwareStore).
+    resume - просить приемник продолжить прерванную передачу (ZCRESUM).
+    """
+    def __init__(self, data, filename, mtime=0, window=DEFAULT_WINDOW, subpacket_size=SUBPACKET_SIZE,
+                 max_retries=DEFAULT_RETRIES, resume=True):
+        self.data = data
+        self.size = len(data)
+        self.filename = filename
+        self.mtime = int(mtime)
+        self.window = window
+        self.subpacket_size = subpacket_size
+        self.max_retries = max_retries
+        self.resume = resume
+
+        self.state = "INIT"
+        self.pos = 0            # Позиция следующего подпакета
+        self.acked = 0          # Последняя позиция, подтвержденная приемником
+        self.start_pos = 0      # С какой позиции приемник начал прием (продолжение)
+        self.repositions = 0    # Сколько раз приемник вернул передачу назад (ZRPOS)
+        self.skipped = False
+        self.retries = 0
+
+        # Возможности приемника из ZRINIT
+        self.crc32 = False
+        self.escape_ctl = False
+        self.rx_buflen = 0
+        self.stop_and_wait = False
+
+        self._reader = HeaderReader()
+        self._pending = bytearray()
+        self._last_frame = b""
+        self._last_rpos = None
+
+    @property
+    def done(self):
+        return self.state == "DONE"
+
+    @property
+    def transferred(self):
+        """Байт передано в этом сеансе (без части, которую приемник уже имел)."""
+        return max(self.acked, self.pos) - self.start_pos
+
+    def start(self):
+        self._frame(hex_header(ZRQINIT))
+        return self.next_chunk()
+
+    def abort(self):
+        """Последовательность отмены передачи для приемника."""
+        self.state = "DONE"
+        return CANCEL_SEQUENCE
+
+    def next_chunk(self):
+        """Следующая порция для отправки (b"" - ждать ответа приемника)."""
+        out = bytes(self._pending)
+        self._pending.clear()
+        if self.state == "DATA":
+            out += self._data_packets()
+        return out
+
+    def feed(self, data):
+        for frame_type, arg in self._reader.feed(data):
+            self._on_header(frame_type, arg)
+
+    def on_timeout(self):
+        """Приемник молчит: повтор последнего кадра или возврат к подтвержденной позиции."""
+        self.retries += 1
+        if self.retries > self.max_retries:
+            raise ZmodemError(f"Нет ответа приемника (состояние {self.state}, позиция {self.acked})")
+        if self.state in ("DATA", "WAIT_ACK"):
+            self._reposition(self.acked)
+        else:
+            self._pending += self._last_frame
+
+    # --- Кадры ---
+
+    def _frame(self, data):
+        """Запоминает кадр для повтора по ZNAK/таймауту и ставит его в очередь."""
+        self._last_frame = data
+        self._pending += data
+
+    def _binary_header(self, frame_type, arg=0):
+        return binary_header(frame_type, arg, self.crc32, self.escape_ctl)
+
+    def _file_frame(self):
+        info = f"{self.filename}\0{self.size} {self.mtime:o} 0 0 1 {self.size}\0".encode()
+        flags = _arg(f0=ZCRESUM if self.resume else ZCBIN)
+        return self._binary_header(ZFILE, flags) + data_subpacket(info, ZCRCW, self.crc32, self.escape_ctl)
+
+    def _data_packets(self):
+        parts = []
+        for _ in range(PACKETS_PER_CHUNK):
+            if self.pos >= self.size:
+                self.state = "EOF"
+                self._last_frame = self._binary_header(ZEOF, self.size)
+                parts.append(self._last_frame)
+                break
+            if self.window and not self.rx_buflen and self.pos - self.acked >= self.window:
+                break
+            end = min(self.pos + self.subpacket_size, self.size)
+            frame_end = self._frame_end(end)
+            parts.append(data_subpacket(self.data[self.pos:end], frame_end, self.crc32, self.escape_ctl))
+            self.pos = end
+            if frame_end == ZCRCW:
+                self.state = "WAIT_ACK"
+                break
+        return b"".join(parts)
+
+    def _frame_end(self, end):
+        if end >= self.size:
+            return ZCRCE
+        if self.stop_and_wait:
+            return ZCRCW
+        if self.rx_buflen and end - self.acked + self.subpacket_size > self.rx_buflen:
+            return ZCRCW
+        ack_every = max(self.window // 4, self.subpacket_size)
+        if self.window and end // ack_every > self.pos // ack_every:
+            return ZCRCQ
+        return ZCRCG
+
+    def _reposition(self, pos):
+        self.pos = self.acked = min(pos, self.size)
+        self.state = "DATA"
+        self._pending += self._binary_header(ZDATA, self.pos)
+
+    # --- Ответы приемника ---
+
+    def _on_header(self, frame_type, arg):
+        if frame_type == ZRINIT:
+            self._on_rinit(arg)
+        elif frame_type == ZRPOS:
+            self._on_rpos(arg)
+        elif frame_type == ZACK:
+            self._on_ack(arg)
+        elif frame_type == ZSKIP and self.state == "FILE":
+            self.skipped = True
+            self.state = "FIN"
+            self._frame(hex_header(ZFIN))
+        elif frame_type == ZCRC and self.state == "FILE":
+            self._pending += hex_header(ZCRC, zlib.crc32(self.data))
+        elif frame_type == ZNAK:
+            self._pending += self._last_frame
+        elif frame_type == ZFIN and self.state == "FIN":
+            self.state = "DONE"
+            self._pending += b"OO"
+        elif frame_type in (ZABORT, ZFERR, ZCAN):
+            raise ZmodemError(f"Приемник прервал передачу (кадр {frame_type})")
+
+    def _on_rinit(self, arg):
+        # Повторный ZRINIT после ZFILE (ответ на наш ZRQINIT) не повторяет ZFILE: иначе
+        # второй ZRPOS(0) вернет уже начатую передачу. Потерянный ZFILE повторит таймаут.
+        if self.state == "INIT":
+            flags = arg >> 24
+            self.crc32 = bool(flags & CANFC32)
+            self.escape_ctl = bool(flags & ESCCTL)
+            self.stop_and_wait = not (flags & CANFDX and flags & CANOVIO)
+            self.rx_buflen = arg & 0xffff
+            self.state = "FILE"
+            self._frame(self._file_frame())
+        elif self.state == "EOF":
+            self.retries = 0
+            self.state = "FIN"
+            self._frame(hex_header(ZFIN))
+
+    def _on_rpos(self, pos):
+        if self.state == "FILE":
+            self.start_pos = min(pos, self.size)
+            self.retries = 0
+            self._reposition(pos)
+        elif self.state in ("DATA", "WAIT_ACK", "EOF"):
+            self.repositions += 1
+            if pos == self._last_rpos:
+                self.retries += 1
+                if self.retries > self.max_retries:
+                    raise ZmodemError(f"Приемник повторно не принимает данные с позиции {pos}")
+            self._last_rpos = pos
+            self._reposition(pos)
+
+    def _on_ack(self, pos):
+        if self.state not in ("DATA", "WAIT_ACK") or pos > self.pos:
+            return
+        if pos > self.acked:
+            self.acked = pos
+            self.retries = 0
+        if self.state == "WAIT_ACK" and pos == self.pos:
+            # ZCRCW завершил кадр: данные продолжаются с новым заголовком ZDATA
+            self._reposition(self.pos)